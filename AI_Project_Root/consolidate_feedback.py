@@ -20,7 +20,7 @@ def fetch_new_feedback():
                 # This assumes you have added a boolean 'processed' column
                 # to your 'training_feedback' table.
                 cursor.execute(
-                    "SELECT id, raw_value, human_correction, ml_prediction FROM training_feedback WHERE human_correction IS NOT NULL AND (processed IS NULL OR processed = false)"
+                    "SELECT id, raw_value, human_correction, ml_prediction FROM training_feedback WHERE human_correction IS NOT NULL AND feedback_type = 'color' AND (processed IS NULL OR processed = false)"
                 )
                 feedback = cursor.fetchall()
 
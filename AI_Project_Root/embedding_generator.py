@@ -1,6 +1,17 @@
 
+import argparse
+import os
+
+import numpy as np
 import psycopg2
-from sentence_transformers import SentenceTransformer
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # only needed for the sentence-transformers backend
+    SentenceTransformer = None
+
+from src.embeddings.backfill import DEFAULT_PAGE_SIZE, BackfillCheckpoint, run_backfill
+from src.embeddings.cache import load_cache
 
 # --- Placeholders ---
 DB_HOST = "your-db-host"
@@ -8,83 +19,142 @@ DB_NAME = "your-db-name"
 DB_USER = "your-db-user"
 DB_PASSWORD = "your-db-password"
 
-# Load a pre-trained sentence transformer model (or a placeholder)
-# In a real scenario, you would use a more powerful model.
-# model = SentenceTransformer('all-MiniLM-L6-v2')
+# Backend selection: "placeholder" (dummy vectors) or "sentence-transformers" (local CPU model).
+# Note: all-MiniLM-L6-v2 produces 384-dim vectors; the VECTOR column dimension must match.
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "placeholder")
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_DIM = 1536  # Dimension of the placeholder vectors
+DEFAULT_BATCH_SIZE = 64
+
+
+class PlaceholderBackend:
+    """Returns a constant dummy vector for every text."""
+    name = "placeholder"
+
+    def __init__(self, dimension=EMBEDDING_DIM):
+        self.dimension = dimension
+
+    def encode(self, texts, batch_size=DEFAULT_BATCH_SIZE):
+        return np.full((len(texts), self.dimension), 0.1, dtype=np.float32)
+
+
+class SentenceTransformerBackend:
+    """Local CPU sentence-transformers model."""
+
+    def __init__(self, model_name=EMBEDDING_MODEL, device="cpu"):
+        if SentenceTransformer is None:
+            raise ImportError("sentence-transformers is not installed; pip install sentence-transformers")
+        self.name = model_name
+        self.model = SentenceTransformer(model_name, device=device)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts, batch_size=DEFAULT_BATCH_SIZE):
+        return self.model.encode(
+            list(texts),
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        ).astype(np.float32, copy=False)
+
+
+def load_backend(name=EMBEDDING_BACKEND):
+    """Creates the embedding backend for the given name."""
+    if name == "placeholder":
+        return PlaceholderBackend()
+    if name in ("sentence-transformers", "sentence_transformers"):
+        return SentenceTransformerBackend()
+    raise ValueError(f"Unknown embedding backend: {name}")
+
 
 class EmbeddingGenerator:
-    def __init__(self):
-        # In a real application, you would load the model here.
-        # self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        print("EmbeddingGenerator initialized (using placeholder model).")
+    def __init__(self, backend=None, cache=None):
+        self.backend = backend or load_backend()
+        # The persistent cache (keyed by model name + text) is opened automatically for
+        # real models; pass cache=False to disable it or an EmbeddingCache to share one.
+        if cache is None:
+            cache = load_cache(self.backend.name) if self.backend.name != "placeholder" else False
+        self.cache = cache or None
+        print(f"EmbeddingGenerator initialized (using {self.backend.name} model).")
+
+    @property
+    def dimension(self):
+        return self.backend.dimension
 
     def generate_embedding(self, text):
         """
         Generates a vector embedding for the given text.
-        (Placeholder implementation)
         """
-        # return self.model.encode(text)
-        # For this example, we'll return a dummy vector.
-        return [0.1] * 1536 # Assuming a 1536-dimension vector
-
-def update_product_embedding(product_id, embedding):
-    """
-    Updates the embedding for a given product in the database.
-    """
-    try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD
-        )
-        cursor = conn.cursor()
-
-        cursor.execute(
-            "UPDATE products SET embedding = %s WHERE id = %s",
-            (embedding, product_id)
-        )
-
-        conn.commit()
-        cursor.close()
-        conn.close()
-        print(f"Successfully updated embedding for product {product_id}")
+        return self.generate_embeddings([text])[0]
 
-    except psycopg2.Error as e:
-        print(f"Database error: {e}")
+    def generate_embeddings(self, texts, batch_size=DEFAULT_BATCH_SIZE, dedupe=True,
+                            sort_by_length=True, as_numpy=False):
+        """
+        Generates embeddings for a list of texts in batches.
 
-def process_new_products():
+        Identical texts are encoded once, texts already in the embedding cache are
+        not encoded at all, and the rest are batched in order of length so each
+        batch pads to a similar size. Results come back in input order, as lists
+        of floats (or an (n, dim) float32 array with `as_numpy`).
+        """
+        texts = ["" if t is None else str(t) for t in texts]
+        unique = list(dict.fromkeys(texts)) if dedupe else texts
+
+        vectors = np.empty((len(unique), self.dimension), dtype=np.float32)
+        cached = self.cache.get_many(unique) if self.cache and unique else {}
+        missing = []
+        for i, text in enumerate(unique):
+            if text in cached:
+                vectors[i] = cached[text]
+            else:
+                missing.append(i)
+
+        order = sorted(missing, key=lambda i: len(unique[i])) if sort_by_length else missing
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            vectors[idx] = self.backend.encode([unique[i] for i in idx], batch_size=batch_size)
+        if self.cache and missing:
+            self.cache.put_many([unique[i] for i in missing], vectors[missing])
+
+        if dedupe:
+            position = {text: i for i, text in enumerate(unique)}
+            vectors = vectors[[position[t] for t in texts]] if texts else vectors
+        return vectors if as_numpy else vectors.tolist()
+
+def get_connection():
+    """Establishes and returns a database connection."""
+    return psycopg2.connect(
+        host=DB_HOST,
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD
+    )
+
+def backfill_embeddings(page_size=DEFAULT_PAGE_SIZE, restart=False, limit=None):
     """
-    Fetches new products, generates embeddings, and updates the database.
+    Generates embeddings for all products that don't have one yet, page by page.
     """
+    read_conn = write_conn = None
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD
-        )
-        cursor = conn.cursor()
-
-        # Fetch products that need an embedding
-        cursor.execute("SELECT id, product_name FROM products WHERE embedding IS NULL")
-        products_to_process = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-
-        if products_to_process:
-            generator = EmbeddingGenerator()
-            for product_id, product_name in products_to_process:
-                print(f"Generating embedding for product: {product_name}")
-                embedding = generator.generate_embedding(product_name)
-                update_product_embedding(product_id, embedding)
-
+        read_conn, write_conn = get_connection(), get_connection()
+        generator = EmbeddingGenerator()
+        checkpoint = BackfillCheckpoint(generator.backend.name)
+        return run_backfill(read_conn, write_conn, generator, page_size=page_size,
+                            checkpoint=checkpoint, restart=restart, limit=limit)
     except psycopg2.Error as e:
         print(f"Database error: {e}")
+    finally:
+        for conn in (read_conn, write_conn):
+            if conn is not None:
+                conn.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill missing product embeddings")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first id")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many products")
+    args = parser.parse_args()
+
     print("Starting embedding generation process...")
-    process_new_products()
+    backfill_embeddings(args.page_size, args.restart, args.limit)
     print("Embedding generation process finished.")
-
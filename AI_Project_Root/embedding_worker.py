@@ -0,0 +1,66 @@
+"""embedding_worker.py
+
+Runs a pool of embedding workers against the `embedding_jobs` queue
+(migrations/007, src/embeddings/jobs.py). Start it on as many machines as
+needed; workers never claim the same job twice.
+
+Usage (from AI_Project_Root, with DATABASE_URL set):
+  python embedding_worker.py --enqueue-missing
+  python embedding_worker.py --processes 4 --drain
+  python embedding_worker.py --status
+  python embedding_worker.py --processes 4 --drain --ensure-index
+"""
+import argparse
+import os
+
+import psycopg2
+
+from embedding_generator import EmbeddingGenerator
+from src.core.vector_db_manager import KINDS, ensure_vector_index
+from src.embeddings.jobs import (DEFAULT_CLAIM_SIZE, DEFAULT_LEASE_SECONDS, DEFAULT_POLL_INTERVAL,
+                                 EmbeddingJobQueue, run_workers)
+
+DB_DSN = os.environ.get("DATABASE_URL")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding job queue workers")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--claim-size", type=int, default=DEFAULT_CLAIM_SIZE, help="Jobs claimed per batch")
+    parser.add_argument("--lease", type=int, default=DEFAULT_LEASE_SECONDS, help="Lease length in seconds")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL)
+    parser.add_argument("--drain", action="store_true", help="Exit once no job is ready instead of polling")
+    parser.add_argument("--enqueue-missing", action="store_true", help="Enqueue all products without embeddings")
+    parser.add_argument("--status", action="store_true", help="Print job counts by status and exit")
+    parser.add_argument("--ensure-index", action="store_true",
+                        help="Create or rebuild the pgvector indexes afterwards if the data has grown")
+    args = parser.parse_args()
+
+    if not DB_DSN:
+        print("Please set DATABASE_URL")
+        return
+
+    if args.enqueue_missing or args.status:
+        try:
+            with psycopg2.connect(DB_DSN) as conn:
+                queue = EmbeddingJobQueue(conn)
+                if args.enqueue_missing:
+                    print(f"Enqueued {queue.enqueue_missing()} embedding jobs")
+                if args.status:
+                    for status, count in sorted(queue.counts().items()):
+                        print(f"{status:<12} {count}")
+        except psycopg2.Error as e:
+            print(f"Database error: {e}")
+        return
+
+    run_workers(DB_DSN, EmbeddingGenerator, processes=args.processes, claim_size=args.claim_size,
+                lease_seconds=args.lease, poll_interval=args.poll_interval, drain=args.drain)
+
+    if args.ensure_index:
+        with psycopg2.connect(DB_DSN) as conn:
+            for kind in KINDS:
+                ensure_vector_index(conn, kind)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""ann_recall.py
+
+Recall@k and query latency of the in-process IVF-flat index
+(src/embeddings/ann.py) against exact brute-force search, for a range of
+nprobe values. Runs on product_embeddings or on synthetic clustered vectors.
+
+Usage (from AI_Project_Root):
+  python -m src.benchmarks.ann_recall --n 100000 --dim 384
+  python -m src.benchmarks.ann_recall --from-db --kind chunk
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from src.embeddings.ann import IVFFlatIndex, exact_search, load_product_embeddings
+
+
+def synthetic_vectors(n, dim, clusters=None, noise=1.0, seed=0):
+    """Clustered vectors, closer to real embedding distributions than uniform noise."""
+    rng = np.random.default_rng(seed)
+    # Many more clusters than IVF lists, so lists cut across clusters as they do on real data
+    clusters = clusters or max(256, n // 20)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + noise * rng.normal(size=(n, dim)).astype(np.float32)
+    return [f"p{i}" for i in range(n)], vectors
+
+
+def unit(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def recall_at_k(approx_ids, exact_ids):
+    k = exact_ids.shape[1]
+    return float(np.mean([len(set(a) & set(e)) / k for a, e in zip(approx_ids, exact_ids)]))
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IVF-flat recall/latency benchmark")
+    parser.add_argument("--from-db", action="store_true", help="Use product_embeddings instead of synthetic data")
+    parser.add_argument("--kind", default="product", choices=("product", "chunk"))
+    parser.add_argument("--n", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    if args.from_db:
+        from src.core.vector_db_manager import get_db_connection
+        conn = get_db_connection()
+        if conn is None:
+            return
+        try:
+            ids, vectors = load_product_embeddings(conn, args.kind)
+        finally:
+            conn.close()
+    else:
+        ids, vectors = synthetic_vectors(args.n, args.dim)
+    if not len(ids):
+        print("No vectors to index.")
+        return
+
+    index, build_s = timed(lambda: IVFFlatIndex(vectors.shape[1]).build(ids, vectors, nlist=args.nlist))
+    rng = np.random.default_rng(1)
+    sample = rng.choice(len(ids), min(args.queries, len(ids)), replace=False)
+    # Perturbed copies of indexed vectors, so queries are near but not on the data
+    queries = unit(unit(vectors[sample]) + 0.05 * rng.normal(size=(len(sample), vectors.shape[1])).astype(np.float32))
+    normalized = unit(vectors)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = index.save(tmp)
+        disk_mb = sum(f.stat().st_size for f in path.iterdir()) / 1e6
+        loaded, load_s = timed(lambda: IVFFlatIndex.load(tmp))
+        print(f"{len(index)} vectors x {vectors.shape[1]} dims, {index.nlist} lists: build {build_s:.2f}s, "
+              f"{disk_mb:.1f} MB on disk, mmap load {load_s * 1000:.1f}ms")
+
+        (exact_ids, _), exact_s = timed(lambda: exact_search(normalized, np.asarray(ids), queries, args.k))
+        nq = len(queries)
+        print(f"{'exact':>8} recall@{args.k} 1.000 {exact_s * 1000 / nq:8.3f} ms/query {nq / exact_s:10.0f} q/s")
+        for nprobe in args.nprobe:
+            (approx_ids, _), search_s = timed(lambda: loaded.search(queries, args.k, nprobe))
+            print(f"nprobe {nprobe:>2} recall@{args.k} {recall_at_k(approx_ids, exact_ids):.3f} "
+                  f"{search_s * 1000 / nq:8.3f} ms/query {nq / search_s:10.0f} q/s")
+        del loaded
+
+
+if __name__ == "__main__":
+    main()
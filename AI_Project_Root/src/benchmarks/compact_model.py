@@ -0,0 +1,88 @@
+"""compact_model.py
+
+Compares the joblib optimizer artifacts with the compact export
+(src/optimizer/compact.py): size on disk, cold load time (fresh interpreter:
+imports + load + first prediction) and prediction parity on
+optimizer_training.csv.
+
+Uses models/optimizer/ if it has artifacts, otherwise a temporary model
+fitted on the CSV.
+
+Usage (from AI_Project_Root):
+  python -m src.benchmarks.compact_model
+  python -m src.benchmarks.compact_model --prune 1e-2
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from src.benchmarks.tag_predictor_throughput import ARTIFACTS, fit_temporary_model, load_rows
+from src.core import config
+from src.optimizer.compact import PRUNE_TOLERANCE, CompactTagPredictor, export_compact
+from src.optimizer.predictor import MODEL_DIR, TagPredictor
+
+_COLD_LOAD = """
+import time
+start = time.perf_counter()
+from src.optimizer.{module} import {cls}
+{cls}({path!r}).predict('warm up')
+print(time.perf_counter() - start)
+"""
+
+
+def cold_load_seconds(module, cls, path, runs=3):
+    """Best of `runs` fresh-interpreter timings of import + load + one prediction."""
+    code = _COLD_LOAD.format(module=module, cls=cls, path=str(path))
+    timings = [float(subprocess.check_output([sys.executable, "-c", code], cwd=config.PROJECT_ROOT, text=True))
+               for _ in range(runs)]
+    return min(timings)
+
+
+def dir_size(paths):
+    return sum(Path(p).stat().st_size for p in paths)
+
+
+def run(model_dir, texts, prune):
+    with tempfile.TemporaryDirectory() as tmp:
+        summary = export_compact(model_dir, tmp, prune)
+        joblib_bytes = dir_size(Path(model_dir) / name for name in ARTIFACTS)
+        print(f"{'format':<8} {'size MB':>8} {'cold load s':>12}")
+        print(f"{'joblib':<8} {joblib_bytes / 1e6:8.2f} {cold_load_seconds('predictor', 'TagPredictor', model_dir):12.3f}")
+        print(f"{'compact':<8} {summary['bytes'] / 1e6:8.2f} "
+              f"{cold_load_seconds('compact', 'CompactTagPredictor', tmp):12.3f}")
+        print(f"kept {summary['coefficients_kept']} of {summary['coefficients_total']} coefficients "
+              f"(prune tolerance {prune:g})")
+
+        reference = TagPredictor(model_dir)
+        compact = CompactTagPredictor(tmp)
+        expected = reference.proba_matrix(texts)
+        actual = compact.proba_matrix(texts)
+        mismatches = sum(set(a) != set(b) for a, b in zip(reference.predict_many(texts), compact.predict_many(texts)))
+        print(f"parity on {len(texts)} texts: max |proba diff| {np.max(np.abs(expected - actual)):.2e}, "
+              f"label sets differing {mismatches}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact optimizer model: size, load time, parity")
+    parser.add_argument("--data", default=str(config.PROCESSED_DATA_DIR / "optimizer_training.csv"))
+    parser.add_argument("--model-dir", default=str(MODEL_DIR))
+    parser.add_argument("--prune", type=float, default=PRUNE_TOLERANCE)
+    args = parser.parse_args()
+
+    rows = load_rows(args.data)
+    texts = [text for text, _ in rows]
+    if all((Path(args.model_dir) / name).exists() for name in ARTIFACTS):
+        run(args.model_dir, texts, args.prune)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"No artifacts in {args.model_dir}; fitting a temporary model on {len(rows)} rows")
+        fit_temporary_model(rows, tmp)
+        run(tmp, texts, args.prune)
+
+
+if __name__ == "__main__":
+    main()
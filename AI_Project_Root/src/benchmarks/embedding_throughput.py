@@ -0,0 +1,59 @@
+"""embedding_throughput.py
+
+Measures embedding throughput for per-text calls versus the batched
+EmbeddingGenerator.generate_embeddings API (with and without dedupe and
+length sorting) on product titles from a Shopify export.
+
+Usage (from AI_Project_Root):
+  python -m src.benchmarks.embedding_throughput --source data/raw/product.csv --repeat 20
+  EMBEDDING_BACKEND=sentence-transformers python -m src.benchmarks.embedding_throughput
+"""
+import argparse
+import time
+
+from embedding_generator import DEFAULT_BATCH_SIZE, EmbeddingGenerator
+from src.core import config
+from src.ingest.variants import iter_product_records
+
+
+def load_titles(source, repeat):
+    records = iter_product_records(source, {"handle": ("handle",), "title": ("title",)})
+    titles = [r["title"] for r in records if r.get("title")]
+    return titles * repeat
+
+
+def timed(label, func, n):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {n:>7} texts {elapsed:8.3f}s {n / elapsed:10.1f} texts/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding throughput benchmark")
+    parser.add_argument("--source", default=str(config.RAW_DATA_DIR / "product.csv"))
+    parser.add_argument("--repeat", type=int, default=10, help="Repeat the titles to simulate duplicates")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--skip-single", action="store_true", help="Skip the slow one-call-per-text baseline")
+    args = parser.parse_args()
+
+    titles = load_titles(args.source, args.repeat)
+    generator = EmbeddingGenerator()
+    print(f"{len(titles)} titles ({len(set(titles))} unique), batch size {args.batch_size}")
+
+    # Warm up the model so the first timed run doesn't pay for lazy initialisation
+    generator.generate_embeddings(titles[:args.batch_size])
+
+    if not args.skip_single:
+        timed("generate_embedding per text", lambda: [generator.generate_embedding(t) for t in titles], len(titles))
+    timed("batched", lambda: generator.generate_embeddings(
+        titles, batch_size=args.batch_size, dedupe=False, sort_by_length=False, as_numpy=True), len(titles))
+    timed("batched + length sort", lambda: generator.generate_embeddings(
+        titles, batch_size=args.batch_size, dedupe=False, as_numpy=True), len(titles))
+    timed("batched + sort + dedupe", lambda: generator.generate_embeddings(
+        titles, batch_size=args.batch_size, as_numpy=True), len(titles))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""model_serving.py
+
+Serving cost of every tag/type classifier we can deploy, measured the same
+way on the same held-out rows of optimizer_training.csv:
+- sklearn      OneVsRest optimizer, joblib artifacts (TagPredictor)
+- compact      the same model's compact export (CompactTagPredictor)
+- tf           train_tf.py's SavedModel serving signature
+- tflite       train_tf.py's TFLite export
+- torch        train_torch.py's MLP (model.pt + tfidf/label encoder)
+
+Each backend runs in a fresh interpreter per thread count, so cold load
+(imports + artifact load + first prediction) and RSS belong to that backend
+alone, and BLAS/OpenMP/framework thread pools are pinned before anything
+starts. Per run: cold load, RSS after load and at the end, single-text
+latency p50/p99, throughput per batch size, and micro/sample F1 of the
+predicted label sets (0.5 threshold for sigmoid models, argmax for softmax)
+against the held-out labels. F1 is computed in the parent, so the children
+never import sklearn.metrics.
+
+The held-out set is every --holdout-every-th row, the split train_tf.py
+validates on. F1 is only a fair comparison when every model was trained
+without those rows. A temporary sklearn model fitted for the run, used when
+models/optimizer/ is empty, leaves them out.
+
+Usage (from AI_Project_Root):
+  python -m src.benchmarks.model_serving
+  python -m src.benchmarks.model_serving --backends sklearn compact torch --threads 1 4 --batch-sizes 1 32 256
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.benchmarks.tag_predictor_throughput import ARTIFACTS, fit_temporary_model, load_rows
+from src.core import config
+
+BACKENDS = ("sklearn", "compact", "tf", "tflite", "torch")
+THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+DEFAULT_THRESHOLD = 0.5
+
+
+def _rss_mb():
+    """Peak RSS of this process so far, in MB."""
+    # ru_maxrss survives exec on Linux, so a child would report its parent's peak; VmHWM starts fresh
+    try:
+        with open("/proc/self/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux, bytes on macOS
+
+
+# --- Loaders: each returns (scores(texts) -> (n, labels) array, label names, multi_label) ---
+
+def load_sklearn(paths, threads):
+    from src.optimizer.predictor import TagPredictor
+
+    predictor = TagPredictor(paths["optimizer"])
+    predictor._load()
+    return predictor.proba_matrix, list(predictor.labels), True
+
+
+def load_compact(paths, threads):
+    from src.optimizer.compact import CompactTagPredictor
+
+    predictor = CompactTagPredictor(Path(paths["optimizer"]) / "compact")
+    predictor._load()
+    return predictor.proba_matrix, list(predictor.labels), True
+
+
+def _tf_label_map(paths):
+    with open(Path(paths["tf"]) / "label_map.json", encoding="utf-8") as fh:
+        label_map = json.load(fh)
+    idx_to_label = label_map["idx_to_label"]
+    return [idx_to_label[str(i)] for i in range(len(idx_to_label))], label_map.get("multi_label", False)
+
+
+def load_tf(paths, threads):
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    from src.benchmarks.tf_inference_latency import load_savedmodel
+
+    labels, multi_label = _tf_label_map(paths)
+    return load_savedmodel(Path(paths["tf"]) / "product_type_serving"), labels, multi_label
+
+
+def load_tflite(paths, threads):
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    from src.benchmarks.tf_inference_latency import load_tflite as load
+
+    labels, multi_label = _tf_label_map(paths)
+    return load(Path(paths["tf"]) / "product_type.tflite"), labels, multi_label
+
+
+def load_torch(paths, threads):
+    import joblib
+    import torch
+    import torch.nn as nn
+
+    torch.set_num_threads(threads)
+    model_dir = Path(paths["torch"])
+    state = torch.load(model_dir / "model.pt", map_location="cpu")
+    vectorizer = joblib.load(model_dir / "tfidf.joblib")
+    encoder = joblib.load(model_dir / "label_encoder.joblib")
+    # train_torch.MLP's layer stack, rebuilt from the state_dict shapes (the script can't be imported)
+    hidden1, n_features = state["net.0.weight"].shape
+    hidden2 = state["net.3.weight"].shape[0]
+    n_labels = state["net.5.weight"].shape[0]
+    net = nn.Sequential(nn.Linear(n_features, hidden1), nn.ReLU(), nn.Dropout(0.2),
+                        nn.Linear(hidden1, hidden2), nn.ReLU(), nn.Linear(hidden2, n_labels))
+    net.load_state_dict({key[len("net."):]: value for key, value in state.items()})
+    net.eval()
+    multi_label = type(encoder).__name__ == "MultiLabelBinarizer"
+
+    def scores(texts):
+        x = vectorizer.transform(texts).tocoo()
+        xb = torch.sparse_coo_tensor(np.vstack([x.row, x.col]), x.data, x.shape, dtype=torch.float32)
+        with torch.inference_mode():
+            first = net[0]
+            logits = net[1:](torch.sparse.mm(xb, first.weight.t()) + first.bias)
+            return (torch.sigmoid(logits) if multi_label else torch.softmax(logits, dim=1)).numpy()
+
+    return scores, [str(label) for label in encoder.classes_], multi_label
+
+
+LOADERS = {"sklearn": load_sklearn, "compact": load_compact, "tf": load_tf, "tflite": load_tflite,
+           "torch": load_torch}
+REQUIRED_FILES = {
+    "sklearn": ("optimizer", ARTIFACTS),
+    "compact": ("optimizer", ("compact/meta.json",)),
+    "tf": ("tf", ("product_type_serving", "label_map.json")),
+    "tflite": ("tf", ("product_type.tflite", "label_map.json")),
+    "torch": ("torch", ("model.pt", "tfidf.joblib", "label_encoder.joblib")),
+}
+
+
+def missing_artifacts(backend, paths):
+    key, names = REQUIRED_FILES[backend]
+    return [str(Path(paths[key]) / name) for name in names if not (Path(paths[key]) / name).exists()]
+
+
+def decode(scores, labels, multi_label, threshold=DEFAULT_THRESHOLD):
+    if multi_label:
+        return [[labels[j] for j in np.flatnonzero(row >= threshold)] for row in scores]
+    return [[labels[j]] for j in np.argmax(scores, axis=1)]
+
+
+# --- Child: one backend, one thread count ---
+
+def measure(backend, paths, threads, texts, requests, batch_sizes, repeat):
+    start = time.perf_counter()
+    scores, labels, multi_label = LOADERS[backend](paths, threads)
+    predicted = decode(scores(texts), labels, multi_label)  # first prediction counts towards cold load
+    result = {"cold_load_s": time.perf_counter() - start, "rss_load_mb": _rss_mb(), "predicted": predicted}
+
+    samples = []
+    for i in range(requests):
+        t0 = time.perf_counter()
+        scores([texts[i % len(texts)]])
+        samples.append(time.perf_counter() - t0)
+    result["p50_ms"] = float(np.percentile(samples, 50) * 1e3)
+    result["p99_ms"] = float(np.percentile(samples, 99) * 1e3)
+
+    workload = texts * repeat
+    result["throughput"] = {}
+    for size in batch_sizes:
+        scores(workload[:size])
+        t0 = time.perf_counter()
+        for i in range(0, len(workload), size):
+            scores(workload[i:i + size])
+        result["throughput"][str(size)] = len(workload) / (time.perf_counter() - t0)
+    result["rss_peak_mb"] = _rss_mb()
+    return result
+
+
+def run_child(args):
+    texts = json.loads(Path(args.texts_file).read_text(encoding="utf-8"))
+    paths = {"optimizer": args.model_dir, "tf": args.tf_dir, "torch": args.torch_dir}
+    result = measure(args.child, paths, args.threads[0], texts, args.requests, args.batch_sizes, args.repeat)
+    print(json.dumps(result))
+
+
+# --- Parent ---
+
+def f1_scores(gold, predicted):
+    """(micro F1, mean per-sample F1) of label sets."""
+    tp = fp = fn = 0
+    per_sample = []
+    for truth, guess in zip(gold, predicted):
+        truth, guess = set(truth), set(guess)
+        hit = len(truth & guess)
+        tp, fp, fn = tp + hit, fp + len(guess - truth), fn + len(truth - guess)
+        per_sample.append(2 * hit / (len(truth) + len(guess)) if truth or guess else 1.0)
+    micro = 2 * tp / (2 * tp + fp + fn) if tp + fp + fn else 1.0
+    return micro, float(np.mean(per_sample)) if per_sample else 0.0
+
+
+def run_backend(backend, threads, args, texts_file, model_dir):
+    env = dict(os.environ, **{name: str(threads) for name in THREAD_ENV})
+    cmd = [sys.executable, "-m", "src.benchmarks.model_serving", "--child", backend, "--threads", str(threads),
+           "--texts-file", texts_file, "--model-dir", model_dir, "--tf-dir", args.tf_dir,
+           "--torch-dir", args.torch_dir, "--requests", str(args.requests), "--repeat", str(args.repeat),
+           "--batch-sizes", *map(str, args.batch_sizes)]
+    proc = subprocess.run(cmd, cwd=config.PROJECT_ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        error = (proc.stderr.strip().splitlines() or ["failed"])[-1]
+        return None, error
+    return json.loads(proc.stdout.strip().splitlines()[-1]), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-model inference benchmark")
+    parser.add_argument("--data", default=str(config.PROCESSED_DATA_DIR / "optimizer_training.csv"))
+    parser.add_argument("--model-dir", default=str(config.OPTIMIZER_MODEL_DIR))
+    parser.add_argument("--tf-dir", default=str(config.TF_MODEL_DIR))
+    parser.add_argument("--torch-dir", default=str(config.TORCH_MODEL_DIR))
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32, 256])
+    parser.add_argument("--requests", type=int, default=300, help="Single-text calls timed per run")
+    parser.add_argument("--repeat", type=int, default=20, help="Repeat the held-out rows for throughput runs")
+    parser.add_argument("--holdout-every", type=int, default=10, help="Every Nth row is held out")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    parser.add_argument("--child", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--texts-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args)
+        return
+
+    rows = load_rows(args.data)
+    holdout = rows[::args.holdout_every]
+    texts = [text for text, _ in holdout]
+    gold = [labels for _, labels in holdout]
+    threads = sorted(set(args.threads))
+    print(f"{len(holdout)} held-out rows (every {args.holdout_every}th of {len(rows)}), threads {threads}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        texts_file = str(Path(tmp) / "texts.json")
+        Path(texts_file).write_text(json.dumps(texts), encoding="utf-8")
+        model_dir = args.model_dir
+        if not all((Path(model_dir) / name).exists() for name in ARTIFACTS):
+            train = [row for i, row in enumerate(rows) if i % args.holdout_every]
+            print(f"No artifacts in {model_dir}; fitting a temporary sklearn model on the {len(train)} other rows")
+            model_dir = str(Path(tmp) / "optimizer")
+            Path(model_dir).mkdir()
+            fit_temporary_model(train, model_dir)
+            if "compact" in args.backends:
+                from src.optimizer.compact import export_compact
+                export_compact(model_dir)
+
+        paths = {"optimizer": model_dir, "tf": args.tf_dir, "torch": args.torch_dir}
+        size_cols = " ".join(f"{f'@{size}/s':>9}" for size in args.batch_sizes)
+        print(f"{'backend':<8} {'thr':>3} {'load s':>7} {'rss MB':>7} {'p50 ms':>7} {'p99 ms':>7} {size_cols} "
+              f"{'F1 micro':>8} {'F1 samp':>8}")
+        results = []
+        for backend in args.backends:
+            missing = missing_artifacts(backend, paths)
+            if missing:
+                print(f"{backend:<8} skipped: missing {', '.join(missing)}")
+                continue
+            for n in threads:
+                result, error = run_backend(backend, n, args, texts_file, model_dir)
+                if error:
+                    print(f"{backend:<8} {n:>3} skipped: {error}")
+                    break
+                micro, samples = f1_scores(gold, result.pop("predicted"))
+                result.update(backend=backend, threads=n, f1_micro=micro, f1_samples=samples)
+                results.append(result)
+                rates = " ".join(f"{result['throughput'][str(size)]:9.0f}" for size in args.batch_sizes)
+                print(f"{backend:<8} {n:>3} {result['cold_load_s']:7.3f} {result['rss_peak_mb']:7.0f} "
+                      f"{result['p50_ms']:7.3f} {result['p99_ms']:7.3f} {rates} {micro:8.3f} {samples:8.3f}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
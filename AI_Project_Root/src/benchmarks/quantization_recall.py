@@ -0,0 +1,82 @@
+"""quantization_recall.py
+
+Memory, disk and recall@k of the quantized IVF-flat index (float16, int8 and
+binary codes, src/embeddings/quantization.py) against the float32 index, with
+and without exact re-ranking of the coarse candidates.
+
+Quantization saves memory only: the re-rank needs the float32 vectors, so a
+quantized index keeps them on disk (memory-mapped) next to its codes, and
+its directory is larger than the float32 index's.
+
+Usage (from AI_Project_Root):
+  python -m src.benchmarks.quantization_recall --n 100000 --dim 384
+  python -m src.benchmarks.quantization_recall --from-db --rerank 1 4 10
+"""
+import argparse
+import tempfile
+
+import numpy as np
+
+from src.benchmarks.ann_recall import recall_at_k, synthetic_vectors, timed, unit
+from src.embeddings.ann import IVFFlatIndex, exact_search, load_product_embeddings
+
+QUANTIZATIONS = (None, "float16", "int8", "binary")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantized IVF-flat memory/recall benchmark")
+    parser.add_argument("--from-db", action="store_true", help="Use product_embeddings instead of synthetic data")
+    parser.add_argument("--kind", default="product", choices=("product", "chunk"))
+    parser.add_argument("--n", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--rerank", type=int, nargs="+", default=[1, 4, 10],
+                        help="Candidates re-ranked per result (1 = coarse ranking only)")
+    args = parser.parse_args()
+
+    if args.from_db:
+        from src.core.vector_db_manager import get_db_connection
+        conn = get_db_connection()
+        if conn is None:
+            return
+        try:
+            ids, vectors = load_product_embeddings(conn, args.kind)
+        finally:
+            conn.close()
+    else:
+        ids, vectors = synthetic_vectors(args.n, args.dim)
+    if not len(ids):
+        print("No vectors to index.")
+        return
+
+    rng = np.random.default_rng(1)
+    sample = rng.choice(len(ids), min(args.queries, len(ids)), replace=False)
+    queries = unit(unit(vectors[sample]) + 0.05 * rng.normal(size=(len(sample), vectors.shape[1])).astype(np.float32))
+    exact_ids, _ = exact_search(unit(vectors), np.asarray(ids), queries, args.k)
+    nq = len(queries)
+    print(f"{len(ids)} vectors x {vectors.shape[1]} dims, nprobe {args.nprobe}, {nq} queries")
+    print(f"{'codes':>8} {'memory MB':>10} {'disk MB':>8} {'rerank':>6} {'recall@' + str(args.k):>9} {'ms/query':>9}")
+
+    baseline = None
+    for quantization in QUANTIZATIONS:
+        index = IVFFlatIndex(vectors.shape[1], quantization=quantization).build(ids, vectors)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = index.save(tmp)
+            # Everything save() wrote: a quantized index stores its codes on top of the float32 vectors
+            disk_mb = sum(f.stat().st_size for f in path.iterdir()) / 1e6
+            loaded = IVFFlatIndex.load(tmp)
+            memory_mb = loaded.memory_bytes() / 1e6
+            baseline = baseline or memory_mb
+            for rerank in (args.rerank if quantization else [1]):
+                loaded.rerank = rerank
+                (approx_ids, _), search_s = timed(lambda: loaded.search(queries, args.k, args.nprobe))
+                print(f"{quantization or 'float32':>8} {memory_mb:10.1f} {disk_mb:8.1f} {rerank:>6} "
+                      f"{recall_at_k(approx_ids, exact_ids):9.3f} {search_s * 1000 / nq:9.3f}"
+                      + (f"   ({baseline / memory_mb:.0f}x less memory)" if quantization else ""))
+            del loaded
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""tag_predictor_throughput.py
+
+Throughput of the optimizer tag model on optimizer_training.csv, comparing:
+- the old per-text path (vectorizer.transform + clf.predict + inverse_transform per product)
+- TagPredictor.predict per text
+- TagPredictor.predict_many over batches of several sizes
+and checks that the batched predictions match clf.predict.
+
+Uses the artifacts in models/optimizer/; if there are none, a model is fitted
+on the CSV in a temporary directory with train_model.py's settings.
+
+Usage (from AI_Project_Root):
+  python -m src.benchmarks.tag_predictor_throughput --repeat 20
+"""
+import argparse
+import csv
+import tempfile
+import time
+from pathlib import Path
+
+import joblib
+
+from src.core import config
+from src.optimizer.predictor import MODEL_DIR, TagPredictor
+
+ARTIFACTS = ('tfidf_vectorizer.joblib', 'clf.joblib', 'mlb.joblib')
+
+
+def load_rows(path):
+    with open(path, newline='', encoding='utf-8') as fh:
+        return [(r['text'], [lbl for lbl in r['labels'].split('|') if lbl]) for r in csv.DictReader(fh)]
+
+
+def fit_temporary_model(rows, model_dir):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.multiclass import OneVsRestClassifier
+    from sklearn.preprocessing import MultiLabelBinarizer
+
+    mlb = MultiLabelBinarizer()
+    y = mlb.fit_transform([labels for _, labels in rows])
+    vec = TfidfVectorizer(ngram_range=(1, 2), max_features=20000)
+    x = vec.fit_transform([text for text, _ in rows])
+    clf = OneVsRestClassifier(LogisticRegression(max_iter=1000)).fit(x, y)
+    for name, obj in zip(ARTIFACTS, (vec, clf, mlb)):
+        joblib.dump(obj, Path(model_dir) / name)
+
+
+def timed(label, func, n):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {n:>7} texts {elapsed:8.3f}s {n / elapsed:10.1f} texts/s")
+    return result
+
+
+def run(model_dir, texts, batch_sizes):
+    vec = joblib.load(Path(model_dir) / 'tfidf_vectorizer.joblib')
+    clf = joblib.load(Path(model_dir) / 'clf.joblib')
+    mlb = joblib.load(Path(model_dir) / 'mlb.joblib')
+    n = len(texts)
+
+    def per_text_sklearn():
+        return [mlb.inverse_transform(clf.predict(vec.transform([t])))[0] for t in texts]
+
+    expected = timed("sklearn per text", per_text_sklearn, n)
+    predictor = TagPredictor(model_dir)
+    timed("first call (lazy load)", lambda: predictor.predict(texts[0]), 1)
+    timed("TagPredictor.predict per text", lambda: [predictor.predict(t) for t in texts], n)
+    for size in batch_sizes:
+        batched = timed(f"predict_many batch={size}", lambda: [
+            labels for start in range(0, n, size) for labels in predictor.predict_many(texts[start:start + size])
+        ], n)
+    mismatches = sum(set(a) != set(b) for a, b in zip(expected, batched))
+    print(f"label sets differing from clf.predict: {mismatches} of {n}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimizer tag predictor throughput")
+    parser.add_argument("--data", default=str(config.PROCESSED_DATA_DIR / "optimizer_training.csv"))
+    parser.add_argument("--model-dir", default=str(MODEL_DIR))
+    parser.add_argument("--repeat", type=int, default=10, help="Repeat the CSV rows to get a larger workload")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[32, 256, 2048])
+    args = parser.parse_args()
+
+    rows = load_rows(args.data)
+    texts = [text for text, _ in rows] * args.repeat
+    if all((Path(args.model_dir) / name).exists() for name in ARTIFACTS):
+        run(args.model_dir, texts, args.batch_sizes)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"No artifacts in {args.model_dir}; fitting a temporary model on {len(rows)} rows")
+        fit_temporary_model(rows, tmp)
+        run(tmp, texts, args.batch_sizes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""tf_inference_latency.py
+
+CPU inference latency of the TensorFlow exports from train_tf.py (SavedModel
+signature with XLA, TFLite) against the sklearn optimizer (TagPredictor) on
+optimizer_training.csv: load time, single-text latency (p50/p99) and batched
+throughput.
+
+Train the TF model on the same data first:
+  python -m src.training.train_tf --data-path data/processed/optimizer_training.csv --export savedmodel tflite
+
+Uses models/optimizer/ if it has artifacts, otherwise a temporary sklearn model
+fitted on the CSV. Backends whose export is missing are skipped.
+
+Usage (from AI_Project_Root):
+  python -m src.benchmarks.tf_inference_latency --requests 500 --batch-size 256
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.benchmarks.tag_predictor_throughput import ARTIFACTS, fit_temporary_model, load_rows
+from src.core import config
+from src.optimizer.predictor import MODEL_DIR, TagPredictor
+
+SERVING_DIR = config.TF_MODEL_DIR / "product_type_serving"
+TFLITE_PATH = config.TF_MODEL_DIR / "product_type.tflite"
+
+
+def load_savedmodel(path):
+    import tensorflow as tf
+
+    serve = tf.saved_model.load(str(path)).signatures["serving_default"]
+    return lambda texts: serve(text=tf.constant(texts))["scores"].numpy()
+
+
+def load_tflite(path):
+    import tensorflow as tf
+
+    interpreter = tf.lite.Interpreter(model_path=str(path))
+    input_index = interpreter.get_input_details()[0]["index"]
+    output_index = interpreter.get_output_details()[0]["index"]
+    shape = [None]
+
+    def predict(texts):
+        if shape[0] != len(texts):
+            # Input tensors are sized per batch; only resize when the batch size changes
+            interpreter.resize_tensor_input(input_index, [len(texts), 1])
+            interpreter.allocate_tensors()
+            shape[0] = len(texts)
+        interpreter.set_tensor(input_index, np.array(texts, dtype=object).reshape(-1, 1))
+        interpreter.invoke()
+        return interpreter.get_tensor(output_index)
+
+    return predict
+
+
+def load_sklearn(model_dir):
+    predictor = TagPredictor(model_dir)
+    predictor.predict("warm up")  # TagPredictor loads lazily; count the load here
+    return predictor.proba_matrix
+
+
+def latency_ms(predict, texts, requests, warmup=10):
+    """p50/p99 of one-text calls, in milliseconds."""
+    for text in texts[:warmup]:
+        predict([text])
+    samples = []
+    for i in range(requests):
+        start = time.perf_counter()
+        predict([texts[i % len(texts)]])
+        samples.append(time.perf_counter() - start)
+    return np.percentile(samples, 50) * 1e3, np.percentile(samples, 99) * 1e3
+
+
+def throughput(predict, texts, batch_size):
+    predict(texts[:batch_size])
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        predict(texts[i:i + batch_size])
+    return len(texts) / (time.perf_counter() - start)
+
+
+def run(backends, texts, requests, batch_size):
+    print(f"{'backend':<12} {'load s':>8} {'p50 ms':>8} {'p99 ms':>8} {f'texts/s @{batch_size}':>14}")
+    for name, load in backends:
+        start = time.perf_counter()
+        try:
+            predict = load()
+        except (OSError, ImportError, ValueError) as e:
+            print(f"{name:<12} skipped: {e}")
+            continue
+        load_s = time.perf_counter() - start
+        p50, p99 = latency_ms(predict, texts, requests)
+        print(f"{name:<12} {load_s:8.3f} {p50:8.3f} {p99:8.3f} {throughput(predict, texts, batch_size):14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TF export vs sklearn optimizer inference latency")
+    parser.add_argument("--data", default=str(config.PROCESSED_DATA_DIR / "optimizer_training.csv"))
+    parser.add_argument("--model-dir", default=str(MODEL_DIR))
+    parser.add_argument("--serving-dir", default=str(SERVING_DIR))
+    parser.add_argument("--tflite", default=str(TFLITE_PATH))
+    parser.add_argument("--requests", type=int, default=500, help="Single-text calls timed per backend")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=10, help="Repeat the CSV rows for the throughput run")
+    args = parser.parse_args()
+
+    rows = load_rows(args.data)
+    texts = [text for text, _ in rows] * args.repeat
+    with tempfile.TemporaryDirectory() as tmp:
+        model_dir = args.model_dir
+        if not all((Path(model_dir) / name).exists() for name in ARTIFACTS):
+            print(f"No artifacts in {model_dir}; fitting a temporary model on {len(rows)} rows")
+            fit_temporary_model(rows, tmp)
+            model_dir = tmp
+        backends = [("sklearn", lambda: load_sklearn(model_dir))]
+        if Path(args.serving_dir).exists():
+            backends.append(("savedmodel", lambda: load_savedmodel(args.serving_dir)))
+        else:
+            print(f"No SavedModel export at {args.serving_dir}; skipping")
+        if Path(args.tflite).exists():
+            backends.append(("tflite", lambda: load_tflite(args.tflite)))
+        else:
+            print(f"No TFLite export at {args.tflite}; skipping")
+        run(backends, texts, args.requests, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
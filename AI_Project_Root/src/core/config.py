@@ -11,6 +11,7 @@ PROJECT_ROOT = Path(__file__).parent.parent.parent.resolve()
 DATA_DIR = PROJECT_ROOT / "data"
 RAW_DATA_DIR = DATA_DIR / "raw"
 PROCESSED_DATA_DIR = DATA_DIR / "processed"
+STAGING_DIR = DATA_DIR / "staging"
 
 MODELS_DIR = PROJECT_ROOT / "models"
 TF_MODEL_DIR = MODELS_DIR / "tensorflow"
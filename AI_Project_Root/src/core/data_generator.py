@@ -1,17 +1,47 @@
 
 import json
-import csv
 import re
 import os
+from functools import lru_cache
+
+from src.ingest.variants import iter_product_records
+
+# Titles classified per embedding batch by the semantic category fallback
+CATEGORY_BATCH_SIZE = 256
 
 def load_vocabulary(vocab_path):
     """Loads the vocabulary from a JSON file."""
     with open(vocab_path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def normalize_title(title, vocabulary):
+@lru_cache(maxsize=None)
+def _alias_re(alias):
+    """Whole-word pattern for a vocabulary alias, compiled once per process."""
+    return re.compile(r'\b' + re.escape(alias.lower()) + r'\b')
+
+@lru_cache(maxsize=None)
+def _any_alias_re(aliases):
+    """One pattern matching wherever any of `aliases` would, to skip entries with no match in one search."""
+    return re.compile(r'\b(?:' + '|'.join(re.escape(a.lower()) for a in aliases) + r')\b')
+
+def apply_category_fallback(records, classifier):
+    """
+    Fills in the category of "Uncategorized" records with the semantic
+    classifier (src/embeddings/categories.py), one batch for all of them.
+    """
+    pending = [r for r in records if r['category'] == "Uncategorized"]
+    for record, (category, _) in zip(pending, classifier.classify([r['title'] for r in pending])):
+        if category:
+            record['category'] = category
+            record['tags'] = sorted(set(record['tags']) | {category})
+    return records
+
+def normalize_title(title, vocabulary, classifier=None):
     """
     Applies the normalization rules to a single product title.
+
+    When no category keyword matches and a `classifier` is given, the category
+    comes from the semantic classifier instead.
     """
     normalized_data = {
         "title": title,
@@ -27,8 +57,10 @@ def normalize_title(title, vocabulary):
 
     # 1. Brand Lookup
     for brand, aliases in vocabulary['brands'].items():
+        if not _any_alias_re(tuple(aliases)).search(remaining_title):
+            continue
         for alias in aliases:
-            if re.search(r'\b' + re.escape(alias.lower()) + r'\b', remaining_title):
+            if _alias_re(alias).search(remaining_title):
                 normalized_data['brand'] = brand
                 # Remove found brand from title to help with model cleanup
                 remaining_title = remaining_title.replace(alias.lower(), '')
@@ -38,8 +70,10 @@ def normalize_title(title, vocabulary):
 
     # 2. Category Lookup
     for category, aliases in vocabulary['categories'].items():
+        if not _any_alias_re(tuple(aliases)).search(remaining_title):
+            continue
         for alias in aliases:
-            if re.search(r'\b' + re.escape(alias.lower()) + r'\b', remaining_title):
+            if _alias_re(alias).search(remaining_title):
                 normalized_data['category'] = category
                 break
         if normalized_data['category'] != "Uncategorized":
@@ -49,8 +83,10 @@ def normalize_title(title, vocabulary):
     found_specs = set()
     for spec_group in vocabulary['specs'].values():
         for spec, aliases in spec_group.items():
+            if not _any_alias_re(tuple(aliases)).search(remaining_title):
+                continue
             for alias in aliases:
-                if re.search(r'\b' + re.escape(alias.lower()) + r'\b', remaining_title):
+                if _alias_re(alias).search(remaining_title):
                     found_specs.add(spec)
                     remaining_title = remaining_title.replace(alias.lower(), '')
     normalized_data['specs'] = sorted(list(found_specs))
@@ -58,8 +94,10 @@ def normalize_title(title, vocabulary):
     # 4. Attributes Extraction
     found_attributes = set()
     for attribute, aliases in vocabulary['attributes'].items():
+        if not _any_alias_re(tuple(aliases)).search(remaining_title):
+            continue
         for alias in aliases:
-            if re.search(r'\b' + re.escape(alias.lower()) + r'\b', remaining_title):
+            if _alias_re(alias).search(remaining_title):
                 found_attributes.add(attribute)
                 remaining_title = remaining_title.replace(alias.lower(), '')
     normalized_data['attributes'] = sorted(list(found_attributes))
@@ -86,34 +124,51 @@ def normalize_title(title, vocabulary):
         tags.add(normalized_data['category'])
     normalized_data['tags'] = sorted(list(tags))
 
+    if classifier is not None:
+        apply_category_fallback([normalized_data], classifier)
     return normalized_data
 
-def generate_training_data(csv_path, vocab_path, output_path):
+def generate_training_data(csv_path, vocab_path, output_path, classifier=None):
     """
     Reads a product CSV and a vocabulary JSON, normalizes the titles,
     and writes the output to a JSONL file.
+
+    Variant and image rows are folded into their product, so each product is
+    normalized once; a CSV without a Handle column is read row by row. With a
+    `classifier`, uncategorized titles are classified semantically in batches.
     """
     vocabulary = load_vocabulary(vocab_path)
+    # Resolves the columns now, so a bad CSV never truncates an existing output
+    products = iter_product_records(
+        csv_path, {'handle': ('handle',), 'title': ('title',)}, required=('title',)
+    )
     
     # Ensure the output directory exists
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
     processed_count = 0
-    with open(csv_path, 'r', encoding='utf-8') as csv_file, \
-         open(output_path, 'w', encoding='utf-8') as jsonl_file:
-        
-        reader = csv.DictReader(csv_file)
-        for row in reader:
-            title = row.get('Title')
+    with open(output_path, 'w', encoding='utf-8') as jsonl_file:
+        batch = []
+        for product in products:
+            title = product.get('title')
             if not title:
                 continue
             
-            normalized_product = normalize_title(title, vocabulary)
-            jsonl_file.write(json.dumps(normalized_product) + '\n')
-            processed_count += 1
+            batch.append(normalize_title(title, vocabulary))
+            if len(batch) >= CATEGORY_BATCH_SIZE:
+                processed_count += _write_batch(jsonl_file, batch, classifier)
+                batch = []
+        processed_count += _write_batch(jsonl_file, batch, classifier)
             
     return processed_count
 
+def _write_batch(jsonl_file, batch, classifier):
+    if classifier is not None:
+        apply_category_fallback(batch, classifier)
+    for normalized_product in batch:
+        jsonl_file.write(json.dumps(normalized_product) + '\n')
+    return len(batch)
+
 if __name__ == '__main__':
     # This allows the script to be run directly
     # Assumes a project structure where this script is in 'core'
@@ -123,6 +178,12 @@ if __name__ == '__main__':
     vocabulary_json_path = os.path.join(project_root, 'ml', 'data', 'vocabulary.json')
     output_jsonl_path = os.path.join(project_root, 'ml', 'data', 'training_data.jsonl')
 
+    # Semantic category fallback, when a real embedding backend is configured
+    from embedding_generator import EmbeddingGenerator
+    from src.embeddings.categories import load_category_classifier
+    category_classifier = load_category_classifier(EmbeddingGenerator())
+
     print("Starting data generation...")
-    count = generate_training_data(product_csv_path, vocabulary_json_path, output_jsonl_path)
+    count = generate_training_data(product_csv_path, vocabulary_json_path, output_jsonl_path,
+                                   classifier=category_classifier)
     print(f"Processing complete. Wrote {count} lines to {output_jsonl_path}")
@@ -0,0 +1,246 @@
+"""search.py
+
+Hybrid product search: a full-text query on `products.storefront_tsv` (GIN
+index, migrations 003/010) and a vector kNN query on `product_embeddings`
+(migration 002, via vector_db_manager.similar_products) run concurrently on
+separate pooled connections and are fused with reciprocal rank fusion (RRF).
+
+RRF only looks at ranks, so the two very different score scales (ts_rank_cd
+and cosine similarity) never need calibrating against each other: a product
+scores sum(weight / (RRF_K + rank)) over the rankings it appears in.
+
+Results for hot queries are kept in a small TTL cache. If the vector stage
+fails, the text ranking is served alone, flagged `degraded` and not cached.
+Every response carries per-stage timings in milliseconds.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+from src.core.vector_db_manager import get_connection_pool, similar_products
+
+# Standard RRF constant; larger values flatten the difference between top ranks.
+RRF_K = 60
+# Each ranking contributes this many candidates per requested result
+CANDIDATE_FACTOR = 4
+MIN_CANDIDATES = 20
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "60"))
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "1024"))
+
+# Free text uses web-search syntax ("quoted phrases", -exclusions, or)
+_TEXT_BY_QUERY_SQL = """
+SELECT p.id::text, ts_rank_cd(p.storefront_tsv, q.query) AS rank
+FROM products p, websearch_to_tsquery('english', %(text)s) AS q(query)
+WHERE p.storefront_tsv @@ q.query
+ORDER BY rank DESC
+LIMIT %(limit)s"""
+
+# Similar-product lookups OR the source title's lexemes together, so partial overlaps still match
+_TEXT_BY_PRODUCT_SQL = """
+SELECT p.id::text, ts_rank_cd(p.storefront_tsv, q.query) AS rank
+FROM products src
+CROSS JOIN LATERAL (
+    SELECT NULLIF(replace(plainto_tsquery('english', src.title)::text, ' & ', ' | '), '')::tsquery
+) AS q(query)
+JOIN products p ON p.storefront_tsv @@ q.query AND p.id <> src.id
+WHERE src.id = %(product_id)s
+ORDER BY rank DESC
+LIMIT %(limit)s"""
+
+_DETAILS_SQL = """
+SELECT id::text, title, vendor, product_type, handle
+FROM products WHERE id = ANY(%s::uuid[])"""
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire `ttl` seconds after being stored."""
+
+    def __init__(self, maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def reciprocal_rank_fusion(rankings, weights=None, k=RRF_K):
+    """
+    Fuses ranked id lists. Returns [(id, score, {ranking name: 1-based rank})]
+    sorted by descending fused score.
+    """
+    weights = weights or {}
+    scores, ranks = {}, {}
+    for name, ids in rankings.items():
+        weight = weights.get(name, 1.0)
+        for rank, item in enumerate(ids, start=1):
+            if item in ranks and name in ranks[item]:
+                continue  # keep the best rank if a ranking repeats an id
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank)
+            ranks.setdefault(item, {})[name] = rank
+    fused = sorted(scores, key=scores.get, reverse=True)
+    return [(item, scores[item], ranks[item]) for item in fused]
+
+
+class HybridSearch:
+    """
+    Runs the text and vector stages concurrently and fuses them.
+
+    `embed` turns a list of query strings into vectors (e.g.
+    EmbeddingGenerator.generate_embeddings); without it, free-text queries
+    are answered by full-text search alone.
+    """
+
+    def __init__(self, embed=None, pool=None, cache=None, max_connections=8, kind="product"):
+        self.embed = embed
+        self.kind = kind
+        self._pool = pool
+        self._pool_lock = threading.Lock()
+        self.max_connections = max_connections
+        self.cache = cache if cache is not None else TTLCache()
+        self._executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="hybrid-search")
+
+    @property
+    def pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = get_connection_pool(self.max_connections)
+            return self._pool
+
+    def _with_connection(self, func, *args):
+        pool = self.pool
+        if pool is None:
+            raise psycopg2.OperationalError("no database connection")
+        conn = pool.getconn()
+        try:
+            return func(conn, *args)
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn)
+
+    def _timed(self, timings, stage, func, *args):
+        start = time.perf_counter()
+        try:
+            return self._with_connection(func, *args)
+        finally:
+            timings[stage] = round((time.perf_counter() - start) * 1000, 2)
+
+    @staticmethod
+    def _text_stage(conn, params, by_product):
+        with conn.cursor() as cur:
+            cur.execute(_TEXT_BY_PRODUCT_SQL if by_product else _TEXT_BY_QUERY_SQL, params)
+            rows = cur.fetchall()
+        conn.commit()
+        return [product_id for product_id, _ in rows]
+
+    def _vector_stage(self, conn, text, product_id, limit, timings):
+        query = product_id
+        if product_id is None:
+            start = time.perf_counter()
+            query = self.embed([text])[0]
+            timings["embed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return similar_products(query, k=limit, kind=self.kind, conn=conn, raise_errors=True)
+
+    @staticmethod
+    def _details(conn, ids):
+        with conn.cursor() as cur:
+            cur.execute(_DETAILS_SQL, (ids,))
+            rows = cur.fetchall()
+        conn.commit()
+        return {row[0]: {"title": row[1], "vendor": row[2], "product_type": row[3], "handle": row[4]}
+                for row in rows}
+
+    @staticmethod
+    def _exists(conn, product_id):
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM products WHERE id = %s", (product_id,))
+            row = cur.fetchone()
+        conn.commit()
+        return row is not None
+
+    def has_product(self, product_id):
+        return self._with_connection(self._exists, str(product_id))
+
+    def search(self, text=None, product_id=None, k=10, text_weight=1.0, vector_weight=1.0):
+        """
+        Hybrid search for free `text`, or for products similar to `product_id`
+        (its title for the text stage, its stored embedding for the vector stage).
+        """
+        start = time.perf_counter()
+        key = (text.strip().lower() if text else None, product_id, k, text_weight, vector_weight)
+        cached = self.cache.get(key)
+        if cached is not None:
+            elapsed = round((time.perf_counter() - start) * 1000, 3)
+            return {**cached, "cached": True, "timings_ms": {"cache_ms": elapsed, "total_ms": elapsed}}
+
+        limit = max(k * CANDIDATE_FACTOR, MIN_CANDIDATES)
+        timings = {}
+        by_product = product_id is not None
+        params = {"product_id": str(product_id), "limit": limit} if by_product else {"text": text, "limit": limit}
+        text_future = self._executor.submit(self._timed, timings, "text_ms", self._text_stage, params, by_product)
+        vector_future = None
+        if by_product or self.embed is not None:
+            vector_future = self._executor.submit(self._timed, timings, "vector_ms", self._vector_stage,
+                                                  text, str(product_id) if by_product else None, limit, timings)
+        rankings = {"text": text_future.result()}
+        vector_scores = {}
+        degraded = False
+        if vector_future is not None:
+            try:
+                neighbours = vector_future.result()
+            except psycopg2.Error as e:
+                print(f"Vector stage failed, serving full-text results only: {e}")
+                neighbours, degraded = [], True
+            rankings["vector"] = [item for item, _ in neighbours]
+            vector_scores = dict(neighbours)
+
+        fuse_start = time.perf_counter()
+        fused = reciprocal_rank_fusion(rankings, {"text": text_weight, "vector": vector_weight})[:k]
+        timings["fusion_ms"] = round((time.perf_counter() - fuse_start) * 1000, 2)
+        details = self._timed(timings, "details_ms", self._details, [item for item, _, _ in fused]) if fused else {}
+
+        results = [
+            {"product_id": item, **details.get(item, {}), "score": round(score, 6),
+             "text_rank": ranks.get("text"), "vector_rank": ranks.get("vector"),
+             "similarity": vector_scores.get(item)}
+            for item, score, ranks in fused
+        ]
+        timings["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        response = {"query": text, "product_id": product_id, "results": results, "degraded": degraded}
+        if not degraded:
+            self.cache.put(key, response)
+        return {**response, "cached": False, "timings_ms": timings}
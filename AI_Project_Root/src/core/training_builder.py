@@ -0,0 +1,247 @@
+"""training_builder.py
+
+Single-pass builder for every training set derived from a Shopify export.
+
+The optimizer CSV (src/optimizer/generate_training_data.py) and the
+normalization JSONL (src/core/data_generator.py) used to come from two
+separate scans of the same file. Here the export is read once, column-pruned
+to the fields the labelers need and folded to one record per product
+(src/ingest/variants.py), and every chunk of records goes through all the
+labelers. Chunks are labeled in worker processes and the results are
+appended to each output file in input order as they complete, so memory is
+bounded by a few chunks whatever the size of the export.
+
+A labeler declares the record fields it reads, turns one record into one
+output row (or None), and writes its rows. Work that cannot run in a worker
+process, such as the embedding-based category fallback, goes in `finish`,
+which runs per chunk in the parent process.
+
+Usage (from AI_Project_Root):
+  python -m src.core.training_builder data/raw/product.csv
+  python -m src.core.training_builder data/raw/product.csv --labelers optimizer --workers 4
+"""
+import csv
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from src.core import config
+from src.core.data_generator import CATEGORY_BATCH_SIZE, apply_category_fallback, load_vocabulary, normalize_title
+from src.ingest.variants import SHOPIFY_PRODUCT_COLUMNS, iter_product_records
+from src.optimizer.generate_training_data import OUT as OPTIMIZER_OUT, label_product
+
+DEFAULT_CHUNK_SIZE = 1000
+# Chunks labeled ahead of the writer, per worker
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+VOCABULARY_PATH = config.RAW_DATA_DIR / "vocabulary.json"
+NORMALIZATION_OUT = config.PROCESSED_DATA_DIR / "training_data.jsonl"
+
+
+class Labeler:
+    """One output of the builder. Instances are pickled to the worker processes."""
+
+    name = ""
+    fields = ()
+
+    def __init__(self, output):
+        self.output = Path(output)
+
+    def label(self, record):
+        """Output row for one folded product record, or None to skip it."""
+        raise NotImplementedError
+
+    def finish(self, rows):
+        """Per-chunk step run in the parent process before the rows are written."""
+        return rows
+
+    def start(self, fh):
+        """Writes anything that precedes the rows (e.g. a CSV header)."""
+
+    def write(self, fh, rows):
+        raise NotImplementedError
+
+
+class OptimizerLabeler(Labeler):
+    """text,labels rows for the optimizer tag model."""
+
+    name = "optimizer"
+    fields = ("title", "body_html", "vendor", "product_type")
+    fieldnames = ("text", "labels")
+
+    def __init__(self, output=OPTIMIZER_OUT):
+        super().__init__(output)
+
+    def label(self, record):
+        return label_product(record["handle"], (record.get("title") or "").strip(), record.get("body_html") or "",
+                             record.get("vendor"), record.get("product_type"))
+
+    def start(self, fh):
+        csv.DictWriter(fh, fieldnames=self.fieldnames).writeheader()
+
+    def write(self, fh, rows):
+        csv.DictWriter(fh, fieldnames=self.fieldnames).writerows(rows)
+
+
+class NormalizationLabeler(Labeler):
+    """
+    normalize_title() records for the normalization model. With a
+    `classifier`, uncategorized titles get the semantic category fallback.
+    """
+
+    name = "normalization"
+    fields = ("title",)
+
+    def __init__(self, output=NORMALIZATION_OUT, vocab_path=VOCABULARY_PATH, classifier=None):
+        super().__init__(output)
+        self.vocabulary = load_vocabulary(vocab_path)
+        self.classifier = classifier
+
+    def __getstate__(self):
+        # The classifier holds an embedding backend; it only runs in the parent, in finish()
+        state = self.__dict__.copy()
+        state["classifier"] = None
+        return state
+
+    def label(self, record):
+        title = record.get("title")
+        return normalize_title(title, self.vocabulary) if title else None
+
+    def finish(self, rows):
+        if self.classifier is not None:
+            for start in range(0, len(rows), CATEGORY_BATCH_SIZE):
+                apply_category_fallback(rows[start:start + CATEGORY_BATCH_SIZE], self.classifier)
+        return rows
+
+    def write(self, fh, rows):
+        fh.writelines(json.dumps(row) + "\n" for row in rows)
+
+
+LABELERS = {cls.name: cls for cls in (OptimizerLabeler, NormalizationLabeler)}
+
+
+def _label_chunk(labelers, records):
+    """[rows per labeler] for one chunk of records."""
+    results = []
+    for labeler in labelers:
+        rows = (labeler.label(record) for record in records)
+        results.append([row for row in rows if row is not None])
+    return results
+
+
+# Labelers of this worker process, set once by _init_worker
+_worker_labelers = []
+
+
+def _init_worker(labelers):
+    _worker_labelers[:] = labelers
+
+
+def _label_in_worker(records):
+    return _label_chunk(_worker_labelers, records)
+
+
+def _chunked(records, size):
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _labeled_chunks(chunks, labelers, workers):
+    """Yields _label_chunk results in input order, labeling up to a few chunks ahead."""
+    if workers <= 1:
+        # single core: run inline, a pool would only add pickling cost
+        for chunk in chunks:
+            yield _label_chunk(labelers, chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(labelers,)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_label_in_worker, chunk))
+            if len(pending) >= workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def build_training_data(csv_path, labelers=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Reads `csv_path` once and writes every labeler's output. Returns
+    {labeler name: rows written}.
+
+    Outputs are written to a temporary file next to the target and renamed
+    into place once the whole export has been processed, so a failed run
+    leaves the previous files untouched.
+    """
+    labelers = list(labelers) if labelers is not None else [OptimizerLabeler(), NormalizationLabeler()]
+    workers = workers or os.cpu_count() or 1
+    fields = {"handle"}.union(*(labeler.fields for labeler in labelers))
+    columns = {field: SHOPIFY_PRODUCT_COLUMNS[field] for field in sorted(fields)}
+    records = iter_product_records(csv_path, columns, required=("handle",))
+
+    counts = {labeler.name: 0 for labeler in labelers}
+    tmp_paths = [labeler.output.with_name(labeler.output.name + ".tmp") for labeler in labelers]
+    handles = []
+    try:
+        for labeler, tmp in zip(labelers, tmp_paths):
+            tmp.parent.mkdir(parents=True, exist_ok=True)
+            handles.append(open(tmp, "w", newline="", encoding="utf-8"))
+            labeler.start(handles[-1])
+        for results in _labeled_chunks(_chunked(records, chunk_size), labelers, workers):
+            for labeler, fh, rows in zip(labelers, handles, results):
+                rows = labeler.finish(rows)
+                labeler.write(fh, rows)
+                counts[labeler.name] += len(rows)
+        for fh in handles:
+            fh.close()
+        for labeler, tmp in zip(labelers, tmp_paths):
+            os.replace(tmp, labeler.output)
+    finally:
+        for fh in handles:
+            fh.close()
+        for tmp in tmp_paths:
+            tmp.unlink(missing_ok=True)
+    return counts
+
+
+def main():
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Build every training set from a Shopify export in one pass")
+    parser.add_argument("source", help="Shopify products CSV")
+    parser.add_argument("--labelers", nargs="+", choices=sorted(LABELERS), default=sorted(LABELERS))
+    parser.add_argument("--optimizer-out", default=str(OPTIMIZER_OUT))
+    parser.add_argument("--normalization-out", default=str(NORMALIZATION_OUT))
+    parser.add_argument("--vocabulary", default=str(VOCABULARY_PATH))
+    parser.add_argument("--semantic-fallback", action="store_true",
+                        help="Classify uncategorized titles with the embedding-based category classifier")
+    parser.add_argument("--workers", type=int, default=None, help="Labeling processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    labelers = []
+    if "optimizer" in args.labelers:
+        labelers.append(OptimizerLabeler(args.optimizer_out))
+    if "normalization" in args.labelers:
+        classifier = None
+        if args.semantic_fallback:
+            from embedding_generator import EmbeddingGenerator
+            from src.embeddings.categories import load_category_classifier
+            classifier = load_category_classifier(EmbeddingGenerator())
+        labelers.append(NormalizationLabeler(args.normalization_out, args.vocabulary, classifier))
+
+    start = time.perf_counter()
+    counts = build_training_data(args.source, labelers, args.workers, args.chunk_size)
+    for labeler in labelers:
+        print(f"Wrote {counts[labeler.name]} rows to {labeler.output}")
+    print(f"Done in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
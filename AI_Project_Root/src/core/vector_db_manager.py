@@ -1,23 +1,44 @@
 
+import json
+import math
 import os
+import sys
+import time
+import uuid
+from dataclasses import asdict, dataclass
+
 import psycopg2
 from psycopg2.extras import DictCursor
+from psycopg2.pool import ThreadedConnectionPool
+
+from src.ingest.staging import vector_literal
+
+def _connection_params():
+    return {
+        "host": os.environ.get("PG_HOST", "localhost"),
+        "database": os.environ.get("PG_DATABASE", "product_data"),
+        "user": os.environ.get("PG_USER", "postgres"),
+        "password": os.environ.get("PG_PASSWORD", "postgres"),
+        "port": os.environ.get("PG_PORT", "5432"),
+    }
 
 def get_db_connection():
     """Establishes a connection to the PostgreSQL database."""
     try:
-        conn = psycopg2.connect(
-            host=os.environ.get("PG_HOST", "localhost"),
-            database=os.environ.get("PG_DATABASE", "product_data"),
-            user=os.environ.get("PG_USER", "postgres"),
-            password=os.environ.get("PG_PASSWORD", "postgres"),
-            port=os.environ.get("PG_PORT", "5432")
-        )
+        conn = psycopg2.connect(**_connection_params())
         return conn
     except psycopg2.OperationalError as e:
         print(f"Error connecting to PostgreSQL: {e}")
         return None
 
+def get_connection_pool(maxconn=8):
+    """A thread-safe pool of connections with the same settings as get_db_connection()."""
+    try:
+        return ThreadedConnectionPool(1, maxconn, **_connection_params())
+    except psycopg2.OperationalError as e:
+        print(f"Error connecting to PostgreSQL: {e}")
+        return None
+
 def get_all_products(limit=100):
     """Fetches all products from the database."""
     conn = get_db_connection()
@@ -36,7 +57,334 @@ def get_all_products(limit=100):
         if conn:
             conn.close()
 
+# --- pgvector index management ---
+
+EMBEDDING_TABLE = "product_embeddings"
+# Below this many rows an exact scan is as fast as an index and always exact.
+MIN_INDEXED_ROWS = 10000
+# pgvector guidance: ivfflat up to ~1M rows, HNSW beyond (better recall/latency, slower build).
+HNSW_MIN_ROWS = 1000000
+# Rebuild once the indexed rows have grown by this factor since the last build.
+REBUILD_GROWTH = 2.0
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+HNSW_EF_SEARCH = 40
+KINDS = ("product", "chunk")
+EMBEDDING_DIM = 1536
+# Optional compact index: "halfvec" (float16) or "binary" (1 bit/dim, Hamming).
+# The table keeps full vectors; results are re-ranked on them.
+DEFAULT_QUANTIZATION = os.environ.get("EMBEDDING_INDEX_QUANTIZATION") or None
+# Quantized searches re-rank this many candidates per result
+DEFAULT_RERANK = 4
+# Seconds a process trusts its cached index plan; another process may rebuild or requantize the index
+SEARCH_PLAN_TTL = float(os.environ.get("SEARCH_PLAN_TTL", "30"))
+
+# quantization -> (indexed expression, operator class, distance operator, query expression)
+_QUANTIZED = {
+    None: ("embedding", "vector_cosine_ops", "<=>", "{q}"),
+    "halfvec": (f"(embedding::halfvec({EMBEDDING_DIM}))", "halfvec_cosine_ops", "<=>",
+                f"({{q}})::halfvec({EMBEDDING_DIM})"),
+    "binary": (f"(binary_quantize(embedding)::bit({EMBEDDING_DIM}))", "bit_hamming_ops", "<~>",
+               f"binary_quantize({{q}})::bit({EMBEDDING_DIM})"),
+}
+
+_KIND_PREDICATE = "COALESCE(metadata->>'kind', 'product') = %s"
+# kind -> (IndexPlan or None, time.monotonic() when read)
+_search_settings = {}
+
+
+@dataclass
+class IndexPlan:
+    """Index type and parameters for a given row count (kind None means no index)."""
+    kind: str | None
+    rows: int
+    lists: int | None = None
+    probes: int | None = None
+    m: int | None = None
+    ef_construction: int | None = None
+    ef_search: int | None = None
+    quantization: str | None = None
+
+    def with_clause(self):
+        if self.kind == "ivfflat":
+            return f"WITH (lists = {self.lists})"
+        return f"WITH (m = {self.m}, ef_construction = {self.ef_construction})"
+
+    def describe(self):
+        suffix = f" {self.quantization}" if self.quantization else ""
+        if self.kind == "ivfflat":
+            return f"ivfflat{suffix} lists={self.lists} probes={self.probes}"
+        if self.kind == "hnsw":
+            return f"hnsw{suffix} m={self.m} ef_construction={self.ef_construction} ef_search={self.ef_search}"
+        return "no index (exact scan)"
+
+    def index_expression(self):
+        expression, opclass, _, _ = _QUANTIZED[self.quantization]
+        return f"{expression} {opclass}"
+
+
+def _check_quantization(quantization):
+    quantization = None if quantization in (None, "", "none") else quantization
+    if quantization not in _QUANTIZED:
+        raise ValueError(f"Unknown index quantization: {quantization} (expected halfvec, binary or none)")
+    return quantization
+
+
+def plan_index(row_count, quantization=None):
+    """Picks the index type and parameters for `row_count` rows."""
+    quantization = _check_quantization(quantization)
+    if row_count < MIN_INDEXED_ROWS:
+        return IndexPlan(None, row_count)
+    if row_count < HNSW_MIN_ROWS:
+        lists = max(10, row_count // 1000)
+        return IndexPlan("ivfflat", row_count, lists=lists, probes=max(1, round(math.sqrt(lists))),
+                         quantization=quantization)
+    return IndexPlan("hnsw", row_count, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION, ef_search=HNSW_EF_SEARCH,
+                     quantization=quantization)
+
+
+def index_name(kind):
+    return f"{EMBEDDING_TABLE}_{kind}_embedding_idx"
+
+
+def count_embeddings(conn, kind="product"):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT count(*) FROM {EMBEDDING_TABLE} WHERE {_KIND_PREDICATE}", (kind,))
+        return cur.fetchone()[0]
+
+
+def get_index_state(conn, kind="product"):
+    """Returns the plan stored on the current index (as its comment), or None if there is no valid index."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """SELECT obj_description(c.oid, 'pg_class'), i.indisvalid
+               FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+               WHERE c.relname = %s""", (index_name(kind),))
+        row = cur.fetchone()
+    if row is None or not row[1] or not row[0]:
+        return None
+    return IndexPlan(**json.loads(row[0]))
+
+
+def _drop_invalid_indexes(conn, kind):
+    """Removes leftovers of interrupted CONCURRENTLY builds."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """SELECT c.relname FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+               WHERE NOT i.indisvalid AND c.relname IN (%s, %s)""",
+            (index_name(kind), index_name(kind) + "_new"))
+        for (name,) in cur.fetchall():
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def build_index(conn, plan, kind="product"):
+    """
+    Builds the index for `plan` with CREATE INDEX CONCURRENTLY (writes keep
+    flowing) and swaps it in for the previous one. Requires an autocommit connection.
+    """
+    name = index_name(kind)
+    new_name = name + "_new"
+    with conn.cursor() as cur:
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {new_name}")
+        cur.execute(
+            f"""CREATE INDEX CONCURRENTLY {new_name} ON {EMBEDDING_TABLE}
+                USING {plan.kind} ({plan.index_expression()}) {plan.with_clause()}
+                WHERE {_KIND_PREDICATE}""", (kind,))
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        cur.execute(f"ALTER INDEX {new_name} RENAME TO {name}")
+        cur.execute(f"COMMENT ON INDEX {name} IS %s", (json.dumps(asdict(plan)),))
+    _search_settings.pop(kind, None)
+
+
+def ensure_vector_index(conn=None, kind="product", growth=REBUILD_GROWTH, force=False,
+                        quantization=DEFAULT_QUANTIZATION):
+    """
+    Creates, retunes or leaves alone the ANN index for one kind of embedding row.
+
+    The index is (re)built when none exists yet, when the row count calls for a
+    different index type or quantization, or when the rows have grown
+    `growth`-fold since the last build. Returns the plan in effect.
+
+    `quantization` ("halfvec" or "binary") indexes a compact copy of the
+    vectors: halfvec halves the index size, binary cuts it 32-fold. Searches
+    re-rank the index candidates on the full-precision column.
+    """
+    own_conn = conn is None
+    conn = conn or get_db_connection()
+    if conn is None:
+        return None
+    try:
+        conn.autocommit = True  # CREATE/DROP INDEX CONCURRENTLY can't run in a transaction
+        _drop_invalid_indexes(conn, kind)
+        rows = count_embeddings(conn, kind)
+        plan = plan_index(rows, quantization)
+        current = get_index_state(conn, kind)
+
+        if plan.kind is None:
+            print(f"{kind}: {rows} rows, exact scan is fine; " +
+                  ("keeping existing index" if current else "no index needed"))
+            return current or plan
+        if (current and not force and current.kind == plan.kind and current.quantization == plan.quantization
+                and rows < current.rows * growth):
+            print(f"{kind}: {rows} rows, index up to date ({current.describe()}, built at {current.rows} rows)")
+            return current
+
+        reason = "no index" if current is None else f"{current.describe()} built at {current.rows} rows"
+        print(f"{kind}: building {plan.describe()} for {rows} rows ({reason})")
+        start = time.perf_counter()
+        build_index(conn, plan, kind)
+        print(f"{kind}: index built in {time.perf_counter() - start:.1f}s")
+        return plan
+    except psycopg2.Error as e:
+        print(f"Error managing vector index: {e}")
+        return None
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def _search_plan(conn, kind):
+    """The index plan searches run with, re-read from the index comment every SEARCH_PLAN_TTL seconds."""
+    cached = _search_settings.get(kind)
+    now = time.monotonic()
+    if cached is None or now - cached[1] >= SEARCH_PLAN_TTL:
+        cached = _search_settings[kind] = (get_index_state(conn, kind), now)
+    return cached[0]
+
+
+def _is_product_id(value):
+    return isinstance(value, (str, uuid.UUID))
+
+
+def _as_queries(query):
+    """Normalizes similar_products input to (list of queries, is_batch)."""
+    if _is_product_id(query):
+        return [query], False
+    if not len(query):
+        return [], True
+    first = query[0]
+    if _is_product_id(first) or hasattr(first, "__len__"):
+        return list(query), True
+    return [query], False  # a single vector
+
+
+_SIMILAR_BY_VECTOR_SQL = """
+SELECT q.ord, n.product_id::text, n.score
+FROM unnest(%(vectors)s::text[]) WITH ORDINALITY AS q(vec, ord)
+CROSS JOIN LATERAL ({neighbours}) n
+ORDER BY q.ord, n.score DESC"""
+
+_SIMILAR_BY_PRODUCT_SQL = f"""
+SELECT q.ord, n.product_id::text, n.score
+FROM unnest(%(ids)s::uuid[]) WITH ORDINALITY AS q(product_id, ord)
+JOIN {EMBEDDING_TABLE} src
+  ON src.product_id = q.product_id AND COALESCE(src.metadata->>'kind', 'product') = 'product'
+CROSS JOIN LATERAL ({{neighbours}}) n
+WHERE n.product_id <> q.product_id
+ORDER BY q.ord, n.score DESC"""
+
+_NEIGHBOURS_SQL = f"""
+    SELECT pe.product_id, 1 - (pe.embedding <=> {{q}}) AS score
+    FROM {EMBEDDING_TABLE} pe
+    WHERE COALESCE(pe.metadata->>'kind', 'product') = %(kind)s
+    ORDER BY pe.embedding <=> {{q}}
+    LIMIT %(limit)s
+"""
+
+# Coarse pass on the quantized index expression, exact re-rank of its candidates
+_RERANKED_NEIGHBOURS_SQL = f"""
+    SELECT c.product_id, 1 - (c.embedding <=> {{q}}) AS score
+    FROM (
+        SELECT pe.product_id, pe.embedding
+        FROM {EMBEDDING_TABLE} pe
+        WHERE COALESCE(pe.metadata->>'kind', 'product') = %(kind)s
+        ORDER BY {{expression}} {{operator}} {{coarse_q}}
+        LIMIT %(candidates)s
+    ) c
+    ORDER BY c.embedding <=> {{q}}
+    LIMIT %(limit)s
+"""
+
+
+def _similar_sql(by_product, quantization):
+    q = "src.embedding" if by_product else "q.vec::vector"
+    if quantization:
+        expression, _, operator, query_expression = _QUANTIZED[quantization]
+        neighbours = _RERANKED_NEIGHBOURS_SQL.format(
+            q=q, expression=expression.replace("embedding", "pe.embedding"), operator=operator,
+            coarse_q=query_expression.format(q=q))
+    else:
+        neighbours = _NEIGHBOURS_SQL.format(q=q)
+    return (_SIMILAR_BY_PRODUCT_SQL if by_product else _SIMILAR_BY_VECTOR_SQL).format(neighbours=neighbours)
+
+
+def similar_products(query, k=10, probes=None, ef_search=None, kind="product", conn=None,
+                     rerank=DEFAULT_RERANK, raise_errors=False):
+    """
+    Nearest products by cosine similarity, via the managed pgvector index.
+
+    `query` is a product id, an embedding vector, or a list of either; a list is
+    answered in one round trip (one LATERAL subquery per query). `probes`
+    (ivfflat) or `ef_search` (HNSW) override the values recorded with the index
+    for this query only. With a quantized index, `rerank * k` candidates are
+    taken from it and re-ranked by exact distance. Returns
+    [(product_id, score), ...], or one such list per query for list input.
+    Database errors are logged and give empty results, unless `raise_errors`
+    is set (callers that must tell "no neighbours" from "query failed").
+    """
+    queries, batch = _as_queries(query)
+    if not queries:
+        return []
+    by_product = _is_product_id(queries[0])
+
+    own_conn = conn is None
+    conn = conn or get_db_connection()
+    if conn is None:
+        return [] if not batch else [[] for _ in queries]
+    results = [[] for _ in queries]
+    try:
+        plan = _search_plan(conn, kind)
+        quantization = plan.quantization if plan else None
+        # k + 1 so a product can be dropped from its own results
+        limit = k + 1 if by_product else k
+        candidates = limit * max(1, rerank) if quantization else limit
+        # The search setting is sent with the query, scoped to its transaction (one round trip)
+        setting = ""
+        if plan and plan.kind == "ivfflat":
+            setting = f"SELECT set_config('ivfflat.probes', '{int(probes or plan.probes)}', true);"
+        elif plan and plan.kind == "hnsw":
+            setting = f"SELECT set_config('hnsw.ef_search', '{int(max(ef_search or plan.ef_search, candidates))}', true);"
+        sql = _similar_sql(by_product, quantization)
+        params = {"kind": kind, "limit": limit, "candidates": candidates}
+        if by_product:
+            params["ids"] = [str(q) for q in queries]
+        else:
+            params["vectors"] = [vector_literal(q) for q in queries]
+        with conn.cursor() as cur:
+            cur.execute(setting + sql, params)
+            for ord_, product_id, score in cur.fetchall():
+                if len(results[ord_ - 1]) < k:
+                    results[ord_ - 1].append((product_id, float(score)))
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        if raise_errors:
+            raise
+        print(f"Error searching similar products: {e}")
+    finally:
+        if own_conn:
+            conn.close()
+    return results if batch else results[0]
+
 if __name__ == '__main__':
+    if sys.argv[1:2] == ["ensure-index"]:
+        # python -m src.core.vector_db_manager ensure-index [--force] [--quantization halfvec|binary|none]
+        args = sys.argv[2:]
+        quantization = args[args.index("--quantization") + 1] if "--quantization" in args else DEFAULT_QUANTIZATION
+        for kind in KINDS:
+            ensure_vector_index(kind=kind, force="--force" in args, quantization=quantization)
+        sys.exit(0)
+
     print("Testing PostgreSQL connection...")
     connection = get_db_connection()
     if connection:
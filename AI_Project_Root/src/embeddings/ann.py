@@ -0,0 +1,461 @@
+"""ann.py
+
+In-process approximate nearest-neighbour index (IVF-flat) over product embeddings.
+
+Vectors are clustered with k-means into `nlist` inverted lists; a query scores
+the centroids, then only the vectors of its `nprobe` closest lists, with NumPy
+matrix products. Queries are answered in batches list by list, so each list is
+read once per batch however many queries probe it.
+
+The main segment is stored grouped by list and persists as plain .npy files
+that are memory-mapped on load. Additions go to a small in-memory delta segment
+that is searched exactly; removals are tombstones. `compact()` folds both back
+into the main segment (retraining the centroids once the index has grown well
+past the data it was trained on).
+
+With `quantization` ("float16", "int8" or "binary", see quantization.py) the
+lists are scanned over compact in-memory codes, and the best `rerank * k`
+candidates per query are re-scored against the full float32 vectors, which
+stay memory-mapped on disk and are only read for those candidates.
+
+Usage (from AI_Project_Root):
+  python -m src.embeddings.ann build            # from product_embeddings
+  python -m src.embeddings.ann build --quantization int8
+  python -m src.embeddings.ann query <product_id>
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from src.core import config
+from src.embeddings.quantization import make_codec
+
+VECTOR_INDEX_DIR = config.DATA_DIR / "vector_index"
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 20
+# Training sample per list; k-means on more points barely moves the centroids.
+TRAIN_POINTS_PER_LIST = 256
+# compact() retrains once the index holds this many times the vectors it was trained on.
+RETRAIN_GROWTH = 4.0
+# add() compacts once the delta segment outgrows this share of the index (or DELTA_MIN_COMPACT).
+DELTA_COMPACT_RATIO = 0.1
+DELTA_MIN_COMPACT = 10000
+DEFAULT_RERANK = 4
+# Codecs are trained on at most this many vectors
+CODEC_TRAIN_SIZE = 100000
+_RERANK_BATCH = 256
+_FILES = ("centroids", "vectors", "ids", "offsets", "deleted")
+
+
+def default_nlist(n):
+    """Around sqrt(n) lists, the usual IVF starting point."""
+    return int(min(max(1, round(np.sqrt(n))), 65536))
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def kmeans(vectors, nlist, iterations=KMEANS_ITERATIONS, seed=0, spherical=True):
+    """Lloyd's k-means on (a sample of) `vectors`; returns (nlist, dim) centroids."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * TRAIN_POINTS_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)] if sample_size < len(vectors) else vectors
+    sample = np.ascontiguousarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    sample_sq = (sample ** 2).sum(axis=1) if not spherical else None
+    for _ in range(iterations):
+        if spherical:
+            assign = np.argmax(sample @ centroids.T, axis=1)
+        else:
+            dist = sample_sq[:, None] - 2 * sample @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+            assign = np.argmin(dist, axis=1)
+        counts = np.bincount(assign, minlength=nlist)
+        # Per-list sums as a sparse one-hot product, far faster than np.add.at
+        one_hot = sparse.csr_matrix((np.ones(len(sample), dtype=np.float32), (assign, np.arange(len(sample)))),
+                                    shape=(nlist, len(sample)))
+        sums = np.asarray(one_hot @ sample)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Re-seed empty lists with random points so no list stays unused
+        if empty.any():
+            centroids[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        if spherical:
+            centroids = _normalize(centroids)
+    return centroids.astype(np.float32)
+
+
+def exact_search(vectors, ids, queries, k=10):
+    """Brute-force top-k by inner product; the reference for recall measurements."""
+    scores = np.asarray(queries, dtype=np.float32) @ np.asarray(vectors, dtype=np.float32).T
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    return np.asarray(ids)[top], np.take_along_axis(top_scores, order, axis=1)
+
+
+class IVFFlatIndex:
+    """IVF-flat index with inner-product (or cosine) scoring."""
+
+    def __init__(self, dim, metric="cosine", quantization=None, rerank=DEFAULT_RERANK):
+        if metric not in ("cosine", "ip"):
+            raise ValueError(f"Unsupported metric: {metric}")
+        self.dim = dim
+        self.metric = metric
+        self.codec = make_codec(quantization, dim) if quantization else None
+        self.rerank = rerank
+        self.codes = None
+        self.centroids = None
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.ids = np.empty(0, dtype="U1")
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.deleted = np.zeros(0, dtype=bool)
+        self.trained_size = 0
+        self._delta_ids = []
+        self._delta_vectors = []
+        self._positions = None
+
+    # --- building -------------------------------------------------------
+
+    @property
+    def nlist(self):
+        return 0 if self.centroids is None else len(self.centroids)
+
+    def _prepare(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        return _normalize(vectors) if self.metric == "cosine" else vectors
+
+    def _assign(self, vectors, batch_size=65536):
+        assign = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), batch_size):
+            block = vectors[start:start + batch_size]
+            assign[start:start + batch_size] = np.argmax(block @ self.centroids.T, axis=1)
+        return assign
+
+    def _set_main(self, ids, vectors):
+        assign = self._assign(vectors)
+        order = np.argsort(assign, kind="stable")
+        self.vectors = np.ascontiguousarray(vectors[order])
+        self.ids = np.asarray(ids)[order]
+        counts = np.bincount(assign, minlength=self.nlist)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.deleted = np.zeros(len(self.ids), dtype=bool)
+        self.codes = self.codec.encode(self.vectors) if self.codec else None
+        self._positions = None
+
+    def build(self, ids, vectors, nlist=None, seed=0):
+        """Trains the lists on `vectors` and replaces the index contents."""
+        ids = np.asarray([str(i) for i in ids])
+        vectors = self._prepare(vectors)
+        if len(vectors) == 0:
+            raise ValueError("Cannot build an index from no vectors")
+        nlist = min(nlist or default_nlist(len(vectors)), len(vectors))
+        self.centroids = kmeans(vectors, nlist, seed=seed, spherical=True)
+        if self.codec:
+            rng = np.random.default_rng(seed)
+            sample = rng.choice(len(vectors), min(len(vectors), CODEC_TRAIN_SIZE), replace=False)
+            self.codec.train(vectors[np.sort(sample)])
+        self.trained_size = len(vectors)
+        self._delta_ids, self._delta_vectors = [], []
+        self._set_main(ids, vectors)
+        return self
+
+    # --- incremental updates --------------------------------------------
+
+    def _position_map(self):
+        if self._positions is None:
+            live = np.flatnonzero(~self.deleted)
+            self._positions = dict(zip(self.ids[live].tolist(), live.tolist()))
+        return self._positions
+
+    def remove(self, ids):
+        """Removes ids (tombstones in the main segment); returns how many were found."""
+        ids = {str(i) for i in ids}
+        positions = self._position_map()
+        found = [positions.pop(i) for i in ids if i in positions]
+        if found:
+            self.deleted[found] = True
+        delta_before = len(self._delta_ids)
+        if ids & set(self._delta_ids):
+            keep = [j for j, i in enumerate(self._delta_ids) if i not in ids]
+            self._delta_ids = [self._delta_ids[j] for j in keep]
+            self._delta_vectors = [self._delta_vectors[j] for j in keep]
+        return len(found) + delta_before - len(self._delta_ids)
+
+    def add(self, ids, vectors):
+        """Adds or replaces vectors; they are searchable immediately."""
+        if self.centroids is None:
+            return self.build(ids, vectors)
+        ids = [str(i) for i in ids]
+        self.remove(ids)
+        vectors = self._prepare(vectors)
+        self._delta_ids.extend(ids)
+        self._delta_vectors.extend(vectors)
+        if len(self._delta_ids) > max(DELTA_MIN_COMPACT, DELTA_COMPACT_RATIO * len(self.ids)):
+            self.compact()
+        return self
+
+    def compact(self):
+        """Merges the delta segment and drops tombstones, retraining if the index has grown a lot."""
+        live = ~self.deleted
+        ids = np.concatenate([self.ids[live], np.asarray(self._delta_ids, dtype=str)])
+        vectors = np.concatenate([np.asarray(self.vectors[live]), self._delta_matrix()])
+        self._delta_ids, self._delta_vectors = [], []
+        if len(vectors) > self.trained_size * RETRAIN_GROWTH:
+            return self.build(ids, vectors)
+        self._set_main(ids, vectors)
+        return self
+
+    def _delta_matrix(self):
+        if not self._delta_vectors:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.vstack(self._delta_vectors).astype(np.float32, copy=False)
+
+    def __len__(self):
+        return int((~self.deleted).sum()) + len(self._delta_ids)
+
+    # --- search ---------------------------------------------------------
+
+    def search(self, queries, k=10, nprobe=DEFAULT_NPROBE):
+        """
+        Batched top-k search. Returns (ids, scores), both (n_queries, k); rows
+        with fewer than k results are padded with '' and -inf.
+        """
+        queries = self._prepare(queries)
+        nq = len(queries)
+        nprobe = max(1, min(nprobe, self.nlist))
+        delta = self._delta_matrix()
+        # With codes, each list contributes rerank * k coarse candidates
+        per_list = k * self.rerank if self.codec else k
+        width = nprobe * per_list + min(per_list, len(delta))
+        cand_scores = np.full((nq, max(width, k)), -np.inf, dtype=np.float32)
+        cand_pos = np.full((nq, max(width, k)), -1, dtype=np.int64)
+        fill = np.zeros(nq, dtype=np.int64)
+
+        if self.nlist and len(self.vectors):
+            probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+            flat_lists = probes.ravel()
+            flat_queries = np.repeat(np.arange(nq), nprobe)
+            order = np.argsort(flat_lists, kind="stable")
+            flat_lists, flat_queries = flat_lists[order], flat_queries[order]
+            bounds = np.flatnonzero(np.diff(flat_lists)) + 1
+            for group in np.split(np.arange(len(flat_lists)), bounds):
+                lst = flat_lists[group[0]]
+                lo, hi = self.offsets[lst], self.offsets[lst + 1]
+                if hi == lo:
+                    continue
+                qs = flat_queries[group]
+                if self.codec:
+                    block = self.codec.score(queries[qs], self.codes[lo:hi])
+                else:
+                    block = queries[qs] @ np.asarray(self.vectors[lo:hi]).T
+                dead = self.deleted[lo:hi]
+                if dead.any():
+                    block[:, dead] = -np.inf
+                self._collect(block, lo, qs, per_list, cand_scores, cand_pos, fill)
+
+        if len(delta):
+            block = self.codec.score(queries, self.codec.encode(delta)) if self.codec else queries @ delta.T
+            self._collect(block, len(self.ids), np.arange(nq), per_list, cand_scores, cand_pos, fill)
+
+        if self.codec:
+            cand_pos, cand_scores = _top_k(cand_pos, cand_scores, min(k * self.rerank, cand_pos.shape[1]))
+            # The rerank reads the full vectors, which tombstones don't touch: drop removed
+            # and -inf candidates first so they can't be scored back to life
+            in_main = (cand_pos >= 0) & (cand_pos < len(self.ids))
+            removed = in_main & self.deleted[np.where(in_main, cand_pos, 0)]
+            cand_pos = np.where(removed | np.isneginf(cand_scores), -1, cand_pos)
+            cand_scores = self._exact_scores(queries, cand_pos, delta)
+        top_pos, top_scores = _top_k(cand_pos, cand_scores, k)
+        all_ids = np.concatenate([self.ids, np.asarray(self._delta_ids, dtype=str)])
+        if not len(all_ids):
+            return np.full(top_pos.shape, ""), top_scores
+        return np.where(top_pos >= 0, all_ids[np.maximum(top_pos, 0)], ""), top_scores
+
+    def _exact_scores(self, queries, positions, delta):
+        """Re-scores candidate positions against the full vectors (main segment or delta)."""
+        scores = np.full(positions.shape, -np.inf, dtype=np.float32)
+        n_main = len(self.ids)
+        for start in range(0, len(queries), _RERANK_BATCH):
+            pos = positions[start:start + _RERANK_BATCH]
+            rows, cols = np.nonzero(pos >= 0)
+            flat = pos[rows, cols]
+            in_main = flat < n_main
+            vectors = np.empty((len(flat), self.dim), dtype=np.float32)
+            if in_main.any():
+                # Sorted reads keep the memory-mapped gather sequential
+                wanted = flat[in_main]
+                order = np.argsort(wanted)
+                gathered = np.empty((len(wanted), self.dim), dtype=np.float32)
+                gathered[order] = self.vectors[wanted[order]]
+                vectors[in_main] = gathered
+            if (~in_main).any():
+                vectors[~in_main] = delta[flat[~in_main] - n_main]
+            scores[start + rows, cols] = np.einsum("ij,ij->i", vectors, queries[start + rows])
+        return scores
+
+    @staticmethod
+    def _collect(block, base, qs, k, cand_scores, cand_pos, fill):
+        kk = min(k, block.shape[1])
+        top = np.argpartition(-block, kk - 1, axis=1)[:, :kk]
+        slots = fill[qs, None] + np.arange(kk)
+        scores = np.take_along_axis(block, top, axis=1)
+        cand_scores[qs[:, None], slots] = scores
+        # Tombstoned entries score -inf; keep them out of the candidates so they pad as ''
+        cand_pos[qs[:, None], slots] = np.where(np.isneginf(scores), -1, top + base)
+        fill[qs] += kk
+
+    # --- persistence ----------------------------------------------------
+
+    def save(self, path=None):
+        """Compacts and writes the index as .npy files plus meta.json."""
+        path = Path(path or VECTOR_INDEX_DIR)
+        self.compact()
+        path.mkdir(parents=True, exist_ok=True)
+        for name in _FILES:
+            np.save(path / f"{name}.npy", np.asarray(getattr(self, name)))
+        if self.codec:
+            np.save(path / "codes.npy", self.codes)
+            np.savez(path / "codec.npz", **self.codec.state())
+        meta = {"dim": self.dim, "metric": self.metric, "nlist": self.nlist,
+                "size": len(self.ids), "trained_size": self.trained_size,
+                "quantization": self.codec.name if self.codec else None, "rerank": self.rerank}
+        with open(path / "meta.json", "w") as f:
+            json.dump(meta, f, indent=2)
+        return path
+
+    @classmethod
+    def load(cls, path=None, mmap=True):
+        """
+        Loads a saved index; vectors are memory-mapped unless `mmap=False`.
+        Quantized codes are read into memory since every search scans them.
+        """
+        path = Path(path or VECTOR_INDEX_DIR)
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+        index = cls(meta["dim"], meta["metric"], meta.get("quantization"), meta.get("rerank", DEFAULT_RERANK))
+        for name in _FILES:
+            mode = "r" if mmap and name == "vectors" else None
+            setattr(index, name, np.load(path / f"{name}.npy", mmap_mode=mode))
+        index.deleted = np.array(index.deleted)  # small, and updated in place
+        if index.codec:
+            index.codes = np.load(path / "codes.npy")
+            with np.load(path / "codec.npz") as state:
+                index.codec.load_state({key: state[key] for key in state.files})
+        index.trained_size = meta["trained_size"]
+        return index
+
+    def memory_bytes(self):
+        """Bytes scanned per search pass: the codes if quantized, else the float32 vectors."""
+        return self.codes.nbytes if self.codec else int(np.prod(self.vectors.shape)) * 4
+
+
+def _top_k(positions, scores, k):
+    """Per-row top-k of a candidate matrix, sorted by descending score."""
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top_pos = np.take_along_axis(np.take_along_axis(positions, top, axis=1), order, axis=1)
+    return top_pos, np.take_along_axis(top_scores, order, axis=1)
+
+
+def find_near_duplicates(index, ids, vectors, threshold=0.97, k=5, nprobe=DEFAULT_NPROBE):
+    """
+    Returns (id, other_id, score) for indexed vectors scoring at least `threshold`
+    against each of `vectors` (e.g. a freshly imported batch), ignoring self-matches.
+    """
+    result_ids, scores = index.search(vectors, k=k + 1, nprobe=nprobe)
+    pairs = []
+    for own, row_ids, row_scores in zip((str(i) for i in ids), result_ids, scores):
+        for other, score in zip(row_ids, row_scores):
+            if other and other != own and score >= threshold:
+                pairs.append((own, str(other), float(score)))
+    return pairs
+
+
+def load_product_embeddings(conn, kind="product", model=None, batch_size=10000):
+    """
+    Streams `product_embeddings` rows of one kind ("product" or "chunk") into (ids, matrix).
+
+    Product vectors are keyed by product id, chunks by '<product_id>#<chunk_index>'.
+    """
+    sql = """SELECT product_id::text || CASE WHEN metadata->>'kind' = 'chunk'
+                    THEN '#' || (metadata->>'chunk_index') ELSE '' END,
+                    embedding::real[]
+             FROM product_embeddings
+             WHERE COALESCE(metadata->>'kind', 'product') = %s"""
+    params = [kind]
+    if model:
+        sql += " AND model = %s"
+        params.append(model)
+    ids, blocks = [], []
+    with conn.cursor(name="product_embeddings_scan") as cursor:
+        cursor.itersize = batch_size
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            ids.extend(row[0] for row in rows)
+            blocks.append(np.asarray([row[1] for row in rows], dtype=np.float32))
+    conn.commit()
+    return ids, (np.vstack(blocks) if blocks else np.empty((0, 0), dtype=np.float32))
+
+
+def main():
+    from src.core.vector_db_manager import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Local IVF-flat index over product_embeddings")
+    parser.add_argument("command", choices=("build", "query"))
+    parser.add_argument("product_id", nargs="?")
+    parser.add_argument("--path", default=str(VECTOR_INDEX_DIR))
+    parser.add_argument("--kind", default="product", choices=("product", "chunk"))
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--quantization", choices=("float16", "int8", "binary"), default=None,
+                        help="Scan compact codes and re-rank on the full vectors (build only)")
+    parser.add_argument("--rerank", type=int, default=DEFAULT_RERANK)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        conn = get_db_connection()
+        if conn is None:
+            return
+        try:
+            start = time.perf_counter()
+            ids, vectors = load_product_embeddings(conn, args.kind)
+        finally:
+            conn.close()
+        if not ids:
+            print("No embeddings found.")
+            return
+        loaded = time.perf_counter()
+        index = IVFFlatIndex(vectors.shape[1], quantization=args.quantization, rerank=args.rerank)
+        index.build(ids, vectors, nlist=args.nlist)
+        index.save(args.path)
+        print(f"Indexed {len(index)} vectors in {index.nlist} lists, {index.memory_bytes() / 1e6:.1f} MB scanned "
+              f"(load {loaded - start:.2f}s, build {time.perf_counter() - loaded:.2f}s) -> {args.path}")
+    else:
+        index = IVFFlatIndex.load(args.path)
+        index.rerank = args.rerank
+        positions = np.flatnonzero(index.ids == args.product_id)
+        if not len(positions):
+            print(f"{args.product_id} is not in the index")
+            return
+        result_ids, scores = index.search(index.vectors[positions[:1]], k=args.k + 1, nprobe=args.nprobe)
+        for other, score in zip(result_ids[0], scores[0]):
+            if other and other != args.product_id:
+                print(f"{score:.4f}  {other}")
+
+
+if __name__ == "__main__":
+    main()
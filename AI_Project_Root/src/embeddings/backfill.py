@@ -0,0 +1,163 @@
+"""backfill.py
+
+Set-based backfill of `products.embedding` for rows that don't have one yet.
+
+Missing rows are paged by keyset (`id > last_id ORDER BY id`), so every page is
+an index range scan regardless of how far the run has got. Each page is
+embedded in one batch and written back in one transaction: a COPY into a temp
+table joined to `products` by a single UPDATE. Fetching, embedding and writing
+overlap on the ingest pipeline's worker threads.
+
+The last committed id is checkpointed to a JSON file so an interrupted run
+resumes where it stopped; a completed run clears it. On large tables a partial
+index keeps the page query cheap:
+
+    CREATE INDEX products_missing_embedding_idx ON products (id) WHERE embedding IS NULL;
+"""
+import csv
+import io
+import json
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from src.core import config
+from src.ingest.pipeline import run_pipeline
+from src.ingest.products import embed_chunk
+from src.ingest.staging import vector_literal
+
+BACKFILL_CHECKPOINT_PATH = config.DATA_DIR / "embedding_backfill.json"
+DEFAULT_PAGE_SIZE = 1000
+
+_FIRST_PAGE_SQL = """SELECT id, product_name FROM products
+                     WHERE embedding IS NULL ORDER BY id LIMIT %s"""
+_NEXT_PAGE_SQL = """SELECT id, product_name FROM products
+                    WHERE embedding IS NULL AND id > %s ORDER BY id LIMIT %s"""
+_CREATE_TEMP_SQL = """CREATE TEMP TABLE embedding_backfill ON COMMIT DROP AS
+                      SELECT id, embedding FROM products WITH NO DATA"""
+_COPY_TEMP_SQL = "COPY embedding_backfill (id, embedding) FROM STDIN WITH (FORMAT csv)"
+# Rows filled in by another writer since the page was read are left alone.
+_UPDATE_SQL = """UPDATE products p SET embedding = b.embedding
+                 FROM embedding_backfill b
+                 WHERE p.id = b.id AND p.embedding IS NULL"""
+
+
+class BackfillCheckpoint:
+    """Last committed product id of a backfill run, stored per model in a JSON file."""
+
+    def __init__(self, model_name, path=None):
+        self.model_name = model_name
+        self.path = path or BACKFILL_CHECKPOINT_PATH
+
+    def _read_all(self):
+        if not self.path.exists():
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def load(self):
+        """Returns (last_id, rows_done); last_id is None when starting fresh."""
+        state = self._read_all().get(self.model_name, {})
+        return state.get("last_id"), state.get("rows", 0)
+
+    def save(self, last_id, rows):
+        states = self._read_all()
+        states[self.model_name] = {
+            "last_id": last_id,
+            "rows": rows,
+            "updated_at": datetime.utcnow().isoformat() + "Z",
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(states, f, indent=2)
+        tmp.replace(self.path)
+
+    def reset(self):
+        states = self._read_all()
+        if states.pop(self.model_name, None) is not None:
+            with open(self.path, "w") as f:
+                json.dump(states, f, indent=2)
+
+
+def iter_missing_pages(conn, page_size=DEFAULT_PAGE_SIZE, after_id=None, limit=None):
+    """
+    Yields DataFrames (id, product_name) of products without an embedding, in id order.
+    """
+    fetched = 0
+    while limit is None or fetched < limit:
+        size = page_size if limit is None else min(page_size, limit - fetched)
+        with conn.cursor() as cursor:
+            if after_id is None:
+                cursor.execute(_FIRST_PAGE_SQL, (size,))
+            else:
+                cursor.execute(_NEXT_PAGE_SQL, (after_id, size))
+            rows = cursor.fetchall()
+        conn.commit()  # don't hold a snapshot open between pages
+        if not rows:
+            return
+        fetched += len(rows)
+        after_id = rows[-1][0]
+        yield pd.DataFrame(rows, columns=["id", "product_name"])
+
+
+def write_page(conn, page):
+    """Writes a page's embeddings with one COPY + UPDATE; returns the rows updated."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for product_id, embedding in zip(page["id"], page["embedding"]):
+        writer.writerow((product_id, vector_literal(embedding)))
+    buf.seek(0)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(_CREATE_TEMP_SQL)
+            cursor.copy_expert(_COPY_TEMP_SQL, buf)
+            cursor.execute(_UPDATE_SQL)
+            updated = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return updated
+
+
+def run_backfill(read_conn, write_conn, embedding_generator, page_size=DEFAULT_PAGE_SIZE,
+                 checkpoint=None, restart=False, limit=None, queue_size=2, report_every=10):
+    """
+    Embeds every product with a NULL embedding and returns the PipelineStats.
+
+    `read_conn` and `write_conn` must be separate connections since paging and
+    writing run on different threads. With a checkpoint, the run resumes after
+    the last committed id unless `restart` is set.
+    """
+    after_id, done = (None, 0) if checkpoint is None or restart else checkpoint.load()
+    if after_id is not None:
+        print(f"Resuming backfill after id {after_id} ({done} rows done previously)")
+
+    progress = {"rows": 0, "pages": 0, "start": time.perf_counter()}
+
+    def write(page):
+        progress["rows"] += write_page(write_conn, page)
+        progress["pages"] += 1
+        last_id = page["id"].tolist()[-1]  # a plain Python value for JSON and psycopg2
+        if checkpoint is not None:
+            checkpoint.save(last_id, done + progress["rows"])
+        if progress["pages"] % report_every == 0:
+            elapsed = time.perf_counter() - progress["start"]
+            print(f"Backfilled {progress['rows']} rows ({progress['rows'] / elapsed:.1f} rows/s), "
+                  f"last id {last_id}")
+        return page
+
+    stages = [
+        ("embed", lambda page: embed_chunk(page, embedding_generator)),
+        ("write", write),
+    ]
+    pages = iter_missing_pages(read_conn, page_size, after_id, limit)
+    stats = run_pipeline(pages, stages, queue_size=queue_size)
+
+    if checkpoint is not None and limit is None:
+        checkpoint.reset()
+    print(f"Backfill finished: {progress['rows']} embeddings written in {progress['pages']} pages")
+    print(stats.summary())
+    return stats
@@ -0,0 +1,232 @@
+"""cache.py
+
+Persistent, content-addressed embedding cache.
+
+Embeddings are keyed by a hash of (model name, text), so unchanged product text
+is never re-encoded across re-imports or reruns, while switching models never
+returns a stale vector. Two stores share one interface:
+
+- SQLiteEmbeddingStore: a local file, the default for a single machine
+- PostgresEmbeddingStore: the `embedding_cache` table (migrations/009) shared by workers
+
+Both evict least-recently-used entries once the stored vectors exceed `max_bytes`.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+
+from src.core import config
+
+EMBEDDING_CACHE_PATH = config.DATA_DIR / "embedding_cache.db"
+DEFAULT_MAX_BYTES = int(float(os.environ.get("EMBEDDING_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+# After an eviction the cache is trimmed to this fraction of max_bytes.
+EVICT_TARGET = 0.9
+_LOOKUP_BATCH = 900
+
+_EVICT_SQL = """DELETE FROM embedding_cache WHERE cache_key IN (
+    SELECT cache_key FROM (
+        SELECT cache_key, SUM(size_bytes) OVER (ORDER BY last_used, cache_key) AS running
+        FROM embedding_cache
+    ) oldest WHERE running <= {param}
+)"""
+
+
+def cache_key(model, text):
+    """Content address for a (model, text) pair."""
+    return hashlib.blake2b(f"{model}\x00{text}".encode("utf-8"), digest_size=20).hexdigest()
+
+
+def _to_blob(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def _from_blob(blob, dim):
+    return np.frombuffer(bytes(blob), dtype=np.float32, count=dim)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evicted: int = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self):
+        return (f"embedding cache: {self.hits} hits, {self.misses} misses "
+                f"({self.hit_rate:.1%} hit rate), {self.writes} written, {self.evicted} evicted")
+
+
+class SQLiteEmbeddingStore:
+    """Embedding cache in a local SQLite file."""
+
+    def __init__(self, path=None):
+        self.path = path or EMBEDDING_CACHE_PATH
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Called from pipeline and request threads; EmbeddingCache serializes access.
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            cache_key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            dim INTEGER NOT NULL,
+            vector BLOB NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            last_used REAL NOT NULL
+        )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embedding_cache_last_used_idx ON embedding_cache (last_used)")
+        self.conn.commit()
+
+    def get_many(self, keys):
+        found = {}
+        for start in range(0, len(keys), _LOOKUP_BATCH):
+            batch = keys[start:start + _LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT cache_key, dim, vector FROM embedding_cache WHERE cache_key IN ({placeholders})", batch
+            ).fetchall()
+            found.update((key, _from_blob(blob, dim)) for key, dim, blob in rows)
+        if found:
+            now = time.time()
+            self.conn.executemany("UPDATE embedding_cache SET last_used = ? WHERE cache_key = ?",
+                                  ((now, key) for key in found))
+            self.conn.commit()
+        return found
+
+    def put_many(self, items):
+        """Stores (key, model, vector) items; returns the number of bytes added."""
+        now = time.time()
+        rows = [(key, model, len(vector), _to_blob(vector), len(vector) * 4, now) for key, model, vector in items]
+        before = self.conn.total_changes
+        self.conn.executemany(
+            """INSERT INTO embedding_cache (cache_key, model, dim, vector, size_bytes, last_used)
+               VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (cache_key) DO NOTHING""", rows)
+        self.conn.commit()
+        return (self.conn.total_changes - before) * (rows[0][4] if rows else 0)
+
+    def total_bytes(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM embedding_cache").fetchone()[0]
+
+    def evict(self, bytes_to_free):
+        cursor = self.conn.execute(_EVICT_SQL.format(param="?"), (bytes_to_free,))
+        self.conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        self.conn.close()
+
+
+class PostgresEmbeddingStore:
+    """Embedding cache in the Postgres `embedding_cache` table (migrations/009)."""
+
+    def __init__(self, dsn=None):
+        self.conn = psycopg2.connect(dsn or os.environ.get("DATABASE_URL"))
+
+    def get_many(self, keys):
+        found = {}
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """UPDATE embedding_cache SET last_used = now()
+                   WHERE cache_key = ANY(%s) RETURNING cache_key, dim, vector""", (list(keys),))
+            found.update((key, _from_blob(blob, dim)) for key, dim, blob in cur.fetchall())
+        self.conn.commit()
+        return found
+
+    def put_many(self, items):
+        rows = [(key, model, len(vector), _to_blob(vector), len(vector) * 4) for key, model, vector in items]
+        with self.conn.cursor() as cur:
+            execute_values(
+                cur,
+                """INSERT INTO embedding_cache (cache_key, model, dim, vector, size_bytes) VALUES %s
+                   ON CONFLICT (cache_key) DO NOTHING""",
+                rows, page_size=max(len(rows), 1))
+            added = cur.rowcount * (rows[0][4] if rows else 0)
+        self.conn.commit()
+        return max(added, 0)
+
+    def total_bytes(self):
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM embedding_cache")
+            return cur.fetchone()[0]
+
+    def evict(self, bytes_to_free):
+        with self.conn.cursor() as cur:
+            cur.execute(_EVICT_SQL.format(param="%s"), (bytes_to_free,))
+            removed = cur.rowcount
+        self.conn.commit()
+        return removed
+
+    def close(self):
+        self.conn.close()
+
+
+class EmbeddingCache:
+    """
+    Model-scoped view over an embedding store with size-based LRU eviction.
+
+    Safe to share between threads: store calls are serialized on one lock, since
+    each store runs its statements and commits on a single connection.
+    """
+
+    def __init__(self, store, model_name, max_bytes=DEFAULT_MAX_BYTES):
+        self.store = store
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        # Running estimate; the store is only asked for the exact size when this overflows.
+        self._bytes = store.total_bytes()
+
+    def get_many(self, texts):
+        """Returns {text: vector} for the texts already cached."""
+        keys = {cache_key(self.model_name, text): text for text in texts}
+        with self._lock:
+            found = self.store.get_many(list(keys))
+            self.stats.hits += len(found)
+            self.stats.misses += len(keys) - len(found)
+        return {keys[key]: vector for key, vector in found.items()}
+
+    def put_many(self, texts, vectors):
+        items = [(cache_key(self.model_name, text), self.model_name, vector) for text, vector in zip(texts, vectors)]
+        if not items:
+            return
+        with self._lock:
+            self._bytes += self.store.put_many(items)
+            self.stats.writes += len(items)
+            if self._bytes > self.max_bytes:
+                self._bytes = self.store.total_bytes()
+                if self._bytes > self.max_bytes:
+                    to_free = self._bytes - int(self.max_bytes * EVICT_TARGET)
+                    self.stats.evicted += self.store.evict(to_free)
+                    self._bytes = self.store.total_bytes()
+
+    def close(self):
+        with self._lock:
+            self.store.close()
+
+
+def load_cache(model_name, kind=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Opens the cache selected by `kind` or the EMBEDDING_CACHE environment variable:
+    "sqlite" (default), "postgres" or "none" (returns None).
+    """
+    kind = kind or os.environ.get("EMBEDDING_CACHE", "sqlite")
+    if kind == "none":
+        return None
+    if kind == "sqlite":
+        return EmbeddingCache(SQLiteEmbeddingStore(), model_name, max_bytes)
+    if kind == "postgres":
+        return EmbeddingCache(PostgresEmbeddingStore(), model_name, max_bytes)
+    raise ValueError(f"Unknown embedding cache: {kind}")
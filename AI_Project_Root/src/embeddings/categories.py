@@ -0,0 +1,151 @@
+"""categories.py
+
+Semantic category classifier built from `data/raw/aliases.json`, which maps
+each category to example search phrases.
+
+The phrases are embedded once. Each category keeps a centroid (the
+normalized mean of its phrases) and its exemplar vectors, all stacked into
+one matrix, so a batch of titles or queries is scored against every
+category with a single matrix multiply. A category's score blends its
+centroid similarity, which captures the broad topic, with its best
+exemplar similarity, which catches phrasings close to one specific example.
+
+The matrices are saved to models/category_classifier.npz together with the
+embedding model name and a hash of the aliases file, and are rebuilt only
+when either changes.
+"""
+import hashlib
+import json
+
+import numpy as np
+
+from src.core import config
+
+ALIASES_PATH = config.RAW_DATA_DIR / "aliases.json"
+CLASSIFIER_PATH = config.MODELS_DIR / "category_classifier.npz"
+# Weight of the centroid similarity; the rest goes to the nearest exemplar.
+CENTROID_WEIGHT = 0.5
+# Below this blended cosine score a text is left uncategorized.
+DEFAULT_MIN_SCORE = 0.35
+
+
+def load_aliases(path=ALIASES_PATH):
+    """
+    Reads the aliases file into {category: [phrases]}.
+
+    The file is a sequence of JSON objects rather than a single document, and a
+    category may appear in several of them; phrases are merged and de-duplicated.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    decoder = json.JSONDecoder()
+    aliases, pos = {}, 0
+    while True:
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+        if pos >= len(text):
+            break
+        obj, pos = decoder.raw_decode(text, pos)
+        for category, phrases in obj.items():
+            merged = aliases.setdefault(category, [])
+            merged.extend(p.strip() for p in phrases if p.strip() and p.strip() not in merged)
+    return aliases
+
+
+def _file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class CategoryClassifier:
+    def __init__(self, categories, centroids, exemplars, exemplar_labels, model_name=None, source_hash=None,
+                 embed=None):
+        self.categories = list(categories)
+        self.embed = embed
+        self.model_name = model_name
+        self.source_hash = source_hash
+        order = np.argsort(exemplar_labels, kind="stable")
+        self.exemplar_labels = np.asarray(exemplar_labels)[order]
+        # Exemplars are grouped by category so per-category maxima are one reduceat
+        self._starts = np.searchsorted(self.exemplar_labels, np.arange(len(self.categories)))
+        self.centroids = _normalize(centroids)
+        self.exemplars = _normalize(np.asarray(exemplars)[order])
+        self._matrix = np.vstack([self.centroids, self.exemplars]).T.copy()
+
+    @classmethod
+    def build(cls, aliases, embed, model_name=None, source_hash=None):
+        """Embeds every phrase (one batch) and derives the centroid of each category."""
+        categories = [c for c, phrases in aliases.items() if phrases]
+        phrases = [p for c in categories for p in aliases[c]]
+        labels = np.repeat(np.arange(len(categories)), [len(aliases[c]) for c in categories])
+        vectors = _normalize(embed(phrases))
+        centroids = np.stack([vectors[labels == i].mean(axis=0) for i in range(len(categories))])
+        return cls(categories, centroids, vectors, labels, model_name, source_hash, embed)
+
+    def save(self, path=CLASSIFIER_PATH):
+        np.savez(path, categories=np.array(self.categories), centroids=self.centroids,
+                 exemplars=self.exemplars, exemplar_labels=self.exemplar_labels,
+                 model_name=np.array(self.model_name or ""), source_hash=np.array(self.source_hash or ""))
+        return path
+
+    @classmethod
+    def load(cls, path=CLASSIFIER_PATH):
+        with np.load(path) as data:
+            return cls(data["categories"].tolist(), data["centroids"], data["exemplars"], data["exemplar_labels"],
+                       str(data["model_name"]) or None, str(data["source_hash"]) or None)
+
+    @classmethod
+    def load_or_build(cls, embed, model_name, aliases_path=ALIASES_PATH, path=CLASSIFIER_PATH):
+        """Loads the saved matrices if they match the aliases file and model; otherwise builds and saves them."""
+        source_hash = _file_hash(aliases_path)
+        try:
+            classifier = cls.load(path)
+            if classifier.model_name == model_name and classifier.source_hash == source_hash:
+                classifier.embed = embed
+                return classifier
+        except (OSError, KeyError, ValueError):
+            pass
+        classifier = cls.build(load_aliases(aliases_path), embed, model_name, source_hash)
+        classifier.save(path)
+        print(f"Category classifier built: {len(classifier.categories)} categories, "
+              f"{len(classifier.exemplars)} phrases -> {path}")
+        return classifier
+
+    def scores(self, vectors):
+        """(n, categories) blended similarity of each vector to each category."""
+        sims = _normalize(vectors) @ self._matrix
+        n_categories = len(self.categories)
+        best_exemplar = np.maximum.reduceat(sims[:, n_categories:], self._starts, axis=1)
+        return CENTROID_WEIGHT * sims[:, :n_categories] + (1 - CENTROID_WEIGHT) * best_exemplar
+
+    def classify_vectors(self, vectors, min_score=DEFAULT_MIN_SCORE):
+        """[(category or None, score)] for each vector."""
+        if not len(vectors):
+            return []
+        scores = self.scores(vectors)
+        best = scores.argmax(axis=1)
+        best_scores = scores[np.arange(len(best)), best]
+        return [(self.categories[i] if s >= min_score else None, float(s)) for i, s in zip(best, best_scores)]
+
+    def classify(self, texts, min_score=DEFAULT_MIN_SCORE):
+        """Embeds `texts` in one batch and classifies them."""
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.classify_vectors(self.embed(texts), min_score)
+
+
+def load_category_classifier(generator, path=CLASSIFIER_PATH):
+    """
+    Classifier backed by an EmbeddingGenerator, or None for the placeholder
+    backend (its constant vectors can't tell categories apart).
+    """
+    if generator.backend.name == "placeholder":
+        return None
+    return CategoryClassifier.load_or_build(
+        lambda texts: generator.generate_embeddings(texts, as_numpy=True), generator.backend.name, path=path)
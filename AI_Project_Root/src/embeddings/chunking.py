@@ -0,0 +1,181 @@
+"""chunking.py
+
+HTML-aware chunking of product text for embedding.
+
+Shopify `body_html` is stripped to plain text with a few precompiled regexes
+(block-level tags become line breaks, scripts and styles are dropped) and split
+on line and sentence boundaries into overlapping chunks that fit a token
+budget, so long spec-sheet bodies are embedded in full rather than truncated by
+the model. Every chunk is prefixed with the product title so it still reads as
+a description of that product on its own.
+
+Chunk vectors are stored as one `product_embeddings` row each (metadata kind
+"chunk"), next to a mean-pooled product vector (kind "product") for queries
+that only need one vector per product.
+"""
+import html
+import json
+import re
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.ingest.staging import vector_literal
+
+DEFAULT_MAX_TOKENS = 256
+DEFAULT_OVERLAP_TOKENS = 32
+# The title prefix never takes more than this share of a chunk's budget.
+MAX_TITLE_SHARE = 0.5
+
+_DROP_RE = re.compile(r"<(script|style|noscript)\b.*?</\1\s*>|<!--.*?-->", re.I | re.S)
+_BLOCK_RE = re.compile(
+    r"<\s*/?\s*(?:p|div|br|hr|li|ul|ol|tr|table|thead|tbody|h[1-6]|section|article|blockquote|pre|dt|dd)\b[^>]*>",
+    re.I)
+_CELL_END_RE = re.compile(r"<\s*/\s*(?:td|th)\s*>", re.I)
+_TAG_RE = re.compile(r"<[^>]*>")
+_SPACE_RE = re.compile(r"[^\S\n]+")
+_NEWLINES_RE = re.compile(r"\s*\n\s*")
+_LINE_RE = re.compile(r"[^\n]+")
+_SENTENCE_RE = re.compile(r"\S.*?(?:[.!?]+(?=\s)|$)")
+_WORD_RE = re.compile(r"\S+")
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def html_to_text(body_html):
+    """Strips HTML to plain text, keeping block boundaries as line breaks."""
+    if not body_html:
+        return ""
+    text = _DROP_RE.sub(" ", body_html)
+    text = _BLOCK_RE.sub("\n", text)
+    text = _CELL_END_RE.sub(" | ", text)
+    text = html.unescape(_TAG_RE.sub(" ", text))
+    text = _SPACE_RE.sub(" ", text)
+    return _NEWLINES_RE.sub("\n", text).strip()
+
+
+def estimate_tokens(text):
+    """
+    Approximate token count (words and punctuation marks).
+
+    Close to subword tokenizers for English product copy; pass a model's own
+    counter to `chunk_product` where exact budgets matter.
+    """
+    return len(_TOKEN_RE.findall(text))
+
+
+@dataclass
+class Chunk:
+    index: int
+    text: str
+    char_start: int
+    char_end: int
+    tokens: int
+
+    def metadata(self, chunk_count):
+        return {
+            "kind": "chunk",
+            "chunk_index": self.index,
+            "chunk_count": chunk_count,
+            "char_start": self.char_start,
+            "char_end": self.char_end,
+            "tokens": self.tokens,
+            "text": self.text,
+        }
+
+
+def _segments(text, budget, count_tokens):
+    """Yields (start, end, tokens) for each sentence, splitting any over budget by words."""
+    for line in _LINE_RE.finditer(text):
+        for sentence in _SENTENCE_RE.finditer(line.group()):
+            start = line.start() + sentence.start()
+            end = line.start() + sentence.end()
+            tokens = count_tokens(sentence.group())
+            if tokens <= budget:
+                yield start, end, tokens
+                continue
+            # A single run-on sentence (or a table flattened to one line)
+            piece_start = piece_end = None
+            piece_tokens = 0
+            for word in _WORD_RE.finditer(text, start, end):
+                word_tokens = count_tokens(word.group())
+                if piece_start is not None and piece_tokens + word_tokens > budget:
+                    yield piece_start, piece_end, piece_tokens
+                    piece_start, piece_tokens = None, 0
+                if piece_start is None:
+                    piece_start = word.start()
+                piece_end = word.end()
+                piece_tokens += word_tokens
+            if piece_start is not None:
+                yield piece_start, piece_end, piece_tokens
+
+
+def chunk_text(text, max_tokens=DEFAULT_MAX_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS,
+               count_tokens=estimate_tokens):
+    """
+    Packs whole sentences into chunks of at most `max_tokens`; consecutive chunks
+    share up to `overlap_tokens` of trailing sentences. Returns (start, end, tokens)
+    character spans into `text`.
+    """
+    spans = []
+    current, current_tokens = [], 0
+    for segment in _segments(text, max_tokens, count_tokens):
+        if current and current_tokens + segment[2] > max_tokens:
+            spans.append((current[0][0], current[-1][1], current_tokens))
+            # Carry the trailing sentences that fit the overlap into the next chunk
+            keep, kept = [], 0
+            for previous in reversed(current):
+                if kept + previous[2] > overlap_tokens:
+                    break
+                keep.insert(0, previous)
+                kept += previous[2]
+            while keep and kept + segment[2] > max_tokens:
+                kept -= keep.pop(0)[2]
+            current, current_tokens = keep, kept
+        current.append(segment)
+        current_tokens += segment[2]
+    if current:
+        spans.append((current[0][0], current[-1][1], current_tokens))
+    return spans
+
+
+def chunk_product(title, body_html, max_tokens=DEFAULT_MAX_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS,
+                  count_tokens=estimate_tokens):
+    """
+    Splits a product into title-prefixed chunks of at most `max_tokens` tokens.
+
+    Character offsets refer to the HTML-stripped body. A product without a body
+    yields a single title-only chunk.
+    """
+    title = (title or "").strip()
+    body = html_to_text(body_html)
+    title_tokens = count_tokens(title)
+    budget = max(max_tokens - title_tokens, int(max_tokens * (1 - MAX_TITLE_SHARE)))
+    spans = chunk_text(body, budget, min(overlap_tokens, budget // 2), count_tokens) if body else []
+    if not spans:
+        return [Chunk(0, title, 0, 0, title_tokens)]
+    return [
+        Chunk(i, f"{title}\n{body[start:end]}" if title else body[start:end], start, end, title_tokens + tokens)
+        for i, (start, end, tokens) in enumerate(spans)
+    ]
+
+
+def mean_pool(vectors):
+    """Mean of the chunk vectors, L2-normalized so it is comparable with them."""
+    pooled = np.asarray(vectors, dtype=np.float32).mean(axis=0)
+    norm = np.linalg.norm(pooled)
+    return pooled / norm if norm else pooled
+
+
+def product_embedding_rows(product_id, chunks, vectors, model, source):
+    """
+    Rows (product_id, vector literal, model, metadata json) for `product_embeddings`:
+    one per chunk plus the mean-pooled product vector.
+    """
+    base = {"source": source, "product_id": str(product_id)}
+    rows = [
+        (str(product_id), vector_literal(vector), model, json.dumps({**base, **chunk.metadata(len(chunks))}))
+        for chunk, vector in zip(chunks, vectors)
+    ]
+    product_meta = {**base, "kind": "product", "pooling": "mean", "chunk_count": len(chunks)}
+    rows.append((str(product_id), vector_literal(mean_pool(vectors)), model, json.dumps(product_meta)))
+    return rows
@@ -0,0 +1,278 @@
+"""jobs.py
+
+Postgres-backed embedding job queue (the `embedding_jobs` table, migrations/007).
+
+Ingest paths enqueue product ids in bulk. Any number of worker processes, on
+any number of machines, claim pending jobs in batches with
+`FOR UPDATE SKIP LOCKED`, so two workers never receive the same job. A claimed
+job holds a lease (`locked_until`); if its worker dies the lease expires and
+the next sweep puts the job back in the queue.
+Results are only written while the worker still owns the job, so a job whose
+lease was taken over is never written twice. Failed jobs are retried with
+exponential backoff until `max_attempts`, then marked failed.
+
+Usage (from AI_Project_Root):
+  python embedding_worker.py --processes 4 --drain
+"""
+import os
+import socket
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from src.embeddings.chunking import chunk_product, product_embedding_rows
+
+DEFAULT_CLAIM_SIZE = 64
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_POLL_INTERVAL = 5.0
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+# How often each worker looks for expired leases
+SWEEP_INTERVAL = 60.0
+
+Job = namedtuple("Job", "id product_id attempts")
+
+_ENQUEUE_SQL = """INSERT INTO embedding_jobs (product_id)
+                  SELECT DISTINCT unnest(%s::uuid[])
+                  ON CONFLICT (product_id) WHERE status IN ('pending', 'in_progress')
+                  DO UPDATE SET requeued = (embedding_jobs.status = 'in_progress'), updated_at = now()"""
+
+_ENQUEUE_MISSING_SQL = """INSERT INTO embedding_jobs (product_id)
+                          SELECT p.id FROM products p
+                          WHERE NOT EXISTS (SELECT 1 FROM product_embeddings pe WHERE pe.product_id = p.id)
+                          ON CONFLICT (product_id) WHERE status IN ('pending', 'in_progress') DO NOTHING"""
+
+_CLAIM_SQL = """WITH next AS (
+                    SELECT id FROM embedding_jobs
+                    WHERE status = 'pending' AND run_after <= now()
+                    ORDER BY id
+                    LIMIT %(limit)s
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE embedding_jobs j
+                SET status = 'in_progress', attempts = j.attempts + 1, locked_by = %(worker)s,
+                    locked_until = now() + make_interval(secs => %(lease)s), updated_at = now()
+                FROM next WHERE j.id = next.id
+                RETURNING j.id, j.product_id::text, j.attempts"""
+
+# Ownership check: only jobs this worker still holds are finished.
+_COMPLETE_SQL = """UPDATE embedding_jobs
+                   SET status = CASE WHEN requeued THEN 'pending' ELSE 'done' END,
+                       attempts = CASE WHEN requeued THEN 0 ELSE attempts END,
+                       requeued = false, locked_by = NULL, locked_until = NULL,
+                       last_error = NULL, updated_at = now()
+                   WHERE id = ANY(%(ids)s) AND status = 'in_progress' AND locked_by = %(worker)s
+                   RETURNING id, product_id::text"""
+
+_RETRY_SET_SQL = """status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END,
+                    run_after = now() + make_interval(secs => LEAST(
+                        %(base)s * power(2, GREATEST(attempts - 1, 0)), %(cap)s) * (0.75 + random() / 2)),
+                    locked_by = NULL, locked_until = NULL, updated_at = now()"""
+
+_FAIL_SQL = f"""UPDATE embedding_jobs SET {_RETRY_SET_SQL}, last_error = %(error)s
+                WHERE id = ANY(%(ids)s) AND status = 'in_progress' AND locked_by = %(worker)s"""
+
+_RELEASE_STALE_SQL = f"""UPDATE embedding_jobs
+                         SET {_RETRY_SET_SQL}, last_error = 'lease expired (' || COALESCE(locked_by, '?') || ')'
+                         WHERE status = 'in_progress' AND locked_until < now()"""
+
+_PRODUCTS_SQL = "SELECT id::text, title, body_html FROM products WHERE id = ANY(%s::uuid[])"
+_DELETE_EMBEDDINGS_SQL = "DELETE FROM product_embeddings WHERE product_id = ANY(%s::uuid[]) AND model = %s"
+_INSERT_EMBEDDINGS_SQL = "INSERT INTO product_embeddings (product_id, embedding, model, metadata) VALUES %s"
+
+
+class EmbeddingJobQueue:
+    """Operations on the `embedding_jobs` table over one connection."""
+
+    def __init__(self, conn, lease_seconds=DEFAULT_LEASE_SECONDS,
+                 backoff_base=BACKOFF_BASE_SECONDS, backoff_max=BACKOFF_MAX_SECONDS):
+        self.conn = conn
+        self.lease_seconds = lease_seconds
+        self.backoff = {"base": backoff_base, "cap": backoff_max}
+
+    def _execute(self, sql, params=None):
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                rows = cursor.fetchall() if cursor.description else None
+                count = cursor.rowcount
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return rows if rows is not None else count
+
+    def enqueue(self, product_ids):
+        """
+        Adds jobs for product ids in one statement; returns the number of rows touched.
+
+        Products that already have a pending job are left as they are; a product
+        whose job is in progress is flagged to be embedded again once it finishes.
+        """
+        product_ids = [str(p) for p in product_ids]
+        if not product_ids:
+            return 0
+        return self._execute(_ENQUEUE_SQL, (product_ids,))
+
+    def enqueue_missing(self):
+        """Enqueues every product that has no embedding yet."""
+        return self._execute(_ENQUEUE_MISSING_SQL)
+
+    def claim(self, worker_id, limit=DEFAULT_CLAIM_SIZE):
+        """Leases up to `limit` pending jobs to `worker_id`."""
+        rows = self._execute(_CLAIM_SQL, {"limit": limit, "worker": worker_id, "lease": self.lease_seconds})
+        return [Job(*row) for row in rows]
+
+    def complete(self, worker_id, jobs, rows_by_product, model):
+        """
+        Replaces the `product_embeddings` rows ({product_id: rows}) of jobs this
+        worker still owns and marks them done, in one transaction. Returns the
+        number of jobs completed.
+        """
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute(_COMPLETE_SQL, {"ids": [job.id for job in jobs], "worker": worker_id})
+                owned = cursor.fetchall()
+                products = [product_id for _, product_id in owned if product_id in rows_by_product]
+                if products:
+                    cursor.execute(_DELETE_EMBEDDINGS_SQL, (products, model))
+                    rows = [row for product_id in products for row in rows_by_product[product_id]]
+                    execute_values(cursor, _INSERT_EMBEDDINGS_SQL, rows,
+                                   template="(%s::uuid, %s::vector, %s, %s::jsonb)", page_size=len(rows))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return len(owned)
+
+    def fail(self, worker_id, jobs, error):
+        """Schedules a retry with backoff for jobs this worker owns (or fails them for good)."""
+        params = {"ids": [job.id for job in jobs], "worker": worker_id, "error": str(error)[:2000], **self.backoff}
+        return self._execute(_FAIL_SQL, params)
+
+    def release_stale(self):
+        """Puts jobs whose lease expired back in the queue; returns how many."""
+        return self._execute(_RELEASE_STALE_SQL, self.backoff)
+
+    def counts(self):
+        """Returns {status: job count}."""
+        return dict(self._execute("SELECT status, count(*) FROM embedding_jobs GROUP BY status"))
+
+    def products(self, product_ids):
+        """Returns {product_id: (title, body_html)} for the products that still exist."""
+        rows = self._execute(_PRODUCTS_SQL, (list(product_ids),))
+        return {product_id: (title, body) for product_id, title, body in rows}
+
+
+@dataclass
+class WorkerStats:
+    """Throughput of one worker process."""
+    worker_id: str
+    batches: int = 0
+    done: int = 0
+    failed: int = 0
+    recovered: int = 0
+    busy_seconds: float = 0.0
+    seconds: float = 0.0
+
+    @property
+    def jobs_per_sec(self):
+        return self.done / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        return (f"{self.worker_id:<24} {self.done:>8} done {self.failed:>6} failed {self.recovered:>5} recovered "
+                f"{self.batches:>6} batches {self.busy_seconds:8.2f}s busy {self.jobs_per_sec:8.1f} jobs/s")
+
+
+def process_batch(queue, worker_id, jobs, embedding_generator, batch_size):
+    """
+    Chunks, embeds and writes a claimed batch; returns the jobs completed.
+
+    The chunks of all products in the batch are encoded together.
+    """
+    products = queue.products(job.product_id for job in jobs)
+    chunks = {product_id: chunk_product(title, body) for product_id, (title, body) in products.items()}
+    vectors = embedding_generator.generate_embeddings(
+        [chunk.text for product_chunks in chunks.values() for chunk in product_chunks],
+        batch_size=batch_size, as_numpy=True)
+
+    model = embedding_generator.backend.name
+    rows_by_product, offset = {}, 0
+    for product_id, product_chunks in chunks.items():
+        product_vectors = vectors[offset:offset + len(product_chunks)]
+        offset += len(product_chunks)
+        rows_by_product[product_id] = product_embedding_rows(product_id, product_chunks, product_vectors, model, "job")
+    # Jobs whose product vanished after the claim are completed without a write.
+    return queue.complete(worker_id, jobs, rows_by_product, model)
+
+
+def run_worker(dsn, generator_factory, claim_size=DEFAULT_CLAIM_SIZE, lease_seconds=DEFAULT_LEASE_SECONDS,
+               poll_interval=DEFAULT_POLL_INTERVAL, drain=False, report_every=10):
+    """
+    Claims and processes batches until the queue is empty (`drain`) or forever.
+
+    `generator_factory` builds the EmbeddingGenerator inside the worker process.
+    Returns the worker's WorkerStats.
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stats = WorkerStats(worker_id)
+    conn = psycopg2.connect(dsn)
+    queue = EmbeddingJobQueue(conn, lease_seconds=lease_seconds)
+    generator = generator_factory()
+    start = time.perf_counter()
+    last_sweep = None
+    try:
+        while True:
+            if last_sweep is None or time.monotonic() - last_sweep >= SWEEP_INTERVAL:
+                stats.recovered += queue.release_stale()
+                last_sweep = time.monotonic()
+
+            jobs = queue.claim(worker_id, claim_size)
+            if not jobs:
+                if drain:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            batch_start = time.perf_counter()
+            try:
+                stats.done += process_batch(queue, worker_id, jobs, generator, claim_size)
+            except Exception as e:  # any failure sends the batch to retry/backoff
+                print(f"[{worker_id}] batch of {len(jobs)} jobs failed: {e}")
+                queue.fail(worker_id, jobs, e)
+                stats.failed += len(jobs)
+            stats.busy_seconds += time.perf_counter() - batch_start
+            stats.batches += 1
+            if stats.batches % report_every == 0:
+                stats.seconds = time.perf_counter() - start
+                print(stats.summary())
+    finally:
+        stats.seconds = time.perf_counter() - start
+        conn.close()
+    return stats
+
+
+def run_workers(dsn, generator_factory, processes=None, **worker_kwargs):
+    """
+    Runs a pool of worker processes on this machine and prints their stats.
+
+    Start the same command on more machines to scale out; SKIP LOCKED keeps
+    workers from claiming each other's jobs.
+    """
+    processes = processes or os.cpu_count() or 1
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(run_worker, dsn, generator_factory, **worker_kwargs) for _ in range(processes)]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    for stats in results:
+        print(stats.summary())
+    done = sum(s.done for s in results)
+    print(f"{'total':<24} {done:>8} done in {elapsed:.2f}s ({done / elapsed if elapsed else 0.0:.1f} jobs/s) "
+          f"across {processes} processes")
+    return results
@@ -0,0 +1,135 @@
+"""quantization.py
+
+Compact codes for embedding vectors, used for a fast coarse search pass whose
+top candidates are then re-ranked with the full float32 vectors.
+
+- float16: 2 bytes/dim, near-lossless
+- int8: 1 byte/dim, per-dimension scalar quantization over the trained range
+- binary: 1 bit/dim (sign of each centred dimension), scored by Hamming distance
+
+Each codec scores queries against codes with a "higher is closer" score on
+roughly the inner-product scale, so results from different codecs can be
+ranked the same way.
+"""
+import numpy as np
+
+# int8 range is taken from these percentiles so a few outliers don't waste codes.
+INT8_CLIP_PERCENTILES = (0.1, 99.9)
+
+if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _POPCOUNT_TABLE[values]
+
+
+class Float16Codec:
+    name = "float16"
+
+    def __init__(self, dim):
+        self.dim = dim
+
+    def train(self, vectors):
+        return self
+
+    def encode(self, vectors):
+        return np.asarray(vectors, dtype=np.float16)
+
+    def decode(self, codes):
+        return codes.astype(np.float32)
+
+    def score(self, queries, codes):
+        return queries @ codes.astype(np.float32).T
+
+    def bytes_per_vector(self):
+        return 2 * self.dim
+
+    def state(self):
+        return {}
+
+    def load_state(self, state):
+        return self
+
+
+class Int8Codec:
+    name = "int8"
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.low = np.zeros(dim, dtype=np.float32)
+        self.scale = np.ones(dim, dtype=np.float32)
+
+    def train(self, vectors):
+        low, high = np.percentile(np.asarray(vectors, dtype=np.float32), INT8_CLIP_PERCENTILES, axis=0)
+        self.low = low.astype(np.float32)
+        self.scale = np.maximum((high - low) / 255.0, 1e-12).astype(np.float32)
+        return self
+
+    def encode(self, vectors):
+        levels = np.rint((np.asarray(vectors, dtype=np.float32) - self.low) / self.scale)
+        return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+    def decode(self, codes):
+        return (codes.astype(np.float32) + 128.0) * self.scale + self.low
+
+    def score(self, queries, codes):
+        # q . decode(c) without materializing the decoded block in float32 twice
+        return (queries * self.scale) @ (codes.astype(np.float32) + 128.0).T + (queries @ self.low)[:, None]
+
+    def bytes_per_vector(self):
+        return self.dim
+
+    def state(self):
+        return {"low": self.low, "scale": self.scale}
+
+    def load_state(self, state):
+        self.low, self.scale = state["low"], state["scale"]
+        return self
+
+
+class BinaryCodec:
+    name = "binary"
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.center = np.zeros(dim, dtype=np.float32)
+
+    def train(self, vectors):
+        self.center = np.asarray(vectors, dtype=np.float32).mean(axis=0)
+        return self
+
+    def encode(self, vectors):
+        return np.packbits(np.asarray(vectors, dtype=np.float32) > self.center, axis=1)
+
+    def decode(self, codes):
+        return np.unpackbits(codes, axis=1, count=self.dim).astype(np.float32) * 2 - 1
+
+    def score(self, queries, codes):
+        """dim - 2 * Hamming distance: the inner product of the +-1 sign vectors."""
+        query_codes = self.encode(queries)
+        distances = np.empty((len(query_codes), len(codes)), dtype=np.float32)
+        for i, code in enumerate(query_codes):
+            distances[i] = _popcount(np.bitwise_xor(codes, code)).sum(axis=1)
+        return self.dim - 2 * distances
+
+    def bytes_per_vector(self):
+        return (self.dim + 7) // 8
+
+    def state(self):
+        return {"center": self.center}
+
+    def load_state(self, state):
+        self.center = state["center"]
+        return self
+
+
+CODECS = {codec.name: codec for codec in (Float16Codec, Int8Codec, BinaryCodec)}
+
+
+def make_codec(name, dim):
+    """Returns an untrained codec by name ('float16', 'int8' or 'binary')."""
+    if name not in CODECS:
+        raise ValueError(f"Unknown quantization: {name} (expected one of {', '.join(CODECS)})")
+    return CODECS[name](dim)
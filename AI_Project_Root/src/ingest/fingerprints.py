@@ -0,0 +1,144 @@
+"""fingerprints.py
+
+Persistent content-hash index for incremental imports.
+
+Maps a product key (handle or Shopify id) to a hash of the fields its derived
+data (normalization, embeddings) is computed from. Re-importing an export then
+only sends new or changed products down the pipeline. The index is a local
+SQLite sidecar so it works without a reachable Postgres instance.
+"""
+import hashlib
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+
+import pandas as pd
+
+from src.core import config
+
+FINGERPRINT_DB_PATH = config.DATA_DIR / "fingerprints.db"
+# Bump when the derivation logic changes so every product is reprocessed once.
+FINGERPRINT_VERSION = "1"
+# SQLite's default limit on bound parameters per statement is 999.
+_LOOKUP_BATCH = 900
+
+NEW, CHANGED, UNCHANGED = "new", "changed", "unchanged"
+
+
+@dataclass
+class ImportCounts:
+    """New/changed/skipped tallies for one import run."""
+    new: int = 0
+    changed: int = 0
+    skipped: int = 0
+
+    def summary(self):
+        return f"{self.new} new, {self.changed} changed, {self.skipped} unchanged (skipped)"
+
+
+def content_hash(*values):
+    """Hashes a sequence of field values (None and '' hash the same)."""
+    joined = "\x1f".join("" if v is None else str(v) for v in (FINGERPRINT_VERSION, *values))
+    return hashlib.blake2b(joined.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def fingerprint_frame(df, columns):
+    """Returns a Series with the content hash of `columns` for every row."""
+    present = [c for c in columns if c in df.columns]
+    values = df[present].astype(object).where(df[present].notna(), None)
+    return pd.Series([content_hash(*row) for row in values.itertuples(index=False, name=None)],
+                     index=df.index, dtype=object)
+
+
+class FingerprintIndex:
+    """SQLite-backed key -> content hash map, partitioned by namespace."""
+
+    def __init__(self, path=None, namespace="products"):
+        self.path = path or FINGERPRINT_DB_PATH
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.namespace = namespace
+        # Pipeline stages run on worker threads; access is sequential per index.
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS fingerprints (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (namespace, key)
+        )
+        """)
+        self.conn.commit()
+
+    def lookup(self, keys):
+        """Returns {key: digest} for the keys already in the index."""
+        keys = [str(k) for k in keys]
+        found = {}
+        for start in range(0, len(keys), _LOOKUP_BATCH):
+            batch = keys[start:start + _LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            cursor = self.conn.execute(
+                f"SELECT key, digest FROM fingerprints WHERE namespace = ? AND key IN ({placeholders})",
+                (self.namespace, *batch),
+            )
+            found.update(cursor.fetchall())
+        return found
+
+    def classify(self, keys, digests):
+        """Returns a list of NEW / CHANGED / UNCHANGED for each (key, digest) pair."""
+        keys = [str(k) for k in keys]
+        known = self.lookup(keys)
+        status = []
+        for key, digest in zip(keys, digests):
+            previous = known.get(key)
+            status.append(NEW if previous is None else UNCHANGED if previous == digest else CHANGED)
+        return status
+
+    def filter_changed(self, df, key_column, columns, counts=None):
+        """
+        Drops rows whose fingerprint is unchanged since the last recorded import.
+
+        Adds 'fingerprint_key', 'fingerprint' and 'change' columns to the rows that
+        are kept; call `record` with those once they have been committed. Rows
+        without a key can't be fingerprinted: they are kept with those columns
+        set to None (so validation still flags them) and left out of `counts`.
+        """
+        if df.empty:
+            return df
+        keys = df[key_column].astype(object).where(df[key_column].notna(), None)
+        keyed = keys.notna().to_numpy()
+        digests = fingerprint_frame(df, columns).where(keyed, None)
+        status = pd.Series(None, index=df.index, dtype=object)
+        status[keyed] = self.classify(keys[keyed], digests[keyed])
+        if counts is not None:
+            counts.new += int((status == NEW).sum())
+            counts.changed += int((status == CHANGED).sum())
+            counts.skipped += int((status == UNCHANGED).sum())
+        keep = status != UNCHANGED
+        df = df[keep].copy()
+        df["fingerprint_key"] = keys[keep].map(lambda k: k if k is None else str(k))
+        df["fingerprint"] = digests[keep]
+        df["change"] = status[keep]
+        return df
+
+    def record(self, keys, digests):
+        """Stores the digests of products that were processed successfully (rows without a key are skipped)."""
+        now = datetime.utcnow().isoformat() + "Z"
+        self.conn.executemany(
+            """INSERT INTO fingerprints (namespace, key, digest, updated_at) VALUES (?, ?, ?, ?)
+               ON CONFLICT (namespace, key) DO UPDATE SET digest = excluded.digest, updated_at = excluded.updated_at""",
+            ((self.namespace, str(k), d, now) for k, d in zip(keys, digests) if pd.notna(k)),
+        )
+        self.conn.commit()
+
+    def forget(self, keys=None):
+        """Removes keys (or the whole namespace) so they are reprocessed next time."""
+        if keys is None:
+            self.conn.execute("DELETE FROM fingerprints WHERE namespace = ?", (self.namespace,))
+        else:
+            self.conn.executemany("DELETE FROM fingerprints WHERE namespace = ? AND key = ?",
+                                  ((self.namespace, str(k)) for k in keys))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
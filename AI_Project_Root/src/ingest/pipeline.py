@@ -0,0 +1,172 @@
+"""pipeline.py
+
+Minimal staged streaming pipeline: a source of batches followed by a chain of
+stage functions, each running in its own thread and connected by bounded queues.
+
+Bounded queues let I/O-heavy stages (CSV parsing, DB writes) overlap with
+compute-heavy ones (normalization, embedding) while capping how many batches are
+in flight. Per-stage throughput and queue occupancy are recorded so the slow
+stage is easy to spot.
+"""
+import queue
+import threading
+import time
+
+DEFAULT_QUEUE_SIZE = 4
+_DONE = object()
+
+
+class StageStats:
+    """Throughput and input-queue occupancy for one pipeline stage."""
+
+    def __init__(self, name, queue_capacity=0):
+        self.name = name
+        self.batches = 0
+        self.rows = 0
+        self.busy_seconds = 0.0
+        self.queue_capacity = queue_capacity
+        self.queue_samples = 0
+        self.queue_total = 0
+        self.queue_max = 0
+
+    def sample_queue(self, q):
+        size = q.qsize()
+        self.queue_samples += 1
+        self.queue_total += size
+        self.queue_max = max(self.queue_max, size)
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.busy_seconds if self.busy_seconds else 0.0
+
+    @property
+    def mean_queue(self):
+        return self.queue_total / self.queue_samples if self.queue_samples else 0.0
+
+    def summary(self):
+        line = f"{self.name:<10} {self.rows:>9} rows {self.batches:>5} batches {self.busy_seconds:8.2f}s busy {self.rows_per_sec:10.1f} rows/s"
+        if self.queue_capacity:
+            line += f"  input queue avg {self.mean_queue:.1f}/{self.queue_capacity} max {self.queue_max}"
+        return line
+
+
+class PipelineStats:
+    """Aggregated statistics for a pipeline run."""
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.seconds = 0.0
+
+    @property
+    def rows(self):
+        return self.stages[-1].rows if self.stages else 0
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        lines = [stage.summary() for stage in self.stages]
+        lines.append(f"{'total':<10} {self.rows:>9} rows in {self.seconds:.2f}s ({self.rows_per_sec:.1f} rows/s)")
+        return "\n".join(lines)
+
+
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def run_pipeline(source, stages, queue_size=DEFAULT_QUEUE_SIZE, row_count=len):
+    """
+    Runs `source` (an iterable of batches) through `stages`, a list of (name, func)
+    pairs. Each func receives a batch and returns the batch for the next stage; the
+    return value of the last stage is discarded.
+
+    Returns PipelineStats. The first exception raised by any stage is re-raised in
+    the calling thread after all stage threads have stopped.
+    """
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    read_stats = StageStats("read")
+    stage_stats = [StageStats(name, queue_size) for name, _ in stages]
+
+    def fail(exc):
+        errors.append(exc)
+        stop.set()
+
+    def run_source():
+        out = queues[0]
+        iterator = iter(source)
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    batch = next(iterator)
+                except StopIteration:
+                    break
+                read_stats.busy_seconds += time.perf_counter() - start
+                read_stats.batches += 1
+                read_stats.rows += row_count(batch)
+                stage_stats[0].sample_queue(out)
+                if not _put(out, batch, stop):
+                    return
+        except Exception as e:
+            fail(e)
+        finally:
+            _put(out, _DONE, stop)
+
+    def run_stage(index, func):
+        stats = stage_stats[index]
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(queues) else None
+        try:
+            while True:
+                batch = _get(inbox, stop)
+                if batch is _DONE:
+                    break
+                rows = row_count(batch)
+                start = time.perf_counter()
+                result = func(batch)
+                stats.busy_seconds += time.perf_counter() - start
+                stats.batches += 1
+                stats.rows += rows
+                if outbox is not None:
+                    stage_stats[index + 1].sample_queue(outbox)
+                    if not _put(outbox, result, stop):
+                        return
+        except Exception as e:
+            fail(e)
+        finally:
+            if outbox is not None:
+                _put(outbox, _DONE, stop)
+
+    threads = [threading.Thread(target=run_source, name="pipeline-read", daemon=True)]
+    for index, (name, func) in enumerate(stages):
+        threads.append(threading.Thread(target=run_stage, args=(index, func), name=f"pipeline-{name}", daemon=True))
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = PipelineStats([read_stats] + stage_stats)
+    stats.seconds = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+    return stats
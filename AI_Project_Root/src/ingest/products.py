@@ -0,0 +1,44 @@
+"""products.py
+
+Batch-level stage functions for the product CSV ingest pipeline used by both
+csv_processor copies: normalize and validate a chunk, then embed it.
+"""
+import pandas as pd
+
+
+def _none_for_missing(series):
+    return series.astype(object).where(series.notna(), None)
+
+
+def normalize_chunk(df, normalization_model):
+    """
+    Adds an 'ml_prediction' column with the normalized color for every row.
+
+    The model maps lowercase raw values to standard values; unknown values fall
+    back to the raw value itself and missing colors stay None.
+    """
+    colors = df["color"]
+    predictions = colors.astype("string").str.lower().map(normalization_model or {})
+    df["ml_prediction"] = _none_for_missing(predictions.where(predictions.notna(), colors))
+    return df
+
+
+def validate_chunk(df, normalization_model):
+    """
+    Adds an 'error' column naming why a row needs review, or None for clean rows.
+    """
+    names = df["product_name"].fillna("").astype(str).str.strip()
+    colors = df["color"].astype("string").str.lower()
+    unrecognized = colors.notna() & ~colors.isin(list(normalization_model or {}))
+    errors = pd.Series(None, index=df.index, dtype=object)
+    errors[unrecognized.to_numpy(dtype=bool)] = "color not normalized"
+    errors[(names == "").to_numpy()] = "missing product name"
+    df["error"] = errors
+    return df
+
+
+def embed_chunk(df, embedding_generator, text_column="product_name"):
+    """Adds an 'embedding' column for the chunk's product text."""
+    texts = df[text_column].fillna("").astype(str).tolist()
+    df["embedding"] = embedding_generator.generate_embeddings(texts)
+    return df
@@ -0,0 +1,285 @@
+"""shopify_csv.py
+
+Column-pruned, typed reader for Shopify product exports.
+
+A Shopify export carries 50+ columns (including the large `Body (HTML)` column)
+while most callers only need two or three of them. This reader resolves the
+requested columns case-insensitively from the header, parses only those columns
+with explicit dtypes and uses pyarrow when it is installed. Files larger than the
+memory cap are streamed in chunks instead of being loaded at once.
+
+Usage:
+  python -m src.ingest.shopify_csv path/to/products.csv --columns handle title
+"""
+import csv
+import os
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+except ImportError:  # pyarrow is optional; fall back to the pandas C engine
+    pa = None
+    pa_csv = None
+
+# Explicit dtypes for the numeric Shopify columns (keyed by lowercase header).
+# Every other column is parsed as a string so nothing gets type-sniffed.
+SHOPIFY_DTYPES = {
+    "variant grams": "float64",
+    "variant price": "float64",
+    "variant compare at price": "float64",
+    "variant inventory qty": "float64",
+    "image position": "float64",
+    "cost per item": "float64",
+}
+
+DEFAULT_MAX_MEMORY_MB = 256
+# Bytes sampled from the start of the file to estimate the average row size.
+SAMPLE_BYTES = 1 << 16
+
+
+class MissingColumnsError(KeyError):
+    """Raised when a required column is not present in the CSV header."""
+
+    def __init__(self, missing, available):
+        self.missing = list(missing)
+        self.available = list(available)
+        super().__init__(f"CSV must contain the columns: {', '.join(self.missing)}")
+
+    def __str__(self):
+        return self.args[0]
+
+
+@dataclass
+class ReadStats:
+    """Parse statistics for one read, used to compare reader configurations."""
+    engine: str = ""
+    rows: int = 0
+    chunks: int = 0
+    bytes_read: int = 0
+    seconds: float = 0.0
+
+    @property
+    def bytes_per_sec(self):
+        return self.bytes_read / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        return (
+            f"{self.rows} rows in {self.seconds:.3f}s using {self.engine} "
+            f"({self.chunks} chunk(s), {self.bytes_per_sec / 1e6:.1f} MB/s)"
+        )
+
+
+def read_header(file_path):
+    """Returns the header row of a CSV file without parsing the body."""
+    with open(file_path, "r", newline="", encoding="utf-8-sig") as fh:
+        return next(csv.reader(fh), [])
+
+
+def resolve_columns(header, columns, required=()):
+    """
+    Maps each requested output name to the matching header name.
+
+    `columns` maps an output name to one or more candidate header names, which
+    are matched case-insensitively (e.g. {"product_name": ("product_name", "title")}).
+    A plain list of names is treated as {name: (name,)}.
+    """
+    if not isinstance(columns, dict):
+        columns = {name: (name,) for name in columns}
+
+    lower_to_original = {col.strip().lower(): col for col in header}
+    resolved = {}
+    for output_name, candidates in columns.items():
+        if isinstance(candidates, str):
+            candidates = (candidates,)
+        for candidate in candidates:
+            original = lower_to_original.get(candidate.lower())
+            if original is not None:
+                resolved[output_name] = original
+                break
+
+    missing = [name for name in required if name not in resolved]
+    if missing:
+        raise MissingColumnsError(missing, header)
+    return resolved
+
+
+class ShopifyCsvReader:
+    """
+    Reads selected columns of a Shopify CSV export into DataFrames.
+
+    Output frames use the requested output names as columns; optional columns
+    missing from the file are filled with None.
+    """
+
+    def __init__(self, file_path, columns, required=(), dtypes=None,
+                 max_memory_mb=DEFAULT_MAX_MEMORY_MB, use_pyarrow=True):
+        self.file_path = file_path
+        self.columns = columns
+        self.required = tuple(required)
+        self.dtypes = {**SHOPIFY_DTYPES, **{k.lower(): v for k, v in (dtypes or {}).items()}}
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self.use_pyarrow = use_pyarrow and pa_csv is not None
+        self.file_size = os.path.getsize(file_path)
+        self.header = read_header(file_path)
+        self.resolved = resolve_columns(self.header, columns, self.required)
+        self.output_names = list(columns)
+        self.stats = ReadStats()
+
+    @property
+    def fits_in_memory(self):
+        return self.file_size <= self.max_memory_bytes
+
+    def _dtype_for(self, original):
+        return self.dtypes.get(original.lower(), "str")
+
+    def _finish_frame(self, df):
+        """Renames parsed columns to output names and adds missing optional ones."""
+        df = df.rename(columns={original: name for name, original in self.resolved.items()})
+        for name, original in self.resolved.items():
+            if self._dtype_for(original) == "str":
+                # Empty cells become None (not NaN) so `if value:` checks and JSON payloads behave
+                df[name] = df[name].astype(object).where(df[name].notna(), None)
+        for name in self.output_names:
+            if name not in df.columns:
+                df[name] = None
+        return df[self.output_names]
+
+    def _estimate_chunk_rows(self):
+        """Estimates how many rows fit in the memory cap from a sample of the file."""
+        with open(self.file_path, "rb") as fh:
+            sample = fh.read(SAMPLE_BYTES)
+        lines = max(sample.count(b"\n"), 1)
+        avg_row_bytes = max(len(sample) // lines, 1)
+        return max(self.max_memory_bytes // avg_row_bytes, 1000)
+
+    # --- pyarrow path ---
+
+    def _arrow_options(self, block_size=None):
+        column_types = {}
+        for original in self.resolved.values():
+            dtype = self._dtype_for(original)
+            column_types[original] = pa.float64() if dtype == "float64" else pa.string()
+        read_options = pa_csv.ReadOptions(block_size=block_size) if block_size else pa_csv.ReadOptions()
+        parse_options = pa_csv.ParseOptions(newlines_in_values=True)
+        convert_options = pa_csv.ConvertOptions(
+            include_columns=list(self.resolved.values()),
+            column_types=column_types,
+            strings_can_be_null=True,
+        )
+        return read_options, parse_options, convert_options
+
+    def _iter_arrow(self, block_size):
+        read_options, parse_options, convert_options = self._arrow_options(block_size)
+        with pa_csv.open_csv(self.file_path, read_options=read_options,
+                             parse_options=parse_options, convert_options=convert_options) as reader:
+            for batch in reader:
+                yield batch.to_pandas()
+
+    def _read_arrow(self):
+        read_options, parse_options, convert_options = self._arrow_options()
+        table = pa_csv.read_csv(self.file_path, read_options=read_options,
+                                parse_options=parse_options, convert_options=convert_options)
+        return table.to_pandas()
+
+    # --- pandas path ---
+
+    def _pandas_kwargs(self):
+        usecols = list(self.resolved.values())
+        return {
+            "usecols": usecols,
+            "dtype": {col: self._dtype_for(col) for col in usecols},
+            "encoding": "utf-8-sig",
+            "keep_default_na": False,
+            "na_values": [""],
+        }
+
+    # --- public API ---
+
+    def iter_chunks(self, chunk_rows=None):
+        """
+        Yields DataFrames of at most roughly `max_memory_mb` of source data each.
+        When `chunk_rows` is given, chunks are additionally capped at that many rows.
+        """
+        start = time.perf_counter()
+        self.stats = ReadStats(engine="pyarrow" if self.use_pyarrow else "pandas-c")
+        if self.use_pyarrow:
+            block_size = min(self.max_memory_bytes, 64 * 1024 * 1024)
+            chunks = self._iter_arrow(block_size)
+        else:
+            chunks = pd.read_csv(self.file_path, chunksize=chunk_rows or self._estimate_chunk_rows(),
+                                 **self._pandas_kwargs())
+        for chunk in chunks:
+            df = self._finish_frame(chunk)
+            step = chunk_rows or len(df) or 1
+            for offset in range(0, len(df), step):
+                piece = df.iloc[offset:offset + step].reset_index(drop=True) if step < len(df) else df
+                self.stats.rows += len(piece)
+                self.stats.chunks += 1
+                yield piece
+        self.stats.bytes_read = self.file_size
+        self.stats.seconds = time.perf_counter() - start
+
+    def read(self):
+        """
+        Reads the selected columns into one DataFrame.
+
+        Files above the memory cap are read chunk by chunk and concatenated, so only
+        the pruned columns (never the full file) are held in memory.
+        """
+        if not self.fits_in_memory:
+            chunks = list(self.iter_chunks())
+            if not chunks:
+                return self._finish_frame(pd.DataFrame(columns=list(self.resolved.values())))
+            return pd.concat(chunks, ignore_index=True)
+
+        start = time.perf_counter()
+        if self.use_pyarrow:
+            df = self._read_arrow()
+            engine = "pyarrow"
+        else:
+            df = pd.read_csv(self.file_path, **self._pandas_kwargs())
+            engine = "pandas-c"
+        df = self._finish_frame(df)
+        self.stats = ReadStats(engine=engine, rows=len(df), chunks=1, bytes_read=self.file_size,
+                               seconds=time.perf_counter() - start)
+        return df
+
+
+def read_shopify_csv(file_path, columns, required=(), **kwargs):
+    """
+    Convenience wrapper returning (DataFrame, ReadStats) for the selected columns.
+    """
+    reader = ShopifyCsvReader(file_path, columns, required=required, **kwargs)
+    df = reader.read()
+    return df, reader.stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare the pruned Shopify reader with a full pd.read_csv.")
+    parser.add_argument("path", help="Shopify products CSV")
+    parser.add_argument("--columns", nargs="+", default=["handle", "title"], help="Columns to read")
+    parser.add_argument("--max-memory-mb", type=float, default=DEFAULT_MAX_MEMORY_MB)
+    args = parser.parse_args()
+
+    size = os.path.getsize(args.path)
+    start = time.perf_counter()
+    full = pd.read_csv(args.path)
+    elapsed = time.perf_counter() - start
+    print(f"pd.read_csv (all {full.shape[1]} columns): {len(full)} rows in {elapsed:.3f}s "
+          f"({size / elapsed / 1e6:.1f} MB/s)")
+    del full
+
+    for use_pyarrow in (False, True):
+        if use_pyarrow and pa_csv is None:
+            print("pyarrow not installed; skipping pyarrow engine")
+            continue
+        reader = ShopifyCsvReader(args.path, args.columns, max_memory_mb=args.max_memory_mb,
+                                  use_pyarrow=use_pyarrow)
+        reader.read()
+        print(f"ShopifyCsvReader ({len(reader.resolved)} columns): {reader.stats.summary()}")
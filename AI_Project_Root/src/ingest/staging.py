@@ -0,0 +1,291 @@
+"""staging.py
+
+Columnar staging area for CSV uploads (todo.md P1-P8).
+
+The ingest pipeline writes each processed batch to a Parquet part file under
+data/staging/<batch_id>/ instead of going straight to Postgres. The staged batch
+can then be previewed page by page, filtered down to its error rows, committed to
+the database in a single transaction, or discarded by deleting its directory.
+"""
+import csv
+import io
+import json
+import shutil
+import uuid
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.core import config
+
+# Rows per Parquet row group; pages are served by reading only the overlapping groups.
+ROW_GROUP_SIZE = 1000
+MANIFEST_NAME = "manifest.json"
+
+COMMIT_COLUMNS = ("handle", "product_name", "ml_prediction", "embedding")
+EMBEDDING_COLUMN = "embedding"
+# Staged rows are COPied into a temp table, reduced to the last row per key, then
+# update the products they match (by handle, or by name when the CSV has no
+# handle) and insert the rest. `seq` numbers the rows in staged order.
+CREATE_STAGED_SQL = """CREATE TEMP TABLE staged_products (
+                           seq BIGSERIAL, handle TEXT, product_name TEXT, normalized_color TEXT,
+                           embedding vector, needs_review BOOLEAN
+                       ) ON COMMIT DROP"""
+DEDUPE_STAGED_SQL = """DELETE FROM staged_products s
+                       USING staged_products later
+                       WHERE later.{key} = s.{key} AND later.seq > s.seq"""
+COPY_STAGED_SQL = """COPY staged_products (handle, product_name, normalized_color, embedding, needs_review)
+                     FROM STDIN WITH (FORMAT csv)"""
+UPDATE_PRODUCTS_SQL = """UPDATE products p
+                         SET handle = coalesce(s.handle, p.handle), product_name = s.product_name, normalized_color = s.normalized_color,
+                             embedding = s.embedding, needs_review = s.needs_review
+                         FROM staged_products s
+                         WHERE p.{key} = s.{key}"""
+INSERT_PRODUCTS_SQL = """INSERT INTO products (handle, product_name, normalized_color, embedding, needs_review)
+                         SELECT s.handle, s.product_name, s.normalized_color, s.embedding, s.needs_review
+                         FROM staged_products s
+                         WHERE s.{key} IS NULL OR NOT EXISTS (SELECT 1 FROM products p WHERE p.{key} = s.{key})"""
+
+
+def part_schema(columns):
+    """
+    Arrow schema every part is written with: strings, plus a list<float32>
+    embedding. Inferring it per chunk would type an all-None column as null,
+    and parts with different schemas cannot be concatenated into one page.
+    """
+    return pa.schema([pa.field(name, pa.list_(pa.float32()) if name == EMBEDDING_COLUMN else pa.string())
+                      for name in columns])
+
+
+def _as_strings(series):
+    return series.astype(object).where(series.notna(), None).map(lambda v: v if v is None else str(v))
+
+
+def vector_literal(values):
+    """Formats an embedding as pgvector text input ('[v1,v2,...]')."""
+    if values is None:
+        return None
+    return "[" + ",".join(format(float(v), ".7g") for v in values) + "]"
+
+
+class StagingBatch:
+    """One staged upload: a directory of Parquet parts plus a JSON manifest."""
+
+    def __init__(self, batch_id=None, root=None):
+        self.batch_id = batch_id or datetime.utcnow().strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:8]
+        self.root = root or config.STAGING_DIR
+        self.path = self.root / self.batch_id
+        self.manifest = {
+            "batch_id": self.batch_id,
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "source": None,
+            "status": "open",
+            "parts": [],
+        }
+
+    @classmethod
+    def open(cls, batch_id, root=None):
+        """Loads an existing staged batch from its manifest."""
+        batch = cls(batch_id, root)
+        with open(batch.path / MANIFEST_NAME, "r", encoding="utf-8") as fh:
+            batch.manifest = json.load(fh)
+        return batch
+
+    @classmethod
+    def list_batches(cls, root=None):
+        root = root or config.STAGING_DIR
+        if not root.exists():
+            return []
+        return sorted(p.name for p in root.iterdir() if (p / MANIFEST_NAME).exists())
+
+    # --- writing ---
+
+    def _save_manifest(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / (MANIFEST_NAME + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.manifest, fh, indent=2)
+        tmp.replace(self.path / MANIFEST_NAME)
+
+    def write_chunk(self, df):
+        """Writes one processed chunk as a new Parquet part. Returns the chunk unchanged."""
+        if self.manifest["status"] != "open":
+            raise RuntimeError(f"Staging batch {self.batch_id} is {self.manifest['status']}")
+        if df.empty:
+            return df
+        self.path.mkdir(parents=True, exist_ok=True)
+        name = f"part-{len(self.manifest['parts']):05d}.parquet"
+        columns = {name: df[name] if name == EMBEDDING_COLUMN else _as_strings(df[name]) for name in df.columns}
+        table = pa.Table.from_pandas(pd.DataFrame(columns), schema=part_schema(df.columns), preserve_index=False)
+        pq.write_table(table, self.path / name, row_group_size=ROW_GROUP_SIZE)
+        errors = int(df["error"].notna().sum()) if "error" in df.columns else 0
+        self.manifest["parts"].append({"file": name, "rows": len(df), "errors": errors})
+        self._save_manifest()
+        return df
+
+    def finalize(self, source=None):
+        """Marks the batch complete so it can be previewed and committed."""
+        self.manifest["source"] = str(source) if source else self.manifest.get("source")
+        self.manifest["status"] = "staged"
+        self._save_manifest()
+
+    # --- preview ---
+
+    @property
+    def columns(self):
+        if not self.manifest["parts"]:
+            return []
+        return pq.read_schema(self.path / self.manifest["parts"][0]["file"]).names
+
+    @property
+    def row_count(self):
+        return sum(part["rows"] for part in self.manifest["parts"])
+
+    @property
+    def error_count(self):
+        return sum(part["errors"] for part in self.manifest["parts"])
+
+    def page_count(self, page_size, errors_only=False):
+        total = self.error_count if errors_only else self.row_count
+        return max((total + page_size - 1) // page_size, 1)
+
+    def _read_range(self, part, start, stop, columns=None):
+        """Reads rows [start, stop) of one part, touching only the overlapping row groups."""
+        pf = pq.ParquetFile(self.path / part["file"])
+        groups, first_row, offset = [], None, 0
+        for i in range(pf.num_row_groups):
+            n = pf.metadata.row_group(i).num_rows
+            if offset + n > start and offset < stop:
+                groups.append(i)
+                if first_row is None:
+                    first_row = offset
+            offset += n
+        if not groups:
+            return None
+        table = pf.read_row_groups(groups, columns=columns)
+        return table.slice(start - first_row, stop - start)
+
+    def page(self, page, page_size=50, columns=None):
+        """Returns page `page` (0-based) of the staged rows as a DataFrame."""
+        start, stop = page * page_size, (page + 1) * page_size
+        tables, offset = [], 0
+        for part in self.manifest["parts"]:
+            part_start, part_stop = offset, offset + part["rows"]
+            offset = part_stop
+            if part_stop <= start or part_start >= stop:
+                continue
+            table = self._read_range(part, max(start, part_start) - part_start,
+                                     min(stop, part_stop) - part_start, columns)
+            if table is not None:
+                tables.append(table)
+        return self._to_frame(tables, columns)
+
+    def error_rows(self, page=0, page_size=50, columns=None):
+        """Returns one page of only the rows flagged with an error, with their staged row number."""
+        start, stop = page * page_size, (page + 1) * page_size
+        frames, seen, offset = [], 0, 0
+        for part in self.manifest["parts"]:
+            part_offset = offset
+            offset += part["rows"]
+            if not part["errors"]:
+                continue
+            if seen + part["errors"] <= start:
+                seen += part["errors"]
+                continue
+            read_columns = list(dict.fromkeys([*columns, "error"])) if columns else None
+            df = pq.read_table(self.path / part["file"], columns=read_columns).to_pandas()
+            df.insert(0, "row", range(part_offset, part_offset + len(df)))
+            df = df[df["error"].notna()] if "error" in df.columns else df.iloc[0:0]
+            lo, hi = max(start - seen, 0), stop - seen
+            frames.append(df.iloc[lo:hi])
+            seen += part["errors"]
+            if seen >= stop:
+                break
+        if not frames:
+            return self._to_frame([], columns)
+        return pd.concat(frames, ignore_index=True)
+
+    def _to_frame(self, tables, columns):
+        if tables:
+            return pa.concat_tables(tables).to_pandas()
+        if self.manifest["parts"]:
+            schema = pq.read_schema(self.path / self.manifest["parts"][0]["file"])
+            return schema.empty_table().select(columns or schema.names).to_pandas()
+        return pd.DataFrame(columns=columns or [])
+
+    # --- commit / discard ---
+
+    def _committed_part(self, part, columns, include_errors):
+        path = self.path / part["file"]
+        names = pq.read_schema(path).names
+        read_columns = [c for c in columns if c in names]
+        if "error" in names and "error" not in read_columns:
+            read_columns.append("error")
+        df = pq.read_table(path, columns=read_columns).to_pandas()
+        if not include_errors and "error" in df.columns:
+            df = df[df["error"].isna()]
+        return df
+
+    def committed_rows(self, columns, include_errors=False):
+        """Yields, per part, the given columns of the rows that `commit` loads."""
+        for part in self.manifest["parts"]:
+            yield self._committed_part(part, columns, include_errors)
+
+    def _copy_buffer(self, part, include_errors):
+        df = self._committed_part(part, COMMIT_COLUMNS, include_errors)
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        if "handle" not in df.columns:
+            df = df.assign(handle=None)
+        # Missing strings come back as NaN with pandas' string dtype; COPY needs them empty (NULL)
+        handles, names, predictions = (df[c].astype(object).where(df[c].notna(), None)
+                                       for c in ("handle", "product_name", "ml_prediction"))
+        for handle, name, prediction, embedding in zip(handles, names, predictions, df["embedding"]):
+            writer.writerow((handle, name, prediction, vector_literal(embedding), "t"))
+        buf.seek(0)
+        return buf, len(df)
+
+    def commit(self, conn, include_errors=False):
+        """
+        Bulk-loads the staged rows into `products` with COPY, in one transaction.
+
+        A staged product that already exists (same handle, or same name when the
+        upload has no handles) updates that row; the others are inserted. When a
+        key occurs more than once in the batch, its last staged row wins. Rows
+        flagged with an error are held back unless `include_errors` is set.
+        Returns the number of products written (updated or inserted).
+        """
+        if self.manifest["status"] != "staged":
+            raise RuntimeError(f"Staging batch {self.batch_id} is {self.manifest['status']}, not staged")
+        key = "handle" if "handle" in self.columns else "product_name"
+        loaded = updated = 0
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(CREATE_STAGED_SQL)
+                for part in self.manifest["parts"]:
+                    buf, rows = self._copy_buffer(part, include_errors)
+                    if rows:
+                        cursor.copy_expert(COPY_STAGED_SQL, buf)
+                        loaded += rows
+                if loaded:
+                    cursor.execute(DEDUPE_STAGED_SQL.format(key=key))
+                    loaded -= cursor.rowcount  # duplicate keys collapsed into their last row
+                    cursor.execute(UPDATE_PRODUCTS_SQL.format(key=key))
+                    updated = cursor.rowcount
+                    cursor.execute(INSERT_PRODUCTS_SQL.format(key=key))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self.manifest["status"] = "committed"
+        self.manifest["committed_rows"] = loaded
+        self.manifest["updated_rows"] = updated
+        self._save_manifest()
+        return loaded
+
+    def discard(self):
+        """Deletes the staged files."""
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.manifest["status"] = "discarded"
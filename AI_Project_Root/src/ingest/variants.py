@@ -0,0 +1,270 @@
+"""variants.py
+
+Folds Shopify's one-row-per-variant/image export layout into one record per product.
+
+In a Shopify export the first row of a product carries the title, body, vendor,
+etc.; the following rows share its `Handle` but only fill in variant (option
+values, SKU, price) or image columns. Consecutive rows with the same handle are
+folded in a single streaming pass that only ever holds the current product.
+Exports that are not grouped by handle are first put in order with an external
+merge sort over Parquet runs.
+"""
+import heapq
+import math
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from src.ingest.shopify_csv import ShopifyCsvReader
+
+DEFAULT_CHUNK_ROWS = 50000
+
+# Canonical column names -> Shopify export headers (matched case-insensitively).
+SHOPIFY_PRODUCT_COLUMNS = {
+    "handle": ("handle",),
+    "title": ("title", "product_name"),
+    "body_html": ("body (html)", "body_html"),
+    "vendor": ("vendor",),
+    "product_type": ("type", "product_type"),
+    "tags": ("tags",),
+    "option1_name": ("option1 name",),
+    "option1_value": ("option1 value",),
+    "option2_name": ("option2 name",),
+    "option2_value": ("option2 value",),
+    "option3_name": ("option3 name",),
+    "option3_value": ("option3 value",),
+    "sku": ("variant sku",),
+    "grams": ("variant grams",),
+    "price": ("variant price",),
+    "compare_at_price": ("variant compare at price",),
+    "barcode": ("variant barcode",),
+    "image_src": ("image src",),
+    "image_position": ("image position",),
+    "image_alt": ("image alt text",),
+}
+
+# Record key -> canonical column for the per-variant and per-image lists.
+VARIANT_FIELDS = {
+    "option1": "option1_value",
+    "option2": "option2_value",
+    "option3": "option3_value",
+    "sku": "sku",
+    "grams": "grams",
+    "price": "price",
+    "compare_at_price": "compare_at_price",
+    "barcode": "barcode",
+}
+IMAGE_FIELDS = {"src": "image_src", "position": "image_position", "alt": "image_alt"}
+_ROW_LEVEL_COLUMNS = set(VARIANT_FIELDS.values()) | set(IMAGE_FIELDS.values())
+
+_SEQ = "__seq"
+_SORT_KEY = "__sort_key"
+
+
+class UngroupedInputError(ValueError):
+    """Raised when a handle reappears after its group was already folded."""
+
+
+def _value(value):
+    """Normalizes empty cells (None, NaN, '') to None."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _new_record(handle):
+    return {"handle": handle, "variants": [], "images": [], "row_count": 0}
+
+
+def _add_row(record, row):
+    record["row_count"] += 1
+    for key, value in row.items():
+        if key in _ROW_LEVEL_COLUMNS or key == "handle":
+            continue
+        # Product-level fields come from the first row that fills them in
+        if record.get(key) is None:
+            record[key] = _value(value)
+
+    variant = {name: _value(row.get(column)) for name, column in VARIANT_FIELDS.items() if column in row}
+    if any(v is not None for v in variant.values()):
+        record["variants"].append(variant)
+
+    image = {name: _value(row.get(column)) for name, column in IMAGE_FIELDS.items() if column in row}
+    if image.get("src") is not None:
+        record["images"].append(image)
+
+
+def fold_rows(rows, strict=True):
+    """
+    Folds an iterable of row dicts (canonical column names) into product records.
+
+    Each record has the product-level fields of its first rows plus `variants`,
+    `images` and `row_count`. Rows without a handle are skipped. With `strict`,
+    a handle that reappears after its group ended raises UngroupedInputError
+    rather than producing a duplicate product.
+    """
+    current = None
+    closed = set()
+    for row in rows:
+        handle = _value(row.get("handle"))
+        if handle is None:
+            continue
+        if current is None or handle != current["handle"]:
+            if current is not None:
+                closed.add(current["handle"])
+                yield current
+            if strict and handle in closed:
+                raise UngroupedInputError(f"Handle '{handle}' is not contiguous; sort the file by handle first")
+            current = _new_record(handle)
+        _add_row(current, row)
+    if current is not None:
+        yield current
+
+
+def first_option_value(record, option_name):
+    """Returns the first variant's value for the option called `option_name` (e.g. 'Color')."""
+    for i in (1, 2, 3):
+        name = record.get(f"option{i}_name")
+        if name and name.strip().lower() == option_name.lower():
+            for variant in record["variants"]:
+                if variant.get(f"option{i}") is not None:
+                    return variant[f"option{i}"]
+    return None
+
+
+def is_grouped(file_path, key="handle", max_memory_mb=None):
+    """
+    Checks whether all rows of each handle are contiguous, reading only that column.
+    """
+    kwargs = {"max_memory_mb": max_memory_mb} if max_memory_mb else {}
+    reader = ShopifyCsvReader(file_path, {key: (key,)}, required=(key,), **kwargs)
+    closed = set()
+    previous = None
+    for chunk in reader.iter_chunks():
+        handles = chunk[key].dropna()
+        for handle in handles[handles.ne(handles.shift())]:
+            if handle == previous:
+                continue
+            if handle in closed:
+                return False
+            if previous is not None:
+                closed.add(previous)
+            previous = handle
+    return True
+
+
+def _iter_run(path, batch_size=1024):
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+
+def external_sort_chunks(chunks, key="handle", chunk_rows=DEFAULT_CHUNK_ROWS, tmp_dir=None):
+    """
+    Sorts a stream of DataFrame chunks by `key`, keeping the original row order
+    within a key, and yields sorted chunks of at most `chunk_rows` rows.
+
+    Each input chunk is sorted in memory and spilled to a Parquet run; the runs
+    are then k-way merged, so memory stays bounded by one chunk plus one batch per run.
+    """
+    run_dir = tempfile.mkdtemp(prefix="shopify-sort-", dir=tmp_dir)
+    try:
+        runs, columns, seq = [], None, 0
+        for chunk in chunks:
+            columns = list(chunk.columns)
+            chunk = chunk.assign(**{_SEQ: range(seq, seq + len(chunk)),
+                                    _SORT_KEY: chunk[key].fillna("").astype(str)})
+            seq += len(chunk)
+            chunk = chunk.sort_values([_SORT_KEY, _SEQ], kind="stable")
+            path = os.path.join(run_dir, f"run-{len(runs):05d}.parquet")
+            chunk.to_parquet(path, index=False)
+            runs.append(path)
+
+        merged = heapq.merge(*(_iter_run(path) for path in runs), key=lambda r: (r[_SORT_KEY], r[_SEQ]))
+        buffer = []
+        for row in merged:
+            buffer.append(row)
+            if len(buffer) >= chunk_rows:
+                yield pd.DataFrame(buffer, columns=columns)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def iter_grouped_chunks(reader, chunk_rows=None, assume_grouped=None, key="handle"):
+    """
+    Yields the reader's chunks with all rows of a handle contiguous.
+
+    `assume_grouped=None` checks the handle column first (a cheap single-column
+    read); False forces the external sort, True streams the file as-is.
+    """
+    if assume_grouped is None:
+        assume_grouped = is_grouped(reader.file_path, key)
+    chunks = reader.iter_chunks(chunk_rows)
+    if assume_grouped:
+        return chunks
+    return external_sort_chunks(chunks, key, chunk_rows or DEFAULT_CHUNK_ROWS)
+
+
+def _fold_frame(df, key):
+    group_ids = df[key].ne(df[key].shift()).cumsum()
+    grouped = df.groupby(group_ids, sort=False)
+    folded = grouped.first()  # first non-null value per column
+    folded["row_count"] = grouped.size().to_numpy()
+    return folded.reset_index(drop=True)
+
+
+def fold_chunks(chunks, key="handle"):
+    """
+    Folds grouped DataFrame chunks into one row per product for the ingest pipeline.
+
+    Each output column takes the first non-empty value of the product's rows; a
+    product spanning a chunk boundary is carried over to the next chunk.
+    """
+    carry = None
+    for chunk in chunks:
+        df = chunk if carry is None else pd.concat([carry, chunk], ignore_index=True)
+        df = df[df[key].notna()]
+        if df.empty:
+            carry = None
+            continue
+        group_ids = df[key].ne(df[key].shift()).cumsum()
+        is_last = group_ids.eq(group_ids.iloc[-1])
+        carry = df[is_last]
+        done = df[~is_last]
+        if not done.empty:
+            yield _fold_frame(done, key)
+    if carry is not None and not carry.empty:
+        yield _fold_frame(carry, key)
+
+
+def _row_records(rows):
+    """One record per row, for files without a Handle column."""
+    for row in rows:
+        record = _new_record(None)
+        _add_row(record, row)
+        yield record
+
+
+def iter_product_records(file_path, columns=None, required=("handle",), chunk_rows=None,
+                         assume_grouped=None, **reader_kwargs):
+    """
+    Streams a Shopify CSV export as one folded record per product. When
+    "handle" is not required and the file has no Handle column, every row is
+    its own product.
+
+    The header is read and checked on the call, not on first iteration, so a
+    missing column is reported before the caller opens its outputs.
+    """
+    reader = ShopifyCsvReader(file_path, columns or SHOPIFY_PRODUCT_COLUMNS, required=required, **reader_kwargs)
+    if "handle" not in reader.resolved:
+        return _row_records(row for chunk in reader.iter_chunks(chunk_rows) for row in chunk.to_dict("records"))
+    chunks = iter_grouped_chunks(reader, chunk_rows, assume_grouped)
+    rows = (row for chunk in chunks for row in chunk.to_dict("records"))
+    return fold_rows(rows, strict=True)
@@ -1,15 +1,19 @@
 """webhook_handler_example.py
 
-Small Flask example showing how to accept Shopify product webhooks, upsert a product using the DB function, and enqueue an embedding job (placeholder).
+Small Flask example showing how to accept Shopify product webhooks, upsert a product using the DB function, and enqueue an embedding job.
 
-This is a sketch — adapt to your background worker (RQ, Celery, Bull, etc.).
+Jobs go to the Postgres `embedding_jobs` queue (migrations/007) and are processed by `embedding_worker.py`.
 
 """
 from flask import Flask, request, jsonify
 import os
+import sys
 import json
 import psycopg2
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from src.embeddings.jobs import EmbeddingJobQueue
+
 app = Flask(__name__)
 DB_DSN = os.environ.get('DATABASE_URL')
 
@@ -26,12 +30,33 @@ def product_webhook():
     prod_uuid = cur.fetchone()[0]
     conn.commit()
     cur.close()
-    conn.close()
 
-    # Enqueue embedding job — placeholder: write to a simple jobs table or push to your queue
-    # Example: INSERT INTO embedding_jobs (product_id, status) VALUES (prod_uuid, 'pending')
+    # Enqueue an embedding job; a no-op if one is already pending for this product
+    EmbeddingJobQueue(conn).enqueue([prod_uuid])
+    conn.close()
 
     return jsonify({'status':'ok','product_id':prod_uuid}), 200
 
+@app.route('/webhook/products', methods=['POST'])
+def products_bulk_webhook():
+    """Bulk variant for backfills: upserts a JSON list of products, then enqueues all of them in one statement."""
+    payload = request.get_json()
+    if not isinstance(payload, list):
+        return jsonify({'error':'expected a json list of products'}), 400
+
+    conn = psycopg2.connect(DB_DSN)
+    cur = conn.cursor()
+    product_ids = []
+    for product in payload:
+        cur.execute("SELECT upsert_product_from_shopify(%s)::text", (json.dumps(product),))
+        product_ids.append(cur.fetchone()[0])
+    conn.commit()
+    cur.close()
+
+    EmbeddingJobQueue(conn).enqueue(product_ids)
+    conn.close()
+
+    return jsonify({'status':'ok','product_ids':product_ids}), 200
+
 if __name__ == '__main__':
     app.run(port=5000)
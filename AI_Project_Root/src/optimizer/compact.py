@@ -0,0 +1,197 @@
+"""compact.py
+Compact inference format for the optimizer tag model, and a runtime
+predictor for it that needs only NumPy and SciPy (no sklearn, no pickles).
+
+export_compact() turns the joblib artifacts into a directory of .npy files:
+- terms.npy     vocabulary as sorted UTF-8 byte strings (TF-IDF columns are in
+                sorted term order, so a term's column is its searchsorted position)
+- idf.npy       float32 IDF weights
+- coef_*.npy    (features x labels) CSR coefficient matrix, with coefficients
+                below PRUNE_TOLERANCE of their label's largest magnitude dropped
+- intercept.npy per-label bias (+-inf for labels that were constant in training)
+- meta.json     labels and the tokenizer settings
+Every array is loaded with mmap_mode='r', so loading costs a few file opens
+and pages are read on demand. Because a live predictor maps these files, an
+export never rewrites them in place: it writes a sibling directory and
+swaps it in by renaming, so running predictors keep their (now unlinked)
+files until they reload.
+
+Usage (from AI_Project_Root):
+  python -m src.optimizer.compact export
+"""
+from pathlib import Path
+from collections import Counter
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+import scipy.sparse as sp
+
+from .predictor import MODEL_DIR, TagPredictor
+
+COMPACT_DIR = MODEL_DIR / 'compact'
+# Relative to each label's largest |coefficient|; 1e-2 keeps ~1/4 of them with identical label sets
+PRUNE_TOLERANCE = 1e-2
+FORMAT_VERSION = 1
+# TfidfVectorizer settings the runtime analyzer reproduces
+_SUPPORTED = {'analyzer': 'word', 'binary': False, 'preprocessor': None, 'tokenizer': None, 'stop_words': None,
+              'strip_accents': None, 'use_idf': True, 'norm': 'l2'}
+
+
+def export_compact(model_dir=MODEL_DIR, out_dir=None, prune_tolerance=PRUNE_TOLERANCE):
+    """Writes the compact artifacts for the joblib model in `model_dir`. Returns a summary dict."""
+    import joblib  # only the export step reads the sklearn pickles
+
+    model_dir = Path(model_dir)
+    out_dir = Path(out_dir or model_dir / 'compact')
+    vec = joblib.load(model_dir / 'tfidf_vectorizer.joblib')
+    clf = joblib.load(model_dir / 'clf.joblib')
+    mlb = joblib.load(model_dir / 'mlb.joblib')
+    params = vec.get_params()
+    unsupported = {k: params[k] for k, v in _SUPPORTED.items() if params[k] != v}
+    if unsupported:
+        raise ValueError(f'Vectorizer settings not supported by the compact runtime: {unsupported}')
+
+    terms = sorted(vec.vocabulary_, key=vec.vocabulary_.get)
+    encoded = [t.encode('utf-8') for t in terms]
+    if encoded != sorted(encoded):
+        raise ValueError('Vocabulary columns are not in sorted term order')
+
+    n_features = len(terms)
+    columns, intercepts = [], []
+    kept = total = 0
+    for est in clf.estimators_:
+        if hasattr(est, 'coef_'):
+            coef = est.coef_.ravel()
+            limit = prune_tolerance * np.abs(coef).max() if coef.size else 0.0
+            mask = np.abs(coef) >= limit
+            columns.append(sp.csc_matrix((coef[mask], (np.flatnonzero(mask), np.zeros(mask.sum(), int))),
+                                         shape=(n_features, 1)))
+            intercepts.append(est.intercept_[0])
+            kept += int(mask.sum())
+            total += coef.size
+        else:
+            columns.append(sp.csc_matrix((n_features, 1)))
+            intercepts.append(np.inf if np.ravel(est.y_)[0] else -np.inf)
+    coef = sp.hstack(columns).tocsr().astype(np.float32)
+
+    tmp_dir = out_dir.with_name(f'{out_dir.name}.tmp-{os.getpid()}')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    np.save(tmp_dir / 'terms.npy', np.array(encoded, dtype=bytes))
+    np.save(tmp_dir / 'idf.npy', vec.idf_.astype(np.float32))
+    np.save(tmp_dir / 'coef_data.npy', coef.data)
+    np.save(tmp_dir / 'coef_indices.npy', coef.indices.astype(np.int32))
+    np.save(tmp_dir / 'coef_indptr.npy', coef.indptr.astype(np.int64))
+    np.save(tmp_dir / 'intercept.npy', np.array(intercepts, dtype=np.float64))
+    meta = {
+        'format': FORMAT_VERSION,
+        'labels': [str(label) for label in mlb.classes_],
+        'lowercase': params['lowercase'],
+        'token_pattern': params['token_pattern'],
+        'ngram_range': list(params['ngram_range']),
+        'sublinear_tf': params['sublinear_tf'],
+        'prune_tolerance': prune_tolerance,
+    }
+    with open(tmp_dir / 'meta.json', 'w', encoding='utf-8') as fh:
+        json.dump(meta, fh, indent=2)
+    _swap_in(tmp_dir, out_dir)
+    return {'path': str(out_dir), 'features': n_features, 'labels': len(meta['labels']),
+            'coefficients_kept': kept, 'coefficients_total': total,
+            'bytes': sum(f.stat().st_size for f in out_dir.iterdir())}
+
+
+def _swap_in(new_dir, out_dir):
+    """
+    Replaces `out_dir` with `new_dir` by renames only. The old files are
+    unlinked, not truncated, so predictors still mapping them keep working.
+    """
+    old_dir = out_dir.with_name(f'{out_dir.name}.old-{os.getpid()}')
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if out_dir.exists():
+        os.replace(out_dir, old_dir)
+    os.replace(new_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+class CompactTagPredictor(TagPredictor):
+    """TagPredictor over the compact artifacts; same predict_many / predict_proba_many API."""
+
+    def __init__(self, model_dir=COMPACT_DIR):
+        super().__init__(model_dir)
+
+    def _load(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            path = self.model_dir
+            with open(path / 'meta.json', encoding='utf-8') as fh:
+                meta = json.load(fh)
+            if meta.get('format') != FORMAT_VERSION:
+                raise ValueError(f"Unsupported compact model format: {meta.get('format')}")
+            load = lambda name: np.load(path / f'{name}.npy', mmap_mode='r')
+            self.terms = load('terms')
+            self.idf = load('idf')
+            self.labels = np.asarray(meta['labels'])
+            self.weights = sp.csr_matrix((load('coef_data'), load('coef_indices'), load('coef_indptr')),
+                                         shape=(len(self.terms), len(self.labels)))
+            self.bias = np.array(load('intercept'))
+            self._token_re = re.compile(meta['token_pattern'])
+            self._lowercase = meta['lowercase']
+            self._ngrams = tuple(meta['ngram_range'])
+            self._sublinear = meta['sublinear_tf']
+            self._loaded = True
+
+    def _analyze(self, text):
+        """Word n-grams exactly as TfidfVectorizer's default analyzer produces them."""
+        tokens = self._token_re.findall(text.lower() if self._lowercase else text)
+        low, high = self._ngrams
+        if high == 1:
+            return tokens
+        grams = list(tokens) if low == 1 else []
+        for n in range(max(low, 2), high + 1):
+            grams.extend(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return grams
+
+    def transform(self, texts):
+        """L2-normalized TF-IDF rows as a CSR matrix."""
+        self._load()
+        indptr, indices, values = [0], [np.zeros(0, np.int64)], [np.zeros(0)]
+        for text in texts:
+            counts = Counter(self._analyze(text))
+            if counts:
+                grams = np.array([g.encode('utf-8') for g in counts], dtype=bytes)
+                pos = np.searchsorted(self.terms, grams)
+                pos[pos == len(self.terms)] = 0
+                found = self.terms[pos] == grams
+                cols = pos[found]
+                tf = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))[found]
+                if self._sublinear:
+                    tf = np.log(tf) + 1
+                row = tf * self.idf[cols]
+                norm = np.sqrt(row @ row)
+                order = np.argsort(cols)
+                indices.append(cols[order])
+                values.append(row[order] / norm if norm else row[order])
+            indptr.append(indptr[-1] + len(indices[-1]) if counts else indptr[-1])
+        return sp.csr_matrix((np.concatenate(values), np.concatenate(indices), np.array(indptr)),
+                             shape=(len(texts), len(self.terms)))
+
+    def decision_matrix(self, texts):
+        x = self.transform(list(texts))
+        return (x @ self.weights).toarray() + self.bias
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Export the optimizer model to the compact format')
+    parser.add_argument('command', choices=('export',))
+    parser.add_argument('--model-dir', default=str(MODEL_DIR))
+    parser.add_argument('--prune', type=float, default=PRUNE_TOLERANCE)
+    args = parser.parse_args()
+    print(json.dumps(export_compact(args.model_dir, prune_tolerance=args.prune), indent=2))
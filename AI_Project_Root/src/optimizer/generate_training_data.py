@@ -3,6 +3,8 @@ Adapted from your Shopif Product Optimizer project. Produces a CSV with 'text' a
 Usage:
   Set SOURCE_CSV to the path of your products CSV or pass via command-line.
   python ml/optimizer/generate_training_data.py --source path/to/Products.csv
+The same steps are importable (generate_rows / write_rows) and used in-process by pipeline.py;
+label_product() is also the optimizer labeler of src/core/training_builder.py.
 """
 from pathlib import Path
 import csv
@@ -13,72 +15,88 @@ import argparse
 
 HERE = Path(__file__).parent
 OUT = HERE.parent / 'data' / 'optimizer_training.csv'
-OUT.parent.mkdir(parents=True, exist_ok=True)
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--source', help='Source products CSV', default=None)
-args = parser.parse_args()
+STORAGE_RE = re.compile(r"(\d+(?:\.\d+)?\s*(?:gb|tb))", re.IGNORECASE)
+MP_RE = re.compile(r"(\d+)\s?mp", re.IGNORECASE)
+TAG_RE = re.compile(r'<[^>]+>')
 
-# Allow env var or CLI
-src_candidate = args.source
-if not src_candidate:
-    import os
-    src_candidate = os.environ.get('SOURCE_PRODUCTS_CSV')
+def strip_html(s: str) -> str:
+    return TAG_RE.sub(' ', s or '')
 
-if not src_candidate:
-    print('Provide --source or set SOURCE_PRODUCTS_CSV environment variable')
-    raise SystemExit(1)
+def label_product(handle, title, body, vendor=None, product_type=None):
+    """{'text', 'labels'} row for one product, or None when no label applies."""
+    text = f"{handle} {title} {strip_html(body)}".strip()
+    searched = title + ' ' + body
+    labels = set()
+    # heuristics
+    for m in STORAGE_RE.findall(searched):
+        labels.add(m.replace(' ', '').upper())
+    for m in MP_RE.findall(searched):
+        labels.add(f"{m}MP")
 
-SRC = Path(src_candidate)
-if not SRC.exists():
-    print('Source CSV not found:', SRC)
-    raise SystemExit(1)
+    # fallback: use vendor/product_type if present
+    if vendor:
+        labels.add(vendor.strip())
+    if product_type:
+        labels.add(product_type.strip())
 
-STORAGE_RE = re.compile(r"(\d+(?:\.\d+)?\s*(?:gb|tb))", re.IGNORECASE)
-MP_RE = re.compile(r"(\d+)\s?mp", re.IGNORECASE)
+    if labels:
+        return {'text': text, 'labels': '|'.join(sorted(labels))}
+    return None
 
-def strip_html(s: str) -> str:
-    return re.sub(r'<[^>]+>', ' ', s or '')
+def generate_rows(src):
+    """Labeled {'text', 'labels'} rows, one per product handle, from a Shopify products CSV."""
+    rows = []
+    with open(src, newline='', encoding='utf-8') as fh:
+        reader = csv.DictReader(fh)
+        seen = set()
+        for row in reader:
+            handle = (row.get('Handle') or '').strip()
+            if not handle:
+                continue
+            if handle in seen:
+                continue
+            seen.add(handle)
+            title = (row.get('Title') or '').strip()
+            body = (row.get('Body (HTML)') or '')
+            labeled = label_product(handle, title, body, row.get('Vendor'), row.get('Type'))
+            if labeled:
+                rows.append(labeled)
+    return rows
 
-rows = []
-with open(SRC, newline='', encoding='utf-8') as fh:
-    reader = csv.DictReader(fh)
-    seen = set()
-    for row in reader:
-        handle = (row.get('Handle') or '').strip()
-        if not handle:
-            continue
-        if handle in seen:
-            continue
-        seen.add(handle)
-        title = (row.get('Title') or '').strip()
-        body = (row.get('Body (HTML)') or '')
-        text = f"{handle} {title} {strip_html(body)}".strip()
+def write_rows(rows, out=OUT):
+    out = Path(out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, 'w', newline='', encoding='utf-8') as fh:
+        writer = csv.DictWriter(fh, fieldnames=['text','labels'])
+        writer.writeheader()
+        for r in rows:
+            writer.writerow(r)
 
-        labels = set()
-        # heuristics
-        for m in STORAGE_RE.findall(title + ' ' + body):
-            labels.add(m.replace(' ', '').upper())
-        for m in MP_RE.findall(title + ' ' + body):
-            labels.add(f"{m}MP")
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', help='Source products CSV', default=None)
+    args = parser.parse_args()
 
-        # fallback: use vendor/product_type if present
-        if row.get('Vendor'):
-            labels.add(row.get('Vendor').strip())
-        if row.get('Type'):
-            labels.add(row.get('Type').strip())
+    # Allow env var or CLI
+    src_candidate = args.source
+    if not src_candidate:
+        import os
+        src_candidate = os.environ.get('SOURCE_PRODUCTS_CSV')
 
-        if labels:
-            rows.append({'text': text, 'labels': '|'.join(sorted(labels))})
+    if not src_candidate:
+        print('Provide --source or set SOURCE_PRODUCTS_CSV environment variable')
+        raise SystemExit(1)
 
-if not rows:
-    print('No labeled rows generated from', SRC)
-    raise SystemExit(1)
+    SRC = Path(src_candidate)
+    if not SRC.exists():
+        print('Source CSV not found:', SRC)
+        raise SystemExit(1)
 
-with open(OUT, 'w', newline='', encoding='utf-8') as out:
-    writer = csv.DictWriter(out, fieldnames=['text','labels'])
-    writer.writeheader()
-    for r in rows:
-        writer.writerow(r)
+    rows = generate_rows(SRC)
+    if not rows:
+        print('No labeled rows generated from', SRC)
+        raise SystemExit(1)
 
-print(f'Wrote {len(rows)} rows to {OUT}')
+    write_rows(rows, OUT)
+    print(f'Wrote {len(rows)} rows to {OUT}')
@@ -1,20 +1,15 @@
 """infer.py
-Load optimizer model artifacts and provide predict(text) -> list(labels).
+Provide predict(text) -> list(labels) from the optimizer model artifacts.
+Artifacts are loaded on first call (see predictor.py); use predict_many for batches.
 """
-from pathlib import Path
-import joblib
-
-HERE = Path(__file__).parent
-MODEL_DIR = HERE.parent.parent / 'models' / 'optimizer'
-VEC = joblib.load(MODEL_DIR / 'tfidf_vectorizer.joblib')
-CLF = joblib.load(MODEL_DIR / 'clf.joblib')
-MLB = joblib.load(MODEL_DIR / 'mlb.joblib')
+# MODEL_DIR is re-exported: it used to be defined here and external callers may import it
+from .predictor import MODEL_DIR, get_predictor  # noqa: F401
 
 def predict(text):
-    x = VEC.transform([text])
-    preds = CLF.predict(x)
-    labels = MLB.inverse_transform(preds)
-    return labels[0] if labels else []
+    return get_predictor().predict(text)
+
+def predict_many(texts):
+    return get_predictor().predict_many(texts)
 
 if __name__ == '__main__':
     examples = [
@@ -1,10 +1,10 @@
 """integration.py
 Integration helper that exposes simple functions the GUI can call:
 - suggest_tags_for_product(product_row)
+- suggest_tags_for_products(product_rows)
 - train_from_csv(source_csv)
 """
 from pathlib import Path
-import subprocess
 import os
 
 HERE = Path(__file__).parent
@@ -12,19 +12,23 @@ DATA = HERE.parent / 'data'
 MODELS = HERE.parent.parent / 'models' / 'optimizer'
 
 def train_from_csv(source_csv):
-    # run data generation then training
-    cmd1 = ['python', str(HERE / 'generate_training_data.py'), '--source', str(source_csv)]
-    subprocess.check_call(cmd1)
-    cmd2 = ['python', str(HERE / 'train_model.py')]
-    subprocess.check_call(cmd2)
-    return True
+    # data generation and training run in-process; features are cached per source/settings
+    from .pipeline import train_from_csv as run_pipeline
+    return run_pipeline(source_csv)
 
-# lazy import for prediction to avoid loading artifacts at module import time
+# the predictor loads its artifacts on first use, not at module import time
 def suggest_tags_for_product_text(text):
-    from . import infer
-    return infer.predict(text)
+    from .predictor import get_predictor
+    return get_predictor().predict(text)
 
-def suggest_tags_for_product_row(product):
+def _product_text(product):
     # product is a dict-like with title and body_html
-    text = (product.get('title') or '') + '\n' + (product.get('body_html') or '')
-    return suggest_tags_for_product_text(text)
+    return (product.get('title') or '') + '\n' + (product.get('body_html') or '')
+
+def suggest_tags_for_product_row(product):
+    return suggest_tags_for_product_text(_product_text(product))
+
+def suggest_tags_for_products(products, top_k=None, threshold=0.5):
+    # one transform and one matrix multiply for the whole batch
+    from .predictor import get_predictor
+    return get_predictor().predict_many([_product_text(p) for p in products], threshold=threshold, top_k=top_k)
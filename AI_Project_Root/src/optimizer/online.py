@@ -0,0 +1,362 @@
+"""online.py
+Online (incremental) learning mode for the optimizer tag model.
+
+Texts are featurized with a stateless HashingVectorizer, so there is no
+vocabulary to refit and a new example never changes how old ones are
+encoded. Each label has its own SGDClassifier (logistic loss) updated with
+partial_fit, so reviewer corrections from `training_feedback` are folded in
+as mini-batches: an update costs O(new rows), whatever the size of the
+history. Labels seen for the first time simply get a new classifier.
+Predictions use one sparse (features x labels) matrix of the nonzero weights,
+since a hashed feature that never occurred keeps a zero weight; the serving
+copy (OnlineTagPredictor) keeps only that matrix and drops the classifiers.
+
+Only `feedback_type = 'tags'` rows are read (migrations/011_feedback_type.sql;
+the default 'color' rows are color corrections for consolidate_feedback.py).
+A tag row is taken as the complete tag set of its product: listed tags are
+positives and every other known label is a negative for that row.
+
+Each update is saved as a numbered checkpoint together with the last
+feedback id it consumed, so updates resume where they stopped and a bad
+update can be rolled back. Because SGD drifts with the order it sees data
+in, a full retrain over the base corpus plus all feedback runs as a safety
+net every FULL_RETRAIN_EVERY updates (or on demand) and replaces the model.
+
+Serving: get_predictor() (predictor.py) serves the current checkpoint through
+OnlineTagPredictor whenever the manifest is newer than the batch artifacts,
+so an update, retrain or rollback reaches suggestions without a restart. A
+later batch retrain (train_model.py / pipeline.py) takes over again.
+
+Usage (from AI_Project_Root, with DATABASE_URL set):
+  python -m src.optimizer.online update
+  python -m src.optimizer.online full-retrain
+  python -m src.optimizer.online status
+  python -m src.optimizer.online rollback 12
+"""
+from pathlib import Path
+from datetime import datetime
+import csv
+import json
+import os
+
+import joblib
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+
+from .predictor import TagPredictor
+from .train_model import DATA, MODEL_DIR
+
+ONLINE_DIR = MODEL_DIR / 'online'
+# Each label's SGDClassifier holds a dense float64 weight per hashed feature while training
+N_FEATURES = 2 ** 16
+FEEDBACK_BATCH_SIZE = 256
+# Full retrain after this many incremental updates
+FULL_RETRAIN_EVERY = 50
+FULL_RETRAIN_EPOCHS = 5
+KEEP_CHECKPOINTS = 10
+DEFAULT_THRESHOLD = 0.5
+DB_DSN = os.environ.get('DATABASE_URL')
+
+_FEEDBACK_SQL = """
+SELECT f.id, coalesce(p.product_name, '') || ' ' || coalesce(f.raw_value, ''), f.human_correction
+FROM training_feedback f
+LEFT JOIN products p ON p.id = f.product_id
+WHERE f.id > %s AND f.human_correction IS NOT NULL AND f.feedback_type = 'tags'
+ORDER BY f.id
+LIMIT %s"""
+
+
+def parse_labels(value):
+    """Corrections are one tag or several separated by '|' (as in the training CSV) or ','."""
+    return [lbl.strip() for lbl in (value or '').replace(',', '|').split('|') if lbl.strip()]
+
+
+def _sigmoid(z):
+    return 0.5 * (1.0 + np.tanh(0.5 * z))
+
+
+class OnlineTagModel:
+    def __init__(self, n_features=N_FEATURES, alpha=1e-5):
+        self.vectorizer = HashingVectorizer(n_features=n_features, ngram_range=(1, 2), alternate_sign=False)
+        self.alpha = alpha
+        self.labels = []
+        self._index = {}
+        self.classifiers = []
+        self.examples_seen = 0
+        self._stacked = None
+
+    def _classifier(self):
+        return SGDClassifier(loss='log_loss', alpha=self.alpha, learning_rate='optimal', random_state=0)
+
+    def partial_fit(self, texts, label_lists):
+        """Updates every label's classifier with one mini-batch."""
+        if self.classifiers is None:
+            raise RuntimeError('This model was frozen for serving and cannot be updated')
+        if not texts:
+            return self
+        for labels in label_lists:
+            for label in labels:
+                if label not in self._index:
+                    self._index[label] = len(self.labels)
+                    self.labels.append(label)
+                    self.classifiers.append(self._classifier())
+        x = self.vectorizer.transform(texts)
+        y = np.zeros((len(texts), len(self.labels)), dtype=np.int8)
+        for i, labels in enumerate(label_lists):
+            y[i, [self._index[label] for label in labels]] = 1
+        for j, clf in enumerate(self.classifiers):
+            clf.partial_fit(x, y[:, j], classes=[0, 1])
+        self.examples_seen += len(texts)
+        self._stacked = None
+        return self
+
+    def _stack(self):
+        """(features x labels) CSR of the nonzero weights, and the biases."""
+        rows, cols, values = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0)]
+        for j, clf in enumerate(self.classifiers):
+            coef = clf.coef_.ravel()
+            nonzero = np.flatnonzero(coef)
+            rows.append(nonzero)
+            cols.append(np.full(len(nonzero), j))
+            values.append(coef[nonzero])
+        weights = sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                                    shape=(self.vectorizer.n_features, len(self.classifiers)))
+        return weights, np.array([clf.intercept_[0] for clf in self.classifiers])
+
+    def decision_matrix(self, texts):
+        if self._stacked is None:
+            self._stacked = self._stack()
+        weights, bias = self._stacked
+        return (self.vectorizer.transform(list(texts)) @ weights).toarray() + bias
+
+    def proba_matrix(self, texts):
+        return _sigmoid(self.decision_matrix(texts))
+
+    def predict_many(self, texts, threshold=DEFAULT_THRESHOLD, top_k=None):
+        texts = list(texts)
+        if not texts or not self.labels:
+            return [[] for _ in texts]
+        results = []
+        for row in self.proba_matrix(texts):
+            keep = np.flatnonzero(row >= threshold)
+            keep = keep[np.argsort(-row[keep], kind='stable')][:top_k]
+            results.append([self.labels[j] for j in keep])
+        return results
+
+    def freeze(self):
+        """Keeps only the stacked weights needed to predict; partial_fit is no longer possible."""
+        if self._stacked is None:
+            self._stacked = self._stack()
+        self.classifiers = None
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.classifiers is not None:
+            state['_stacked'] = None  # rebuilt from the classifiers on first use
+        return state
+
+
+class CheckpointStore:
+    """Numbered model checkpoints plus a manifest recording what each one consumed."""
+
+    def __init__(self, root=ONLINE_DIR, keep=KEEP_CHECKPOINTS):
+        self.root = Path(root)
+        self.keep = keep
+
+    @property
+    def manifest_path(self):
+        return self.root / 'manifest.json'
+
+    def manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {'current': None, 'versions': []}
+
+    def _write_manifest(self, manifest):
+        tmp = self.manifest_path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(manifest, fh, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def current(self):
+        """(model, entry) for the current version, or (None, None)."""
+        manifest = self.manifest()
+        entry = next((v for v in manifest['versions'] if v['version'] == manifest['current']), None)
+        if entry is None:
+            return None, None
+        return joblib.load(self.root / entry['file']), entry
+
+    def save(self, model, kind, last_feedback_id, updates_since_full):
+        self.root.mkdir(parents=True, exist_ok=True)
+        manifest = self.manifest()
+        version = max((v['version'] for v in manifest['versions']), default=0) + 1
+        name = f'v{version:06d}.joblib'
+        # Weights of hashed features never seen stay zero, so checkpoints compress ~25x
+        joblib.dump(model, self.root / (name + '.tmp'), compress=3)
+        os.replace(self.root / (name + '.tmp'), self.root / name)
+        entry = {
+            'version': version,
+            'file': name,
+            'kind': kind,
+            'created': datetime.utcnow().isoformat() + 'Z',
+            'last_feedback_id': last_feedback_id,
+            'examples_seen': model.examples_seen,
+            'labels': len(model.labels),
+            'updates_since_full': updates_since_full,
+        }
+        manifest['versions'].append(entry)
+        manifest['current'] = version
+        # Prune old versions, always keeping the newest full retrain to roll back to
+        fulls = [v['version'] for v in manifest['versions'] if v['kind'] == 'full']
+        keep = {v['version'] for v in manifest['versions'][-self.keep:]} | set(fulls[-1:])
+        for old in [v for v in manifest['versions'] if v['version'] not in keep]:
+            (self.root / old['file']).unlink(missing_ok=True)
+        manifest['versions'] = [v for v in manifest['versions'] if v['version'] in keep]
+        self._write_manifest(manifest)
+        return entry
+
+    def rollback(self, version):
+        manifest = self.manifest()
+        if not any(v['version'] == version for v in manifest['versions']):
+            raise ValueError(f'No checkpoint v{version}')
+        manifest['current'] = version
+        self._write_manifest(manifest)
+
+
+class OnlineTagPredictor(TagPredictor):
+    """The TagPredictor interface over the current checkpoint of a CheckpointStore."""
+
+    def __init__(self, root=ONLINE_DIR):
+        super().__init__(root)
+
+    def _load(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            model, entry = CheckpointStore(self.model_dir).current()
+            if model is None:
+                raise FileNotFoundError(f'No current checkpoint in {self.model_dir}')
+            self.model = model.freeze()
+            self.labels = np.asarray(model.labels)
+            self.version = entry['version']
+            self._loaded = True
+
+    def decision_matrix(self, texts):
+        self._load()
+        texts = list(texts)
+        if not len(self.labels):
+            return np.zeros((len(texts), 0))
+        return self.model.decision_matrix(texts)
+
+
+def iter_feedback(conn, after_id=0, batch_size=FEEDBACK_BATCH_SIZE):
+    """Yields (last id, texts, label lists) mini-batches of feedback newer than `after_id`."""
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(_FEEDBACK_SQL, (after_id, batch_size))
+            rows = cur.fetchall()
+        if not rows:
+            return
+        after_id = rows[-1][0]
+        rows = [(text, parse_labels(correction)) for _, text, correction in rows]
+        rows = [(text, labels) for text, labels in rows if labels]
+        yield after_id, [text for text, _ in rows], [labels for _, labels in rows]
+
+
+def load_base_corpus(path=DATA):
+    """The optimizer training CSV, if present, as (texts, label lists)."""
+    try:
+        with open(path, newline='', encoding='utf-8') as fh:
+            rows = [(r['text'], parse_labels(r['labels'])) for r in csv.DictReader(fh)]
+    except FileNotFoundError:
+        return [], []
+    return [text for text, _ in rows], [labels for _, labels in rows]
+
+
+def full_retrain(conn, store=None, base_csv=DATA, epochs=FULL_RETRAIN_EPOCHS, batch_size=FEEDBACK_BATCH_SIZE):
+    """Fits a fresh model on the base corpus plus all feedback and makes it current."""
+    store = store or CheckpointStore()
+    texts, labels = load_base_corpus(base_csv)
+    last_id = 0
+    for last_id, batch_texts, batch_labels in iter_feedback(conn, 0, batch_size):
+        texts.extend(batch_texts)
+        labels.extend(batch_labels)
+    model = OnlineTagModel()
+    rng = np.random.default_rng(0)
+    for _ in range(epochs):
+        order = rng.permutation(len(texts))
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            model.partial_fit([texts[i] for i in idx], [labels[i] for i in idx])
+    model.examples_seen = len(texts)
+    entry = store.save(model, 'full', last_id, 0)
+    print(f"Full retrain: {len(texts)} examples, {len(model.labels)} labels -> v{entry['version']}")
+    return model, entry
+
+
+def update(conn, store=None, batch_size=FEEDBACK_BATCH_SIZE, full_every=FULL_RETRAIN_EVERY):
+    """
+    Folds feedback newer than the current checkpoint into the model, one
+    mini-batch at a time, and checkpoints the result. Falls back to a full
+    retrain when there is no model yet or one is due.
+    """
+    store = store or CheckpointStore()
+    model, entry = store.current()
+    if model is None or entry['updates_since_full'] >= full_every:
+        return full_retrain(conn, store, batch_size=batch_size)
+
+    last_id, consumed = entry['last_feedback_id'], 0
+    for last_id, texts, labels in iter_feedback(conn, last_id, batch_size):
+        model.partial_fit(texts, labels)
+        consumed += len(texts)
+    if last_id == entry['last_feedback_id']:
+        print(f"No new feedback since v{entry['version']}")
+        return model, entry
+    entry = store.save(model, 'incremental', last_id, entry['updates_since_full'] + 1)
+    print(f"Folded in {consumed} feedback rows -> v{entry['version']}")
+    return model, entry
+
+
+def main():
+    import argparse
+    import psycopg2
+
+    parser = argparse.ArgumentParser(description='Online learning for the optimizer tag model')
+    parser.add_argument('command', choices=('update', 'full-retrain', 'status', 'rollback'))
+    parser.add_argument('version', nargs='?', type=int)
+    args = parser.parse_args()
+    store = CheckpointStore()
+
+    if args.command == 'status':
+        manifest = store.manifest()
+        for v in manifest['versions']:
+            marker = '*' if v['version'] == manifest['current'] else ' '
+            print(f"{marker} v{v['version']:<5} {v['kind']:<11} {v['created']}  feedback<={v['last_feedback_id']}  "
+                  f"{v['examples_seen']} examples, {v['labels']} labels")
+        return
+    if args.command == 'rollback':
+        store.rollback(args.version)
+        print(f'Current checkpoint is now v{args.version}')
+        return
+    if not DB_DSN:
+        print('Please set DATABASE_URL')
+        return
+    try:
+        with psycopg2.connect(DB_DSN) as conn:
+            if args.command == 'update':
+                update(conn, store)
+            else:
+                full_retrain(conn, store)
+    except psycopg2.Error as e:
+        print(f'Database error: {e}')
+
+
+if __name__ == '__main__':
+    main()
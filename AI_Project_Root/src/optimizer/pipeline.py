@@ -0,0 +1,150 @@
+"""pipeline.py
+In-process training pipeline for the optimizer tag model:
+products CSV -> labeled rows -> TF-IDF features -> classifier -> artifacts.
+
+The vectorized corpus (fitted vectorizer and label binarizer, the sparse
+feature matrix X and label matrix Y) is cached on disk under a key made of
+the source file's hash, the vectorizer settings and the labeling code
+version. A retrain on an unchanged corpus loads X/Y and goes straight to
+fitting the classifier, with no CSV re-read or re-tokenization.
+"""
+from pathlib import Path
+import hashlib
+import json
+import shutil
+import time
+
+import joblib
+import numpy as np
+import scipy.sparse as sp
+import sklearn
+
+from .compact import export_compact
+from .generate_training_data import OUT, generate_rows, write_rows
+from .predictor import reset_predictor
+from .train_model import MODEL_DIR, VECTORIZER_PARAMS, fit_classifier, save_artifacts, vectorize
+
+HERE = Path(__file__).parent
+FEATURE_CACHE_DIR = HERE.parent.parent / 'data' / 'feature_cache'
+# Bump when generate_rows() labels products differently, to invalidate cached corpora
+LABELER_VERSION = 1
+# Cached corpora kept; older ones are removed
+MAX_CACHED_CORPORA = 4
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def feature_key(source_hash, vectorizer_params):
+    settings = json.dumps({'source': source_hash, 'vectorizer': vectorizer_params, 'labeler': LABELER_VERSION,
+                           'sklearn': sklearn.__version__}, sort_keys=True, default=list)
+    return hashlib.sha256(settings.encode('utf-8')).hexdigest()[:24]
+
+
+class FeatureCache:
+    """Vectorized corpora on disk, one directory per feature key."""
+
+    def __init__(self, root=FEATURE_CACHE_DIR, max_entries=MAX_CACHED_CORPORA):
+        self.root = Path(root)
+        self.max_entries = max_entries
+
+    def load(self, key):
+        path = self.root / key
+        if not (path / 'meta.json').exists():
+            return None
+        try:
+            vec = joblib.load(path / 'vectorizer.joblib')
+            mlb = joblib.load(path / 'mlb.joblib')
+            X = sp.load_npz(path / 'X.npz')
+            Y = np.load(path / 'Y.npy')
+        except (OSError, ValueError, EOFError):
+            return None
+        (path / 'meta.json').touch()  # mark as recently used
+        return vec, mlb, X, Y
+
+    def save(self, key, vec, mlb, X, Y, meta):
+        path = self.root / key
+        tmp = self.root / (key + '.tmp')
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        joblib.dump(vec, tmp / 'vectorizer.joblib')
+        joblib.dump(mlb, tmp / 'mlb.joblib')
+        sp.save_npz(tmp / 'X.npz', sp.csr_matrix(X))
+        np.save(tmp / 'Y.npy', Y)
+        # meta.json last: an entry without it is incomplete and ignored
+        (tmp / 'meta.json').write_text(json.dumps(meta, default=list), encoding='utf-8')
+        shutil.rmtree(path, ignore_errors=True)
+        tmp.rename(path)
+        self._evict()
+
+    def _evict(self):
+        entries = sorted((p for p in self.root.iterdir() if (p / 'meta.json').exists()),
+                         key=lambda p: (p / 'meta.json').stat().st_mtime, reverse=True)
+        for stale in entries[self.max_entries:]:
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+def build_features(source_csv, vectorizer_params=None, cache=None, training_csv=OUT):
+    """
+    Returns (vec, mlb, X, Y, info) for a products CSV, from the feature cache
+    when the source and settings are unchanged.
+    """
+    vectorizer_params = vectorizer_params or VECTORIZER_PARAMS
+    cache = cache if cache is not None else FeatureCache()
+    start = time.perf_counter()
+    key = feature_key(file_hash(source_csv), vectorizer_params)
+    info = {'feature_key': key}
+    cached = cache.load(key) if cache else None
+    if cached is not None:
+        vec, mlb, X, Y = cached
+        info.update(cache_hit=True, rows=X.shape[0], features_s=round(time.perf_counter() - start, 3))
+        return vec, mlb, X, Y, info
+
+    rows = generate_rows(source_csv)
+    if not rows:
+        raise ValueError(f'No labeled rows generated from {source_csv}')
+    if training_csv:
+        write_rows(rows, training_csv)  # kept for inspection and the standalone scripts
+    texts = [r['text'] for r in rows]
+    labels = [[lbl for lbl in r['labels'].split('|') if lbl] for r in rows]
+    vec, mlb, X, Y = vectorize(texts, labels, vectorizer_params)
+    if cache:
+        cache.save(key, vec, mlb, X, Y, {'source': str(source_csv), 'rows': len(rows),
+                                        'vectorizer': vectorizer_params, 'created': time.time()})
+    info.update(cache_hit=False, rows=len(rows), features_s=round(time.perf_counter() - start, 3))
+    return vec, mlb, X, Y, info
+
+
+def train_from_csv(source_csv, vectorizer_params=None, model_dir=MODEL_DIR, cache=None):
+    """
+    Builds (or loads cached) features for `source_csv`, fits the classifier and
+    saves the artifacts to `model_dir`, plus their compact export for serving,
+    and resets the process-wide predictor so suggestions use the new model.
+    Returns a summary dict with timings.
+    """
+    vec, mlb, X, Y, info = build_features(source_csv, vectorizer_params, cache)
+    start = time.perf_counter()
+    clf = fit_classifier(X, Y)
+    info['fit_s'] = round(time.perf_counter() - start, 3)
+    save_artifacts(vec, clf, mlb, model_dir)
+    info['compact_bytes'] = export_compact(model_dir)['bytes']
+    # The process-wide predictor (GUI, API) serves the new model from the next call
+    reset_predictor()
+    info.update(labels=len(mlb.classes_), features=X.shape[1], model_dir=str(model_dir))
+    return info
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Train the optimizer tag model in-process')
+    parser.add_argument('--source', required=True, help='Source products CSV')
+    parser.add_argument('--no-cache', action='store_true', help='Rebuild features without reading or writing the cache')
+    args = parser.parse_args()
+    summary = train_from_csv(args.source, cache=False if args.no_cache else None)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,150 @@
+"""predictor.py
+Batch predictor for the optimizer tag model (TF-IDF + OneVsRest LogisticRegression).
+
+Artifacts are loaded on first use, once, behind a lock, so importing this
+module is free and concurrent first requests don't load the model twice.
+The per-label logistic regressions are folded into one (features x labels)
+weight matrix at load time, so a batch of texts costs one sparse TF-IDF
+transform and one sparse-dense matrix multiply instead of one predict call
+per label per text.
+"""
+from pathlib import Path
+import threading
+
+import numpy as np
+
+HERE = Path(__file__).parent
+MODEL_DIR = HERE.parent.parent / 'models' / 'optimizer'
+DEFAULT_THRESHOLD = 0.5
+
+
+def _sigmoid(z):
+    # exp of large positive z would overflow; for those, 1 / (1 + exp(-z)) is already 1
+    return 0.5 * (1.0 + np.tanh(0.5 * z))
+
+
+class TagPredictor:
+    def __init__(self, model_dir=MODEL_DIR):
+        self.model_dir = Path(model_dir)
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            import joblib
+
+            vec = joblib.load(self.model_dir / 'tfidf_vectorizer.joblib')
+            clf = joblib.load(self.model_dir / 'clf.joblib')
+            mlb = joblib.load(self.model_dir / 'mlb.joblib')
+            n_features = len(vec.vocabulary_)
+            weights = np.zeros((n_features, len(clf.estimators_)), dtype=np.float64)
+            bias = np.zeros(len(clf.estimators_), dtype=np.float64)
+            for j, est in enumerate(clf.estimators_):
+                if hasattr(est, 'coef_'):
+                    weights[:, j] = est.coef_.ravel()
+                    bias[j] = est.intercept_[0]
+                else:
+                    # A label that was always (or never) present in training: constant prediction
+                    bias[j] = np.inf if np.ravel(est.y_)[0] else -np.inf
+            self.vectorizer = vec
+            self.labels = np.asarray(mlb.classes_)
+            self.weights = weights
+            self.bias = bias
+            self._loaded = True
+
+    def decision_matrix(self, texts):
+        """(n_texts, n_labels) logits for a batch."""
+        self._load()
+        x = self.vectorizer.transform(list(texts))
+        return np.asarray(x @ self.weights) + self.bias
+
+    def proba_matrix(self, texts):
+        """(n_texts, n_labels) probabilities, columns in `self.labels` order."""
+        return _sigmoid(self.decision_matrix(texts))
+
+    def rank_labels(self, row, threshold=None, top_k=None):
+        """[(label, probability), ...] for one row of proba_matrix, most probable first."""
+        keep = np.flatnonzero(row >= threshold) if threshold is not None else np.arange(len(row))
+        if top_k is not None and len(keep) > top_k:
+            keep = keep[np.argpartition(-row[keep], top_k - 1)[:top_k]]
+        keep = keep[np.argsort(-row[keep], kind='stable')]
+        return [(self.labels[i], float(row[i])) for i in keep]
+
+    def predict_proba_many(self, texts, top_k=None, threshold=None):
+        """[(label, probability), ...] per text, most probable first."""
+        texts = list(texts)
+        if not texts:
+            return []
+        return [self.rank_labels(row, threshold, top_k) for row in self.proba_matrix(texts)]
+
+    def predict_many(self, texts, threshold=DEFAULT_THRESHOLD, top_k=None):
+        """
+        Labels per text whose probability reaches `threshold` (0.5 matches
+        clf.predict), most probable first, at most `top_k` of them.
+        """
+        return [[label for label, _ in row] for row in self.predict_proba_many(texts, top_k, threshold)]
+
+    def predict(self, text, threshold=DEFAULT_THRESHOLD, top_k=None):
+        return self.predict_many([text], threshold, top_k)[0]
+
+
+_default = None
+_default_key = None
+_default_lock = threading.Lock()
+
+
+def _stamp(path):
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_ino
+
+
+def _default_artifacts():
+    """('online' | 'compact' | 'joblib', stamps) for what get_predictor() should serve right now."""
+    online = _stamp(MODEL_DIR / 'online' / 'manifest.json')
+    compact, clf = _stamp(MODEL_DIR / 'compact' / 'meta.json'), _stamp(MODEL_DIR / 'clf.joblib')
+    batch = max((s[0] for s in (compact, clf) if s is not None), default=None)
+    if online is not None and (batch is None or online[0] > batch):
+        kind = 'online'
+    elif compact is not None and (clf is None or compact[0] >= clf[0]):
+        kind = 'compact'
+    else:
+        kind = 'joblib'
+    return kind, (online, compact, clf)
+
+
+def get_predictor():
+    """
+    Process-wide predictor for the default model directory. Uses the compact
+    export (compact.py) when it is at least as new as the joblib artifacts,
+    or the online checkpoint (online.py) when its manifest is newer than both,
+    and is rebuilt when any of them changes on disk (a retrain, re-export,
+    online update or rollback).
+    """
+    global _default, _default_key
+    key = _default_artifacts()
+    with _default_lock:
+        if _default is None or key != _default_key:
+            if key[0] == 'online':
+                from .online import OnlineTagPredictor
+                _default = OnlineTagPredictor(MODEL_DIR / 'online')
+            elif key[0] == 'compact':
+                from .compact import CompactTagPredictor
+                _default = CompactTagPredictor(MODEL_DIR / 'compact')
+            else:
+                _default = TagPredictor()
+            _default_key = key
+        return _default
+
+
+def reset_predictor():
+    """Drops the process-wide predictor; the next get_predictor() loads the current artifacts."""
+    global _default, _default_key
+    with _default_lock:
+        _default = _default_key = None
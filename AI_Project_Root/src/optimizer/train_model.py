@@ -1,6 +1,8 @@
 """train_model.py
 Train a TF-IDF + OneVsRest LogisticRegression multilabel classifier.
 Saves artifacts to ml/models/optimizer/
+The steps are importable (load_training_csv / fit_classifier / save_artifacts);
+pipeline.py runs them in-process with a feature cache.
 """
 from pathlib import Path
 import joblib
@@ -13,25 +15,40 @@ from sklearn.preprocessing import MultiLabelBinarizer
 HERE = Path(__file__).parent
 DATA = HERE.parent / 'data' / 'optimizer_training.csv'
 MODEL_DIR = HERE.parent.parent / 'models' / 'optimizer'
-MODEL_DIR.mkdir(parents=True, exist_ok=True)
+VECTORIZER_PARAMS = {'ngram_range': (1, 2), 'max_features': 20000}
 
-texts = []
-labels = []
-with open(DATA, newline='', encoding='utf-8') as fh:
-    reader = csv.DictReader(fh)
-    for r in reader:
-        texts.append(r['text'])
-        labels.append([lbl for lbl in r['labels'].split('|') if lbl])
+def load_training_csv(path=DATA):
+    texts = []
+    labels = []
+    with open(path, newline='', encoding='utf-8') as fh:
+        reader = csv.DictReader(fh)
+        for r in reader:
+            texts.append(r['text'])
+            labels.append([lbl for lbl in r['labels'].split('|') if lbl])
+    return texts, labels
 
-mlb = MultiLabelBinarizer()
-Y = mlb.fit_transform(labels)
-vec = TfidfVectorizer(ngram_range=(1,2), max_features=20000)
-X = vec.fit_transform(texts)
+def vectorize(texts, labels, vectorizer_params=None):
+    mlb = MultiLabelBinarizer()
+    Y = mlb.fit_transform(labels)
+    vec = TfidfVectorizer(**(vectorizer_params or VECTORIZER_PARAMS))
+    X = vec.fit_transform(texts)
+    return vec, mlb, X, Y
 
-clf = OneVsRestClassifier(LogisticRegression(max_iter=1000))
-clf.fit(X, Y)
+def fit_classifier(X, Y):
+    clf = OneVsRestClassifier(LogisticRegression(max_iter=1000))
+    clf.fit(X, Y)
+    return clf
 
-joblib.dump(vec, MODEL_DIR / 'tfidf_vectorizer.joblib')
-joblib.dump(clf, MODEL_DIR / 'clf.joblib')
-joblib.dump(mlb, MODEL_DIR / 'mlb.joblib')
-print('Trained model saved to', MODEL_DIR)
+def save_artifacts(vec, clf, mlb, model_dir=MODEL_DIR):
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+    joblib.dump(vec, model_dir / 'tfidf_vectorizer.joblib')
+    joblib.dump(clf, model_dir / 'clf.joblib')
+    joblib.dump(mlb, model_dir / 'mlb.joblib')
+
+if __name__ == '__main__':
+    texts, labels = load_training_csv(DATA)
+    vec, mlb, X, Y = vectorize(texts, labels)
+    clf = fit_classifier(X, Y)
+    save_artifacts(vec, clf, mlb, MODEL_DIR)
+    print('Trained model saved to', MODEL_DIR)
@@ -1,10 +1,39 @@
 """train_tf.py
 Train a simple Keras model to predict product_type from title+body_html.
 Saves the model and the text vectorization layer.
+
+Also trains on the optimizer's text,labels CSV (multi-label, one sigmoid per tag).
+
+Input pipeline: texts are vectorized inside tf.data, a batch at a time, and
+the integer sequences are cached (in memory, or in a file with `--cache PATH`),
+shuffled through a bounded buffer, batched and prefetched. TextVectorization
+then runs once per text instead of once per text per epoch, and the next
+batch is ready while the current one trains. The vocabulary is adapted on a
+stream of the training texts (`--adapt-samples` caps it). Every
+`--validation-every`-th example is held out for validation.
+
+For corpora larger than RAM, `--write-tfrecords DIR` converts the CSV, read
+in chunks, into sharded TFRecord files, and `--tfrecords DIR` trains from
+them with interleaved streaming reads.
+
+Export (`--export`), for CPU inference:
+- savedmodel: product_type_serving/, a `serving_default` signature taking a
+  batch of strings; the numeric part of the model is XLA-compiled (string ops
+  can't be, so vectorization runs just outside the compiled function)
+- tflite: product_type.tflite, dynamic-range quantized; the vectorizer uses
+  Select TF ops, which the TFLite interpreter in the tensorflow package runs
+src/benchmarks/tf_inference_latency.py compares both with the sklearn optimizer.
+
+Usage (from AI_Project_Root):
+  python -m src.training.train_tf --data-path data/processed/optimizer_training.csv --export savedmodel tflite
+  python -m src.training.train_tf --data-path big.csv --write-tfrecords data/tfrecords/big --shards 16
+  python -m src.training.train_tf --tfrecords data/tfrecords/big --cache data/tf_cache/big
 """
 import argparse
+from pathlib import Path
 import pandas as pd
 import numpy as np
+import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras import layers
 import json
@@ -16,49 +45,211 @@ parser.add_argument('--data-path', type=str, default=config.PROCESSED_DATA_DIR /
 parser.add_argument('--epochs', type=int, default=config.TrainingConfig.EPOCHS, help='Number of training epochs.')
 parser.add_argument('--batch-size', type=int, default=config.TrainingConfig.BATCH_SIZE, help='Training batch size.')
 parser.add_argument('--lr', type=float, default=config.TrainingConfig.LEARNING_RATE, help='Learning rate for the optimizer.')
+parser.add_argument('--tfrecords', type=str, default=None, help='Train from the TFRecord shards in this directory instead of --data-path.')
+parser.add_argument('--write-tfrecords', type=str, default=None, help='Convert --data-path into TFRecord shards in this directory and exit.')
+parser.add_argument('--shards', type=int, default=8, help='Number of TFRecord shards to write.')
+parser.add_argument('--cache', type=str, default='memory', help="'memory', 'none', or a file path prefix for an on-disk cache.")
+parser.add_argument('--shuffle-buffer', type=int, default=10000, help='Examples held in the shuffle buffer.')
+parser.add_argument('--adapt-samples', type=int, default=None, help='Texts used to build the vocabulary (default: all).')
+parser.add_argument('--validation-every', type=int, default=10, help='Hold out every Nth example for validation (0: none).')
+parser.add_argument('--seed', type=int, default=0, help='Seed for weight init and shuffling.')
+parser.add_argument('--export', nargs='*', choices=('savedmodel', 'tflite'), default=[], help='CPU inference formats to export.')
 args = parser.parse_args()
 
 MODEL_DIR = config.TF_MODEL_DIR
+AUTOTUNE = tf.data.AUTOTUNE
+# Rows per pandas chunk when converting a CSV to TFRecords
+CSV_CHUNK_ROWS = 50000
+# Texts vectorized per call inside the input pipeline
+VECTORIZE_BATCH = 1024
+
+tf.random.set_seed(args.seed)
+
+
+def is_multi_label(path):
+    """The optimizer's text,labels CSV rather than a products CSV."""
+    return {'text', 'labels'} <= set(pd.read_csv(path, nrows=0).columns)
+
+
+def iter_csv(path, multi_label, chunksize=None):
+    """Yields (texts, labels) per chunk; labels are tag lists (multi-label) or product types."""
+    usecols = ['text', 'labels'] if multi_label else ['title', 'body_html', 'product_type']
+    chunks = pd.read_csv(path, usecols=usecols, chunksize=chunksize) if chunksize else [pd.read_csv(path, usecols=usecols)]
+    for df in chunks:
+        if multi_label:
+            texts = df['text'].fillna('').astype(str)
+            labels = df['labels'].fillna('').astype(str).map(lambda s: [lbl for lbl in s.split('|') if lbl])
+        else:
+            # simple text = title + body
+            texts = (df['title'].fillna('') + '\n' + df['body_html'].fillna('')).astype(str)
+            labels = df['product_type'].astype(str)
+        yield texts.tolist(), labels.tolist()
+
+
+def encode_labels(labels, label_to_idx, multi_label):
+    if multi_label:
+        y = np.zeros((len(labels), len(label_to_idx)), dtype=np.float32)
+        for row, tags in enumerate(labels):
+            y[row, [label_to_idx[t] for t in tags]] = 1
+        return y
+    return np.array([label_to_idx[l] for l in labels], dtype=np.int64)
+
+
+def distinct_labels(labels, multi_label):
+    return {tag for tags in labels for tag in tags} if multi_label else set(labels)
+
+
+def build_label_map(path, multi_label):
+    """label -> index over the whole CSV, read a chunk at a time."""
+    seen = set()
+    for _, labels in iter_csv(path, multi_label, CSV_CHUNK_ROWS):
+        seen |= distinct_labels(labels, multi_label)
+    return {l: i for i, l in enumerate(sorted(seen))}
 
-print('Loading data...')
-df = pd.read_csv(args.data_path)
-# simple text = title + body
-texts = (df['title'].fillna('') + '\n' + df['body_html'].fillna('')).astype(str)
-labels = df['product_type'].astype(str)
 
-# Label encoding
-label_to_idx = {l: i for i, l in enumerate(sorted(labels.unique()))}
+def write_tfrecords(path, out_dir, shards):
+    """Streams the CSV into `shards` TFRecord files plus label_map.json. Returns the example count."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    multi_label = is_multi_label(path)
+    label_to_idx = build_label_map(path, multi_label)
+    writers = [tf.io.TFRecordWriter(str(out_dir / f'part-{i:05d}-of-{shards:05d}.tfrecord')) for i in range(shards)]
+    count = 0
+    for texts, labels in iter_csv(path, multi_label, CSV_CHUNK_ROWS):
+        for text, target in zip(texts, encode_labels(labels, label_to_idx, multi_label)):
+            if multi_label:
+                label = tf.train.Feature(float_list=tf.train.FloatList(value=target.tolist()))
+            else:
+                label = tf.train.Feature(int64_list=tf.train.Int64List(value=[int(target)]))
+            example = tf.train.Example(features=tf.train.Features(feature={
+                'text': tf.train.Feature(bytes_list=tf.train.BytesList(value=[text.encode('utf-8')])),
+                'label': label,
+            }))
+            writers[count % shards].write(example.SerializeToString())
+            count += 1
+    for writer in writers:
+        writer.close()
+    with open(out_dir / 'label_map.json', 'w', encoding='utf-8') as f:
+        json.dump({'label_to_idx': label_to_idx, 'multi_label': multi_label}, f)
+    return count
+
+
+def tfrecord_dataset(directory, num_classes, multi_label):
+    """(text, label) examples streamed from the shards; file order is fixed so the validation split is stable."""
+    files = tf.data.Dataset.list_files(str(Path(directory) / '*.tfrecord'), shuffle=False)
+    records = files.interleave(tf.data.TFRecordDataset, num_parallel_calls=AUTOTUNE)
+    spec = {
+        'text': tf.io.FixedLenFeature([], tf.string),
+        'label': tf.io.FixedLenFeature([num_classes], tf.float32) if multi_label else tf.io.FixedLenFeature([], tf.int64),
+    }
+
+    def parse(record):
+        example = tf.io.parse_single_example(record, spec)
+        return example['text'], example['label']
+
+    return records.map(parse, num_parallel_calls=AUTOTUNE)
+
+
+if args.write_tfrecords:
+    n = write_tfrecords(args.data_path, args.write_tfrecords, args.shards)
+    print(f'Wrote {n} examples in {args.shards} shards to {args.write_tfrecords}')
+    raise SystemExit(0)
+
+print('Loading data...')
+if args.tfrecords:
+    with open(Path(args.tfrecords) / 'label_map.json', encoding='utf-8') as f:
+        stored = json.load(f)
+    label_to_idx, multi_label = stored['label_to_idx'], stored['multi_label']
+    examples = tfrecord_dataset(args.tfrecords, len(label_to_idx), multi_label)
+else:
+    multi_label = is_multi_label(args.data_path)
+    texts, labels = next(iter_csv(args.data_path, multi_label))
+    # Label encoding
+    label_to_idx = {l: i for i, l in enumerate(sorted(distinct_labels(labels, multi_label)))}
+    y = encode_labels(labels, label_to_idx, multi_label)
+    examples = tf.data.Dataset.from_tensor_slices((texts, y))
 idx_to_label = {i: l for l, i in label_to_idx.items()}
-y = np.array([label_to_idx[l] for l in labels])
 num_classes = len(label_to_idx)
 
+if args.validation_every:
+    indexed = examples.enumerate()
+    train_examples = indexed.filter(lambda i, ex: i % args.validation_every != 0).map(lambda i, ex: ex)
+    val_examples = indexed.filter(lambda i, ex: i % args.validation_every == 0).map(lambda i, ex: ex)
+else:
+    train_examples, val_examples = examples, None
+
 # Text vectorization
 max_tokens = 20000
 sequence_length = 256
 vectorize_layer = layers.TextVectorization(max_tokens=max_tokens, output_mode='int', output_sequence_length=sequence_length)
-vectorize_layer.adapt(texts.values)
+adapt_texts = train_examples.map(lambda text, label: text)
+if args.adapt_samples:
+    adapt_texts = adapt_texts.take(args.adapt_samples)
+vectorize_layer.adapt(adapt_texts.batch(VECTORIZE_BATCH))
 
-# Build model
+
+def prepare(ds, cache_suffix, training):
+    """Vectorize in batches, cache the int sequences, then shuffle/batch/prefetch."""
+    ds = ds.batch(VECTORIZE_BATCH).map(lambda text, label: (vectorize_layer(text), label),
+                                       num_parallel_calls=AUTOTUNE).unbatch()
+    if args.cache == 'memory':
+        ds = ds.cache()
+    elif args.cache != 'none':
+        ds = ds.cache(args.cache + cache_suffix)
+    if training:
+        ds = ds.shuffle(args.shuffle_buffer, seed=args.seed, reshuffle_each_iteration=True)
+    return ds.batch(args.batch_size).prefetch(AUTOTUNE)
+
+
+train_ds = prepare(train_examples, '.train', training=True)
+val_ds = prepare(val_examples, '.val', training=False) if val_examples is not None else None
+
+# Build model (on int sequences; the vectorizer is attached for saving and export)
 vocab_size = min(max_tokens, len(vectorize_layer.get_vocabulary()))
 embedding_dim = 128
-inputs = keras.Input(shape=(1,), dtype='string')
-x = vectorize_layer(inputs)
-x = layers.Embedding(vocab_size, embedding_dim)(x)
+inputs = keras.Input(shape=(sequence_length,), dtype='int64')
+x = layers.Embedding(vocab_size, embedding_dim)(inputs)
 x = layers.GlobalAveragePooling1D()(x)
 x = layers.Dense(128, activation='relu')(x)
-outputs = layers.Dense(num_classes, activation='softmax')(x)
+outputs = layers.Dense(num_classes, activation='sigmoid' if multi_label else 'softmax')(x)
 model = keras.Model(inputs, outputs)
 
 optimizer = keras.optimizers.Adam(learning_rate=args.lr)
-model.compile(optimizer=optimizer, loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+if multi_label:
+    model.compile(optimizer=optimizer, loss='binary_crossentropy', metrics=['binary_accuracy'])
+else:
+    model.compile(optimizer=optimizer, loss='sparse_categorical_crossentropy', metrics=['accuracy'])
 
 print('Training...')
-model.fit(texts.values, y, epochs=args.epochs, batch_size=args.batch_size, validation_split=0.1)
+model.fit(train_ds, epochs=args.epochs, validation_data=val_ds)
 
-# Save
-model.save(MODEL_DIR / 'product_type_model')
+# Save (string in, scores out, as before)
+text_input = keras.Input(shape=(1,), dtype='string')
+end_to_end = keras.Model(text_input, model(vectorize_layer(text_input)))
+end_to_end.save(MODEL_DIR / 'product_type_model')
 # Save label map
 with open(MODEL_DIR / 'label_map.json', 'w', encoding='utf-8') as f:
-    json.dump({'label_to_idx': label_to_idx, 'idx_to_label': idx_to_label}, f)
+    json.dump({'label_to_idx': label_to_idx, 'idx_to_label': idx_to_label, 'multi_label': multi_label}, f)
 
 print('Saved TF model to', MODEL_DIR)
+
+if 'savedmodel' in args.export:
+    classify = tf.function(model, jit_compile=True)
+
+    @tf.function(input_signature=[tf.TensorSpec([None], tf.string, name='text')])
+    def serve(text):
+        return {'scores': classify(vectorize_layer(text))}
+
+    serving = tf.Module()
+    serving.vectorize_layer = vectorize_layer
+    serving.model = model
+    serving.serve = serve
+    tf.saved_model.save(serving, str(MODEL_DIR / 'product_type_serving'), signatures={'serving_default': serve})
+    print('Exported SavedModel signature to', MODEL_DIR / 'product_type_serving')
+
+if 'tflite' in args.export:
+    converter = tf.lite.TFLiteConverter.from_keras_model(end_to_end)
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    (MODEL_DIR / 'product_type.tflite').write_bytes(converter.convert())
+    print('Exported TFLite model to', MODEL_DIR / 'product_type.tflite')
@@ -1,16 +1,32 @@
 """train_torch.py
 Train a simple PyTorch MLP using TF-IDF features to predict product_type.
 Saves model and vectorizer using joblib.
+
+Also trains on the optimizer's text,labels CSV (multi-label, one sigmoid per tag).
+
+By default batches stay sparse: a batch sampler hands each DataLoader fetch a
+whole batch of row indices, the CSR matrix is sliced once per batch and fed
+to the first layer as a sparse COO tensor (torch.sparse.mm), so no 20k-wide
+dense rows are allocated, copied or multiplied. `--mode dense` keeps the
+original one-densified-row-per-item path for comparison. Each epoch reports
+its time, and the run ends with the mean epoch time and peak memory.
+
+Usage (from AI_Project_Root):
+  python -m src.training.train_torch --data-path data/processed/optimizer_training.csv --workers 2
 """
 import argparse
+import resource
+import time
+
+import numpy as np
 import pandas as pd
 import joblib
 
 import torch
 import torch.nn as nn
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.data import BatchSampler, DataLoader, Dataset, RandomSampler
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.preprocessing import LabelEncoder
+from sklearn.preprocessing import LabelEncoder, MultiLabelBinarizer
 
 from src.core import config
 
@@ -19,21 +35,41 @@ parser.add_argument('--data-path', type=str, default=config.PROCESSED_DATA_DIR /
 parser.add_argument('--epochs', type=int, default=config.TrainingConfig.EPOCHS, help='Number of training epochs.')
 parser.add_argument('--batch-size', type=int, default=config.TrainingConfig.BATCH_SIZE, help='Training batch size.')
 parser.add_argument('--lr', type=float, default=config.TrainingConfig.LEARNING_RATE, help='Learning rate for the optimizer.')
+parser.add_argument('--mode', choices=('sparse', 'dense'), default='sparse', help='Feed batches as sparse tensors or densified rows.')
+parser.add_argument('--workers', type=int, default=0, help='DataLoader worker processes (0 loads batches in the main process).')
+parser.add_argument('--threads', type=int, default=None, help='Intra-op threads for torch (default: torch decides).')
+parser.add_argument('--seed', type=int, default=0, help='Seed for weight init and shuffling.')
 args = parser.parse_args()
 
 MODEL_DIR = config.TORCH_MODEL_DIR
 
+torch.manual_seed(args.seed)
+if args.threads:
+    torch.set_num_threads(args.threads)
+
 print('Loading data...')
 df = pd.read_csv(args.data_path)
-texts = (df['title'].fillna('') + '\n' + df['body_html'].fillna('')).astype(str)
-labels = df['product_type'].astype(str)
+multi_label = {'text', 'labels'} <= set(df.columns)
+if multi_label:
+    # optimizer_training.csv: one row per product, '|'-separated tags
+    texts = df['text'].fillna('').astype(str)
+    labels = df['labels'].fillna('').astype(str).map(lambda s: [lbl for lbl in s.split('|') if lbl])
+else:
+    texts = (df['title'].fillna('') + '\n' + df['body_html'].fillna('')).astype(str)
+    labels = df['product_type'].astype(str)
 
-# TF-IDF
-vectorizer = TfidfVectorizer(max_features=20000)
+# TF-IDF (float32, the dtype the model consumes, so batches need no cast)
+vectorizer = TfidfVectorizer(max_features=20000, dtype=np.float32)
 X = vectorizer.fit_transform(texts.values)
 
-le = LabelEncoder()
-y = le.fit_transform(labels)
+if multi_label:
+    le = MultiLabelBinarizer()
+    y = le.fit_transform(labels).astype(np.float32)
+    criterion = nn.BCEWithLogitsLoss()
+else:
+    le = LabelEncoder()
+    y = le.fit_transform(labels).astype(np.int64)
+    criterion = nn.CrossEntropyLoss()
 num_classes = len(le.classes_)
 
 # Simple PyTorch Dataset
@@ -44,10 +80,34 @@ class TfidfDataset(Dataset):
     def __len__(self):
         return self.X.shape[0]
     def __getitem__(self, idx):
-        return torch.tensor(self.X[idx].toarray(), dtype=torch.float32).squeeze(0), torch.tensor(self.y[idx], dtype=torch.long)
+        return torch.tensor(self.X[idx].toarray(), dtype=torch.float32).squeeze(0), torch.as_tensor(self.y[idx])
+
+class CsrBatchDataset(Dataset):
+    """
+    Indexed by a list of row indices (one whole batch, from a BatchSampler).
+    Returns the batch as COO indices/values plus its labels; the sparse tensor
+    is assembled in the training loop, so only plain tensors cross worker processes.
+    """
+    def __init__(self, X, y):
+        self.X = X.tocsr()
+        self.y = y
+    def __len__(self):
+        return self.X.shape[0]
+    def __getitem__(self, idx):
+        rows = self.X[idx].tocoo()
+        indices = torch.from_numpy(np.vstack([rows.row, rows.col]).astype(np.int64))
+        return indices, torch.from_numpy(rows.data), torch.from_numpy(self.y[idx])
 
-dataset = TfidfDataset(X, y)
-loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=True)
+if args.mode == 'sparse':
+    dataset = CsrBatchDataset(X, y)
+    sampler = BatchSampler(RandomSampler(dataset), batch_size=args.batch_size, drop_last=False)
+    # batch_size=None: the sampler already yields batches, so there is nothing to collate
+    loader = DataLoader(dataset, sampler=sampler, batch_size=None, num_workers=args.workers,
+                        persistent_workers=args.workers > 0)
+else:
+    dataset = TfidfDataset(X, y)
+    loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=True, num_workers=args.workers,
+                        persistent_workers=args.workers > 0)
 
 # Model
 class MLP(nn.Module):
@@ -62,23 +122,45 @@ class MLP(nn.Module):
             nn.Linear(128, num_classes)
         )
     def forward(self, x):
+        if x.is_sparse:
+            # Same parameters as the dense path (state_dict is unchanged); only nonzeros are multiplied
+            first = self.net[0]
+            return self.net[1:](torch.sparse.mm(x, first.weight.t()) + first.bias)
         return self.net(x)
 
 model = MLP(X.shape[1], num_classes)
-criterion = nn.CrossEntropyLoss()
 optimizer = torch.optim.Adam(model.parameters(), lr=args.lr)
 
-print('Training...')
+print(f'Training ({args.mode} batches, {X.shape[0]} rows x {X.shape[1]} features, {num_classes} classes)...')
+epoch_times = []
 for epoch in range(args.epochs):
     total_loss = 0.0
-    for xb, yb in loader:
+    start = time.perf_counter()
+    for batch in loader:
+        if args.mode == 'sparse':
+            indices, values, yb = batch
+            xb = torch.sparse_coo_tensor(indices, values, (len(yb), X.shape[1]))
+        else:
+            xb, yb = batch
         optimizer.zero_grad()
         out = model(xb)
         loss = criterion(out, yb)
         loss.backward()
         optimizer.step()
         total_loss += loss.item()
-    print(f'Epoch {epoch+1} loss {total_loss/len(loader):.4f}')
+    epoch_times.append(time.perf_counter() - start)
+    print(f'Epoch {epoch+1} loss {total_loss/len(loader):.4f} ({epoch_times[-1]:.2f}s)')
+
+# ru_maxrss is in KiB on Linux; RUSAGE_CHILDREN covers DataLoader workers that have exited
+peak_main = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+if args.workers:
+    del loader  # shut down persistent workers so their peak is recorded
+peak_workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+if epoch_times:
+    # The first epoch includes worker start-up and allocator warm-up
+    steady = epoch_times[1:] or epoch_times
+    print(f'Mean epoch time {sum(steady) / len(steady):.3f}s (first epoch {epoch_times[0]:.3f}s), '
+          f'peak RSS {peak_main:.0f} MB' + (f', largest worker {peak_workers:.0f} MB' if args.workers else ''))
 
 # Save model and vectorizer
 torch.save(model.state_dict(), MODEL_DIR / 'model.pt')
@@ -1,14 +1,25 @@
 """trainer.py
 Trainer backend used by Streamlit UI to run quick TF-IDF + OneVsRest training and return metrics.
+
+auto_suggest() grid-searches the vectorizer settings with k-fold CV. Token
+counts are computed once per n-gram range, so no corpus is tokenized twice.
+Each fold's vocabulary, max_features cut and IDF are then derived from the
+columns of its training rows only, exactly what a TfidfVectorizer fitted on
+that training split would produce, so the test fold never leaks into the
+features. All (candidate, fold) fits run in a process pool that receives the
+count matrices once, and only the winner is refit and saved.
 """
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
 from sklearn.multiclass import OneVsRestClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.preprocessing import MultiLabelBinarizer
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import KFold, train_test_split
 from sklearn.metrics import f1_score, precision_score, recall_score
+from concurrent.futures import ProcessPoolExecutor
 import joblib
 import csv
+import os
+import warnings
 from pathlib import Path
 import numpy as np
 import json
@@ -29,6 +40,24 @@ def load_data(csv_path):
     return texts, labels
 
 
+def _save_run(vec, clf, mlb, settings, metrics):
+    joblib.dump(vec, MODEL_DIR / 'tfidf_vectorizer.joblib')
+    joblib.dump(clf, MODEL_DIR / 'clf.joblib')
+    joblib.dump(mlb, MODEL_DIR / 'mlb.joblib')
+
+    # Persist last run metadata (settings + metrics + timestamp)
+    last_run = {
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'settings': settings,
+        'metrics': metrics
+    }
+    try:
+        with open(MODEL_DIR / 'last_run.json', 'w', encoding='utf-8') as fh:
+            json.dump(last_run, fh, indent=2)
+    except Exception:
+        pass
+
+
 def train_quick(csv_path, ngram=(1,2), max_features=20000, test_size=0.2, random_state=42):
     texts, labels = load_data(csv_path)
     mlb = MultiLabelBinarizer()
@@ -69,12 +98,6 @@ def train_quick(csv_path, ngram=(1,2), max_features=20000, test_size=0.2, random
     except Exception:
         top_features = {}
 
-    # Save artifacts
-    joblib.dump(vec, MODEL_DIR / 'tfidf_vectorizer.joblib')
-    joblib.dump(clf, MODEL_DIR / 'clf.joblib')
-    joblib.dump(mlb, MODEL_DIR / 'mlb.joblib')
-
-    # Persist last run metadata (settings + metrics + timestamp)
     try:
         settings = {
             'ngram_min': int(ngram[0]),
@@ -86,24 +109,58 @@ def train_quick(csv_path, ngram=(1,2), max_features=20000, test_size=0.2, random
     except Exception:
         settings = {}
 
-    last_run = {
-        'timestamp': datetime.utcnow().isoformat() + 'Z',
-        'settings': settings,
-        'metrics': metrics
-    }
-    try:
-        with open(MODEL_DIR / 'last_run.json', 'w', encoding='utf-8') as fh:
-            json.dump(last_run, fh, indent=2)
-    except Exception:
-        pass
+    _save_run(vec, clf, mlb, settings, metrics)
 
     return metrics, samples, top_features
 
 
-def auto_suggest(csv_path, ngram_options=None, max_features_options=None, test_size_options=None, random_state=42):
+# Matrices shared with grid-search workers, set once per worker by _init_worker
+_shared = {}
+
+
+def _init_worker(counts, Y):
+    _shared['counts'] = counts
+    _shared['Y'] = Y
+    warnings.filterwarnings('ignore')  # labels absent from a training fold are expected on small data
+
+
+def _fit_fold(ngram, max_features, train_idx, test_idx):
+    X_train, X_test = _fold_features(_shared['counts'][ngram], max_features, train_idx, test_idx)
+    Y = _shared['Y']
+    clf = OneVsRestClassifier(LogisticRegression(max_iter=1000))
+    clf.fit(X_train, Y[train_idx])
+    y_pred = clf.predict(X_test)
+    y_test = Y[test_idx]
+    return {
+        'f1_macro': float(f1_score(y_test, y_pred, average='macro', zero_division=0)),
+        'precision_macro': float(precision_score(y_test, y_pred, average='macro', zero_division=0)),
+        'recall_macro': float(recall_score(y_test, y_pred, average='macro', zero_division=0)),
+    }
+
+
+def _fold_features(counts, max_features, train_idx, test_idx):
+    """
+    (train, test) TF-IDF matrices a TfidfVectorizer(max_features=...) fitted on
+    the training rows would produce, from full-corpus counts.
+    """
+    train = counts[train_idx]
+    tfs = np.asarray(train.sum(axis=0)).ravel()
+    # The training split's vocabulary: terms that occur in it, columns kept in order
+    keep = np.flatnonzero(tfs)
+    if max_features is not None and len(keep) > max_features:
+        # Same selection as CountVectorizer._limit_features: highest total counts
+        keep = np.sort(keep[(-tfs[keep]).argsort()[:max_features]])
+    tfidf = TfidfTransformer().fit(train[:, keep])
+    return tfidf.transform(train[:, keep]), tfidf.transform(counts[test_idx][:, keep])
+
+
+def auto_suggest(csv_path, ngram_options=None, max_features_options=None, test_size_options=None, random_state=42,
+                 processes=None):
     """Run a small grid search over the provided options and return the best settings.
 
-    This will retrain a final model with the best settings and save artifacts.
+    Each candidate is scored by k-fold CV (k = round(1 / test_size), so test_size=0.2
+    is 5-fold) on counts computed once per n-gram range. All folds of all candidates
+    run in parallel; the winner is then refit on all data and its artifacts saved.
     """
     if ngram_options is None:
         ngram_options = [(1, 1), (1, 2)]
@@ -112,31 +169,85 @@ def auto_suggest(csv_path, ngram_options=None, max_features_options=None, test_s
     if test_size_options is None:
         test_size_options = [0.2]
 
-    best = None
-    best_score = -1.0
+    texts, labels = load_data(csv_path)
+    mlb = MultiLabelBinarizer()
+    Y = mlb.fit_transform(labels)
+
+    counts = {}
     results = []
+    candidates = []
     for ngram in ngram_options:
-        for mf in max_features_options:
-            for ts in test_size_options:
+        try:
+            counts[tuple(ngram)] = CountVectorizer(ngram_range=tuple(ngram)).fit_transform(texts).tocsr()
+        except Exception as e:
+            results.extend({'ngram': ngram, 'max_features': mf, 'test_size': ts, 'error': str(e)}
+                           for mf in max_features_options for ts in test_size_options)
+            continue
+        candidates.extend((ngram, mf, ts) for mf in max_features_options for ts in test_size_options)
+
+    tasks = []
+    for ngram, mf, ts in candidates:
+        n_splits = max(2, min(len(texts), round(1 / ts)))
+        folds = KFold(n_splits=n_splits, shuffle=True, random_state=random_state).split(texts)
+        tasks.extend(((ngram, mf, ts), train_idx, test_idx) for train_idx, test_idx in folds)
+
+    fold_metrics = {}
+    errors = {}
+    workers = min(len(tasks), processes or os.cpu_count() or 1)
+    if workers == 1:
+        # single core: run inline, a pool would only add start-up and pickling cost
+        with warnings.catch_warnings():
+            _init_worker(counts, Y)
+            for cand, train_idx, test_idx in tasks:
+                try:
+                    fold_metrics.setdefault(cand, []).append(_fit_fold(tuple(cand[0]), cand[1], train_idx, test_idx))
+                except Exception as e:
+                    errors[cand] = str(e)
+        _shared.clear()
+    elif tasks:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(counts, Y)) as pool:
+            futures = [(cand, pool.submit(_fit_fold, tuple(cand[0]), cand[1], train_idx, test_idx))
+                       for cand, train_idx, test_idx in tasks]
+            for cand, future in futures:
                 try:
-                    metrics, _, _ = train_quick(csv_path, ngram=ngram, max_features=mf, test_size=ts, random_state=random_state)
+                    fold_metrics.setdefault(cand, []).append(future.result())
                 except Exception as e:
-                    # skip failing combos
-                    results.append({'ngram': ngram, 'max_features': mf, 'test_size': ts, 'error': str(e)})
-                    continue
-                score = metrics.get('f1_macro', 0.0)
-                results.append({'ngram': ngram, 'max_features': mf, 'test_size': ts, 'metrics': metrics})
-                if score > best_score:
-                    best_score = score
-                    best = {'ngram': ngram, 'max_features': mf, 'test_size': ts, 'metrics': metrics}
-
-    # retrain final model with best settings and save artifacts
+                    errors[cand] = str(e)
+
+    best = None
+    best_score = -1.0
+    for cand in candidates:
+        ngram, mf, ts = cand
+        if cand in errors:
+            # skip failing combos
+            results.append({'ngram': ngram, 'max_features': mf, 'test_size': ts, 'error': errors[cand]})
+            continue
+        folds = fold_metrics[cand]
+        metrics = {name: float(np.mean([m[name] for m in folds])) for name in folds[0]}
+        metrics['f1_macro_std'] = float(np.std([m['f1_macro'] for m in folds]))
+        metrics['folds'] = len(folds)
+        results.append({'ngram': ngram, 'max_features': mf, 'test_size': ts, 'metrics': metrics})
+        if metrics['f1_macro'] > best_score:
+            best_score = metrics['f1_macro']
+            best = {'ngram': ngram, 'max_features': mf, 'test_size': ts, 'metrics': metrics}
+
+    # refit only the winner on all data and save its artifacts
     if best is not None:
-        # train_quick already saves artifacts on each run; ensure last_run.json reflects best
+        vec = TfidfVectorizer(ngram_range=tuple(best['ngram']), max_features=best['max_features'])
+        X = vec.fit_transform(texts)
+        clf = OneVsRestClassifier(LogisticRegression(max_iter=1000)).fit(X, Y)
         try:
-            # train once more to ensure artifacts and last_run are set with chosen settings
-            train_quick(csv_path, ngram=best['ngram'], max_features=best['max_features'], test_size=best['test_size'], random_state=random_state)
+            settings = {
+                'ngram_min': int(best['ngram'][0]),
+                'ngram_max': int(best['ngram'][1]),
+                # None (no cap) is a valid option; keep it as-is
+                'max_features': None if best['max_features'] is None else int(best['max_features']),
+                'test_size': float(best['test_size']),
+                'random_state': int(random_state),
+                'cv_folds': best['metrics']['folds'],
+            }
         except Exception:
-            pass
+            settings = {}
+        _save_run(vec, clf, mlb, settings, best['metrics'])
 
     return {'best': best, 'grid': results}
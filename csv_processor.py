@@ -5,11 +5,19 @@ import os
 # Add the project root to the Python path
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, project_root)
+# AI_Project_Root hosts the shared `src` package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'AI_Project_Root'))
 
 import pandas as pd
 import psycopg2
 import joblib
 from AI_Project_Root.embedding_generator import EmbeddingGenerator
+from src.ingest.fingerprints import FingerprintIndex, ImportCounts
+from src.ingest.pipeline import run_pipeline
+from src.ingest.products import embed_chunk, normalize_chunk, validate_chunk
+from src.ingest.shopify_csv import MissingColumnsError, ShopifyCsvReader
+from src.ingest.staging import StagingBatch
+from src.ingest.variants import fold_chunks, iter_grouped_chunks
 
 # --- Placeholders ---
 DB_HOST = "your-db-host"
@@ -18,6 +26,17 @@ DB_USER = "your-db-user"
 DB_PASSWORD = "your-db-password"
 MODEL_PATH = "../AI_Project_Root/models/normalization_model.joblib"
 
+# Only these columns are parsed; 'product_name' falls back to a Shopify 'Title' column.
+# When a 'Handle' column is present, variant/image rows are folded into their product.
+CSV_COLUMNS = {"product_name": ("product_name", "title"), "color": ("color", "raw_color"), "handle": ("handle",)}
+# Incremental imports: products are keyed by handle (or name) and skipped when
+# the fields their derived data comes from are unchanged since the last commit.
+FINGERPRINT_NAMESPACE = "csv_products"
+FINGERPRINT_COLUMNS = ("product_name", "color")
+# Rows per pipeline batch and batches buffered between stages
+CHUNK_ROWS = 5000
+QUEUE_SIZE = 4
+
 def load_normalization_model():
     """
     Loads the normalization model from the .joblib file.
@@ -33,50 +52,127 @@ def load_normalization_model():
         print(f"Error loading normalization model: {e}")
         return {}
 
-def process_csv_upload(file_path):
+def get_connection():
+    """Establishes and returns a database connection."""
+    return psycopg2.connect(
+        host=DB_HOST,
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD
+    )
+
+def stage_csv_upload(file_path, chunk_rows=CHUNK_ROWS, queue_size=QUEUE_SIZE, incremental=True):
     """
-    Processes a CSV file, generates predictions and embeddings, and inserts into the database.
+    Normalizes, validates and embeds a CSV file into a new staging batch (P1-P4).
+
+    Runs as a streaming pipeline (read chunk -> diff -> normalize -> embed -> stage)
+    with each stage in its own thread, connected by bounded queues. With
+    `incremental`, products unchanged since the last committed import are dropped
+    before any normalization or embedding work. Returns the StagingBatch, or None
+    if the file could not be read.
     """
     normalization_model = load_normalization_model()
     embedding_generator = EmbeddingGenerator()
 
     try:
-        df = pd.read_csv(file_path)
+        reader = ShopifyCsvReader(file_path, CSV_COLUMNS, required=("product_name",))
     except FileNotFoundError:
         print(f"Error: File not found at {file_path}")
-        return
+        return None
+    except MissingColumnsError as e:
+        print(f"Error processing CSV file: {e}")
+        return None
 
+    batch = StagingBatch()
+    counts = ImportCounts()
+    fingerprints = FingerprintIndex(namespace=FINGERPRINT_NAMESPACE) if incremental else None
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD
-        )
-        cursor = conn.cursor()
-
-        for index, row in df.iterrows():
-            product_name = row["product_name"]
-            raw_color = row.get("color") # Assuming a 'color' column in the CSV
-
-            # Generate ML prediction
-            ml_prediction = normalization_model.get(raw_color.lower(), raw_color) if raw_color else None
-
-            # Generate embedding
-            embedding = embedding_generator.generate_embedding(product_name)
-
-            # Insert into database
-            cursor.execute(
-                """INSERT INTO products (product_name, normalized_color, embedding, needs_review)
-                   VALUES (%s, %s, %s, %s);""",
-                (product_name, ml_prediction, embedding, True)
-            )
-
-        conn.commit()
-        cursor.close()
-        conn.close()
-        print(f"Successfully processed and inserted {len(df)} products from {file_path}")
-
-    except (psycopg2.Error, pd.errors.EmptyDataError, KeyError) as e:
+        if "handle" in reader.resolved:
+            # Shopify export: one row per product instead of one per variant/image
+            chunks = fold_chunks(iter_grouped_chunks(reader, chunk_rows))
+        else:
+            chunks = reader.iter_chunks(chunk_rows)
+        stages = []
+        if fingerprints is not None:
+            key_column = "handle" if "handle" in reader.resolved else "product_name"
+            stages.append(("diff", lambda df: fingerprints.filter_changed(df, key_column, FINGERPRINT_COLUMNS, counts)))
+        stages += [
+            ("normalize", lambda df: validate_chunk(normalize_chunk(df, normalization_model), normalization_model)),
+            ("embed", lambda df: embed_chunk(df, embedding_generator)),
+            ("stage", batch.write_chunk),
+        ]
+        stats = run_pipeline(chunks, stages, queue_size=queue_size)
+    except (pd.errors.EmptyDataError, KeyError) as e:
         print(f"Error processing CSV file: {e}")
+        batch.discard()
+        return None
+    except Exception:
+        # Don't leave a half-written batch behind in the staging area
+        batch.discard()
+        raise
+    finally:
+        if fingerprints is not None:
+            fingerprints.close()
+
+    batch.finalize(file_path)
+    print(f"Staged {batch.row_count} rows ({batch.error_count} with errors) from {file_path} as batch {batch.batch_id}")
+    if incremental:
+        print(f"Import delta: {counts.summary()}")
+    print(stats.summary())
+    if embedding_generator.cache:
+        print(embedding_generator.cache.stats.summary())
+    return batch
+
+def record_fingerprints(batch, include_errors=False):
+    """
+    Marks the committed rows of a staged batch as processed in the fingerprint index.
+    """
+    if "fingerprint" not in batch.columns:
+        return
+    fingerprints = FingerprintIndex(namespace=FINGERPRINT_NAMESPACE)
+    try:
+        for df in batch.committed_rows(["fingerprint_key", "fingerprint"], include_errors):
+            fingerprints.record(df["fingerprint_key"], df["fingerprint"])
+    finally:
+        fingerprints.close()
 
+def commit_staged_upload(batch_id, include_errors=False):
+    """
+    Bulk-loads a staged batch into the products table in one transaction (P7).
+    Returns the number of rows loaded, or None if the commit failed.
+    """
+    batch = StagingBatch.open(batch_id)
+    try:
+        conn = get_connection()
+        try:
+            loaded = batch.commit(conn, include_errors=include_errors)
+        finally:
+            conn.close()
+    except psycopg2.Error as e:
+        print(f"Error committing staging batch {batch_id}: {e}")
+        return None
+    record_fingerprints(batch, include_errors)
+    updated = batch.manifest.get("updated_rows", 0)
+    print(f"Successfully loaded {loaded} products from staging batch {batch_id} "
+          f"({loaded - updated} inserted, {updated} updated)")
+    return loaded
+
+def discard_staged_upload(batch_id):
+    """
+    Deletes a staged batch without touching the database (P8).
+    """
+    StagingBatch.open(batch_id).discard()
+    print(f"Discarded staging batch {batch_id}")
+
+def process_csv_upload(file_path, chunk_rows=CHUNK_ROWS, queue_size=QUEUE_SIZE, incremental=True):
+    """
+    Processes a CSV file, generates predictions and embeddings, and inserts into the database.
+
+    Stages the file, commits every staged row (all are flagged needs_review) and
+    removes the staging files once the commit succeeds.
+    """
+    batch = stage_csv_upload(file_path, chunk_rows=chunk_rows, queue_size=queue_size, incremental=incremental)
+    if batch is None:
+        return
+    if commit_staged_upload(batch.batch_id, include_errors=True) is not None:
+        batch.discard()
@@ -1,9 +1,16 @@
 
+import os
+import sys
+
 import requests
 import pandas as pd
 import psycopg2
 from psycopg2.extras import execute_values
 
+# AI_Project_Root hosts the shared `src` package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "AI_Project_Root"))
+from src.ingest.fingerprints import FingerprintIndex, ImportCounts
+
 # --- Placeholders ---
 SHOPIFY_API_URL = "https://your-shop-name.myshopify.com/admin/api/2023-10/products.json"
 SHOPIFY_ACCESS_TOKEN = "your-shopify-access-token"
@@ -12,6 +19,10 @@ DB_NAME = "your-db-name"
 DB_USER = "your-db-user"
 DB_PASSWORD = "your-db-password"
 
+# Products are skipped on re-import when these fields are unchanged since the last insert.
+FINGERPRINT_NAMESPACE = "shopify_api"
+FINGERPRINT_COLUMNS = ("product_name", "body_html", "tags")
+
 def fetch_shopify_products():
     """
     Fetches product data from the Shopify API.
@@ -46,6 +57,21 @@ def structure_product_data(products):
     
     return pd.DataFrame(product_list)
 
+def filter_changed_products(df):
+    """
+    Keeps only products that are new or changed since the last successful insert.
+    Returns the filtered DataFrame and the ImportCounts for the run.
+    """
+    counts = ImportCounts()
+    if df.empty:
+        return df, counts
+    fingerprints = FingerprintIndex(namespace=FINGERPRINT_NAMESPACE)
+    try:
+        df = fingerprints.filter_changed(df, "shopify_id", FINGERPRINT_COLUMNS, counts)
+    finally:
+        fingerprints.close()
+    return df, counts
+
 def insert_into_products_table(df):
     """
     Inserts the product data into the 'products' table in the database.
@@ -74,10 +100,12 @@ def insert_into_products_table(df):
             for index, row in df.iterrows()
         ]
         
-        # Using execute_values for efficient bulk insertion
+        # Using execute_values for efficient bulk insertion. Only new or changed
+        # products reach this point, so conflicting rows are updated in place.
         execute_values(
             cursor,
-            "INSERT INTO products (shopify_id, product_name) VALUES %s ON CONFLICT (shopify_id) DO NOTHING",
+            """INSERT INTO products (shopify_id, product_name) VALUES %s
+               ON CONFLICT (shopify_id) DO UPDATE SET product_name = EXCLUDED.product_name""",
             data_to_insert
         )
 
@@ -86,6 +114,13 @@ def insert_into_products_table(df):
         conn.close()
         print(f"Successfully inserted/updated {len(data_to_insert)} products.")
 
+        if "fingerprint" in df.columns:
+            fingerprints = FingerprintIndex(namespace=FINGERPRINT_NAMESPACE)
+            try:
+                fingerprints.record(df["fingerprint_key"], df["fingerprint"])
+            finally:
+                fingerprints.close()
+
     except psycopg2.Error as e:
         print(f"Database error: {e}")
 
@@ -97,6 +132,8 @@ if __name__ == "__main__":
     if raw_products:
         print("Structuring product data...")
         product_df = structure_product_data(raw_products)
+        product_df, counts = filter_changed_products(product_df)
+        print(f"Import delta: {counts.summary()}")
         print("Sample of extracted data:")
         print(product_df.head())
 
@@ -1,10 +1,18 @@
 from fastapi import FastAPI, Request, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import uvicorn
 import json
 import psycopg2
 import joblib
 import os
+import sys
+import threading
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "AI_Project_Root"))
+from src.core.search import HybridSearch
+from src.optimizer.batcher import MicroBatcher, QueueFull
+from src.optimizer.predictor import DEFAULT_THRESHOLD, get_predictor
 
 # --- Pydantic Models for Data Validation ---
 
@@ -21,6 +29,18 @@ class BulkProductData(BaseModel):
     products: list[BulkProductItem]
 
 
+# A product (or free text) to suggest optimizer tags for
+class TagRequest(BaseModel):
+    title: str = ""
+    body_html: str | None = None
+    top_k: int | None = Field(default=None, ge=1)
+    threshold: float = Field(default=DEFAULT_THRESHOLD, ge=0, le=1)
+
+
+class BulkTagRequest(BaseModel):
+    products: list[TagRequest]
+
+
 # --- Configuration & Globals ---
 
 # FIX: Model path adjusted to look one directory up (../)
@@ -33,6 +53,8 @@ DB_USER = "your-db-user"
 DB_PASSWORD = "your-db-password"
 
 normalization_model = {}
+hybrid_search = None  # created on first search (loads the embedding model)
+hybrid_search_lock = threading.Lock()
 
 # --- FastAPI App Instantiation ---
 app = FastAPI()
@@ -264,10 +286,18 @@ async def bulk_stage_data(data: BulkProductData):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+# What training_feedback.human_correction holds (migrations/011_feedback_type.sql)
+FEEDBACK_TYPES = ("color", "tags")
+
+
 @app.post("/submit_feedback")
 async def submit_feedback(request: Request):
     """
     Accepts feedback data and handles the P-7 logic.
+
+    `feedback_type` is "color" (default: human_correction is the product's
+    normalized color) or "tags" (a complete '|'-separated optimizer tag set,
+    folded into the tag model by src/optimizer/online.py).
     """
     try:
         feedback_data = await request.json()
@@ -275,6 +305,9 @@ async def submit_feedback(request: Request):
         raw_value = feedback_data.get("raw_value")
         ml_prediction = feedback_data.get("ml_prediction")
         human_correction = feedback_data.get("human_correction")
+        feedback_type = feedback_data.get("feedback_type", "color")
+        if feedback_type not in FEEDBACK_TYPES:
+            raise HTTPException(status_code=400, detail=f"feedback_type must be one of {', '.join(FEEDBACK_TYPES)}")
 
         conn = psycopg2.connect(
             host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
@@ -283,19 +316,22 @@ async def submit_feedback(request: Request):
 
         # 1. Insert into training_feedback
         cursor.execute(
-            """INSERT INTO training_feedback (product_id, raw_value, ml_prediction, human_correction)
-               VALUES (%s, %s, %s, %s);""",
-            (product_id, raw_value, ml_prediction, human_correction),
+            """INSERT INTO training_feedback (product_id, raw_value, ml_prediction, human_correction, feedback_type)
+               VALUES (%s, %s, %s, %s, %s);""",
+            (product_id, raw_value, ml_prediction, human_correction, feedback_type),
         )
 
         # 2. Mark the product as reviewed (P-7 logic) and update its final normalized value
-        cursor.execute(
-            "UPDATE products SET needs_review = FALSE, normalized_color = %s WHERE id = %s",
-            (
-                human_correction,
-                product_id,
-            ),
-        )
+        if feedback_type == "color":
+            cursor.execute(
+                "UPDATE products SET needs_review = FALSE, normalized_color = %s WHERE id = %s",
+                (
+                    human_correction,
+                    product_id,
+                ),
+            )
+        else:
+            cursor.execute("UPDATE products SET needs_review = FALSE WHERE id = %s", (product_id,))
 
         conn.commit()
         cursor.close()
@@ -307,6 +343,8 @@ async def submit_feedback(request: Request):
             detail=f"Feedback for product {product_id} received and product marked reviewed.",
         )
 
+    except HTTPException:
+        raise
     except psycopg2.Error as e:
         print(f"ERROR: Database error on feedback insert: {e}")
         raise HTTPException(status_code=500, detail="Database error")
@@ -315,3 +353,117 @@ async def submit_feedback(request: Request):
     except Exception as e:
         print(f"ERROR: Internal error during feedback processing: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# --- Hybrid Search ---
+
+
+def get_hybrid_search():
+    global hybrid_search
+    if hybrid_search is None:
+        # Sync endpoints run on FastAPI's threadpool; build one instance (one pool and executor)
+        with hybrid_search_lock:
+            if hybrid_search is None:
+                from embedding_generator import EmbeddingGenerator
+
+                generator = EmbeddingGenerator()
+                hybrid_search = HybridSearch(embed=generator.generate_embeddings)
+    return hybrid_search
+
+
+def run_search(**kwargs):
+    try:
+        return get_hybrid_search().search(**kwargs)
+    except psycopg2.Error as e:
+        print(f"ERROR: Database error during search: {e}")
+        raise HTTPException(status_code=500, detail="Database error")
+
+
+@app.get("/search")
+def search(q: str, k: int = 10, text_weight: float = 1.0, vector_weight: float = 1.0):
+    """
+    Hybrid search: full-text (storefront_tsv) and vector kNN run concurrently,
+    fused by reciprocal rank. Hot queries are served from a TTL cache; the
+    response includes per-stage timings.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Empty query")
+    return run_search(text=q, k=min(max(k, 1), 100), text_weight=text_weight, vector_weight=vector_weight)
+
+
+@app.get("/products/{product_id}/similar")
+def similar(product_id: str, k: int = 10):
+    """
+    Likely duplicates or close variants of a catalog entry: products matching its
+    title and products nearest to its embedding, fused the same way as /search.
+    """
+    try:
+        product_id = str(uuid.UUID(product_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="product_id must be a UUID")
+    response = run_search(product_id=product_id, k=min(max(k, 1), 100))
+    if not response["results"]:
+        # No neighbours at all: tell an isolated product from one that doesn't exist
+        try:
+            exists = get_hybrid_search().has_product(product_id)
+        except psycopg2.Error as e:
+            print(f"ERROR: Database error during search: {e}")
+            raise HTTPException(status_code=500, detail="Database error")
+        if not exists:
+            raise HTTPException(status_code=404, detail="Product not found")
+    return response
+
+
+# --- Tag Suggestions (optimizer model) ---
+
+BULK_TAG_BATCH_SIZE = 1024
+
+
+def tag_text(item):
+    return (item.title or "") + "\n" + (item.body_html or "")
+
+
+def suggest_tags_batch(items):
+    """One transform + matmul for all items, then each item's own top_k/threshold."""
+    predictor = get_predictor()
+    proba = predictor.proba_matrix([tag_text(item) for item in items])
+    return [
+        [{"label": label, "score": round(score, 4)} for label, score in predictor.rank_labels(row, item.threshold, item.top_k)]
+        for item, row in zip(items, proba)
+    ]
+
+
+tag_batcher = MicroBatcher(suggest_tags_batch)
+
+
+@app.post("/suggest_tags")
+async def suggest_tags(item: TagRequest):
+    """
+    Suggests optimizer tags for one product. Concurrent requests are gathered
+    for a few milliseconds and answered by one batched inference.
+    """
+    try:
+        return {"tags": await tag_batcher.submit(item)}
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Tag service overloaded, retry shortly")
+    except FileNotFoundError:
+        raise HTTPException(status_code=503, detail="Optimizer model not trained")
+
+
+@app.post("/suggest_tags/bulk")
+def suggest_tags_bulk(data: BulkTagRequest):
+    """
+    Suggests tags for a whole catalog, in batches of BULK_TAG_BATCH_SIZE.
+    """
+    try:
+        results = []
+        for start in range(0, len(data.products), BULK_TAG_BATCH_SIZE):
+            results.extend(suggest_tags_batch(data.products[start:start + BULK_TAG_BATCH_SIZE]))
+        return {"count": len(results), "tags": results}
+    except FileNotFoundError:
+        raise HTTPException(status_code=503, detail="Optimizer model not trained")
+
+
+@app.get("/suggest_tags/stats")
+def suggest_tags_stats():
+    return tag_batcher.stats()
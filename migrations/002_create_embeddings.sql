@@ -13,10 +13,12 @@ CREATE TABLE IF NOT EXISTS product_embeddings (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
 );
 
--- Example index for approximate nearest neighbors using pgvector's ivfflat
--- Create an index only after you've populated the table and chosen appropriate "lists" value.
--- The index creation may require superuser permissions.
--- CREATE INDEX product_embeddings_embedding_ivfflat_idx ON product_embeddings USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+-- Approximate nearest neighbor indexes are managed by src/core/vector_db_manager.py rather than created here:
+--   python -m src.core.vector_db_manager ensure-index
+-- It picks ivfflat (lists from the row count) or HNSW per metadata kind, builds CONCURRENTLY once the table is
+-- populated, and rebuilds as the data grows. Equivalent manual form for ~100k product rows:
+-- CREATE INDEX CONCURRENTLY product_embeddings_product_embedding_idx ON product_embeddings
+--   USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100) WHERE COALESCE(metadata->>'kind', 'product') = 'product';
 
 -- For exact similarity (small dataset) you can use a sequential scan with similarity operator
 -- We'll also create a materialized text search to help hybrid queries if needed
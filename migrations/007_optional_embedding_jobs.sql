@@ -1,28 +1,30 @@
 -- 007_optional_embedding_jobs.sql
--- Optional jobs table to track embedding generation
+-- Optional jobs table to track embedding generation (see src/embeddings/jobs.py)
 
--- Note: MSSQL does not have a native uuid_generate_v4() equivalent that can be used as a column default.
--- Instead, the UNIQUEIDENTIFIER type is used, and NEWID() or NEWSEQUENTIALID() is typically the default.
-
-CREATE TABLE embedding_jobs (
-    -- Use UNIQUEIDENTIFIER for UUID and NEWID() for a random UUID default.
-    id UNIQUEIDENTIFIER PRIMARY KEY DEFAULT NEWID(),
-    
-    -- Assuming 'products' table also uses UNIQUEIDENTIFIER for its 'id'
-    product_id UNIQUEIDENTIFIER FOREIGN KEY REFERENCES products(id) ON DELETE CASCADE,
-    
-    status NVARCHAR(50) DEFAULT 'pending', -- pending, in_progress, done, failed (using NVARCHAR instead of TEXT)
-    attempts INT DEFAULT 0,
-    last_error NVARCHAR(MAX), -- Using NVARCHAR(MAX) instead of TEXT
-    
-    -- Use DATETIMEOFFSET for timezone-aware data and GETUTCDATE() or SYSDATETIMEOFFSET() for default.
-    created_at DATETIMEOFFSET DEFAULT SYSDATETIMEOFFSET(), 
-    updated_at DATETIMEOFFSET DEFAULT SYSDATETIMEOFFSET()
+-- Workers claim pending jobs with FOR UPDATE SKIP LOCKED and hold a lease
+-- (locked_until) while embedding; expired leases are put back in the queue.
+CREATE TABLE IF NOT EXISTS embedding_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'pending', -- pending, in_progress, done, failed
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_after TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(), -- retry backoff
+    locked_by TEXT, -- worker id (host:pid) holding the lease
+    locked_until TIMESTAMP WITH TIME ZONE,
+    requeued BOOLEAN NOT NULL DEFAULT false, -- product changed while in progress; run again
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
 );
 
--- MSSQL uses a different syntax for 'CREATE INDEX IF NOT EXISTS' via conditional logic
--- or simply relies on the CREATE INDEX statement without the IF NOT EXISTS clause.
--- If the migration tool supports it, using the simple CREATE INDEX is often preferred
--- as the tool handles existence checks.
+-- At most one open job per product; enqueueing an open product is a no-op
+-- (or flags an in-progress job to run again).
+CREATE UNIQUE INDEX IF NOT EXISTS embedding_jobs_open_product_idx
+    ON embedding_jobs (product_id) WHERE status IN ('pending', 'in_progress');
+
+-- Claim order and stale-lease sweeps only touch open jobs
+CREATE INDEX IF NOT EXISTS embedding_jobs_pending_idx ON embedding_jobs (id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS embedding_jobs_lease_idx ON embedding_jobs (locked_until) WHERE status = 'in_progress';
 
-CREATE INDEX embedding_jobs_status_idx ON embedding_jobs (status);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS embedding_jobs_status_idx ON embedding_jobs (status);
@@ -0,0 +1,15 @@
+-- 009_embedding_cache.sql
+-- Content-addressed embedding cache shared by ingest workers (see src/embeddings/cache.py)
+
+-- cache_key is a hash of (model name, text); vectors are stored as raw float32 bytes.
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    cache_key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    dim INT NOT NULL,
+    vector BYTEA NOT NULL,
+    size_bytes INT NOT NULL,
+    last_used TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+
+-- Eviction removes the least recently used entries first
+CREATE INDEX IF NOT EXISTS embedding_cache_last_used_idx ON embedding_cache (last_used);
@@ -0,0 +1,12 @@
+-- 010_search_tsv_index.sql
+-- GIN index on the trigger-maintained storefront_tsv column (migration 003), used by
+-- hybrid search (src/core/search.py). The expression index in 001 only serves
+-- queries that repeat the to_tsvector() expression, and ranking on it recomputes
+-- the tsvector for every match.
+
+-- Rows written before the trigger existed
+UPDATE products
+SET storefront_tsv = to_tsvector('english', coalesce(title,'') || ' ' || coalesce(body_html,''))
+WHERE storefront_tsv IS NULL;
+
+CREATE INDEX IF NOT EXISTS products_storefront_tsv_col_idx ON products USING GIN (storefront_tsv);
@@ -0,0 +1,29 @@
+-- 011_feedback_type.sql
+-- Reviewer corrections (main.py /submit_feedback). Like the rest of this chain
+-- it targets the UUID products table from 001; schema.sql defines the same
+-- table for its standalone schema. The table is created here if no earlier
+-- schema did, and existing tables gain the feedback_type column.
+--
+-- feedback_type says what a row corrects. 'color' rows (the review TUI's
+-- default) are normalized colors, consumed by consolidate_feedback.py; 'tags'
+-- rows are complete optimizer tag sets, consumed by src/optimizer/online.py.
+
+CREATE TABLE IF NOT EXISTS training_feedback (
+    id SERIAL PRIMARY KEY,
+    product_id UUID REFERENCES products(id) ON DELETE CASCADE,
+    raw_value TEXT,
+    ml_prediction TEXT,
+    human_correction TEXT NOT NULL,
+    feedback_type TEXT NOT NULL DEFAULT 'color',
+    processed BOOLEAN NOT NULL DEFAULT false, -- set by consolidate_feedback.py
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+ALTER TABLE training_feedback
+    ADD COLUMN IF NOT EXISTS feedback_type TEXT NOT NULL DEFAULT 'color';
+
+ALTER TABLE training_feedback DROP CONSTRAINT IF EXISTS training_feedback_type_check;
+ALTER TABLE training_feedback
+    ADD CONSTRAINT training_feedback_type_check CHECK (feedback_type IN ('color', 'tags'));
+
+CREATE INDEX IF NOT EXISTS training_feedback_type_id_idx ON training_feedback (feedback_type, id);
@@ -0,0 +1,11 @@
+-- 012_products_import_key.sql
+-- CSV imports (csv_processor.py / src/ingest/staging.py) match re-imported
+-- products by handle and update the existing row instead of inserting a
+-- duplicate. The products table from 001 already has `handle`; the ADD COLUMN
+-- only matters for databases created before it. The product_name lookup index
+-- for the no-Handle path belongs to the standalone schema.sql table, which is
+-- the only one with a product_name column, and lives there.
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS handle TEXT;
+
+CREATE INDEX IF NOT EXISTS products_handle_idx ON products (handle);
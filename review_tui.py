@@ -3,10 +3,16 @@ import pandas as pd
 from rich.console import Console
 from rich.table import Table
 import os
+import sys
 import subprocess
 import atexit
 import time
 
+# AI_Project_Root hosts the shared `src` package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "AI_Project_Root"))
+from src.ingest.shopify_csv import MissingColumnsError
+from src.ingest.variants import first_option_value, iter_product_records
+
 # --- Server Management ---
 server_process = None
 
@@ -225,29 +231,31 @@ def handle_csv_upload():
         return
 
     try:
-        df = pd.read_csv(file_path)
-        
-        # Create a mapping from lowercase column names to original column names
-        lower_to_original_cols = {col.lower(): col for col in df.columns}
-
-        required_lower_cols = {"handle", "title"}
-        if not required_lower_cols.issubset(lower_to_original_cols.keys()):
-            console.print(
-                f"[red]Error: CSV must contain the columns: {', '.join(required_lower_cols)}[/red]"
-            )
-            return
-
-        # Create a new DataFrame with the correct column names
-        new_df = pd.DataFrame()
-        new_df['handle'] = df[lower_to_original_cols['handle']]
-        new_df['product_name'] = df[lower_to_original_cols['title']]
-        
-        if 'raw_color' in lower_to_original_cols:
-            new_df['raw_color'] = df[lower_to_original_cols['raw_color']]
-        else:
-            new_df['raw_color'] = None
-
-        products_to_upload = new_df.to_dict(orient="records")
+        # Only the handle/title/color-related columns are parsed (case-insensitively),
+        # and variant/image rows are folded into one record per product.
+        records = iter_product_records(
+            file_path,
+            {
+                "handle": ("handle",),
+                "title": ("title",),
+                "raw_color": ("raw_color",),
+                "option1_name": ("option1 name",),
+                "option1_value": ("option1 value",),
+                "option2_name": ("option2 name",),
+                "option2_value": ("option2 value",),
+                "option3_name": ("option3 name",),
+                "option3_value": ("option3 value",),
+            },
+            required=("handle", "title"),
+        )
+        products_to_upload = [
+            {
+                "handle": record["handle"],
+                "product_name": record.get("title"),
+                "raw_color": record.get("raw_color") or first_option_value(record, "color"),
+            }
+            for record in records
+        ]
         upload_payload = {"products": products_to_upload}
 
         console.print(f"Found {len(products_to_upload)} products. Uploading to server...")
@@ -262,6 +270,8 @@ def handle_csv_upload():
             f"[bold green]Success:[/bold green] {response_data.get('message')}"
         )
 
+    except MissingColumnsError as e:
+        console.print(f"[red]Error: {e}[/red]")
     except pd.errors.EmptyDataError:
         console.print(f"[red]Error: The CSV file '{file_path}' is empty.[/red]")
     except Exception as e:
@@ -6,12 +6,17 @@ CREATE EXTENSION IF NOT EXISTS vector;
 CREATE TABLE products (
     id SERIAL PRIMARY KEY,
     shopify_id BIGINT UNIQUE,
+    handle TEXT, -- CSV import key
     product_name TEXT NOT NULL,
     normalized_color TEXT,
     category_id INT,
     embedding vector(1536) -- Assuming embedding dimension is 1536
 );
 
+-- CSV imports update existing products by handle, or by name without one
+CREATE INDEX products_handle_idx ON products (handle);
+CREATE INDEX products_product_name_idx ON products (product_name);
+
 -- Table to store confirmed attribute mappings
 CREATE TABLE standard_vocabulary (
     id SERIAL PRIMARY KEY,
@@ -28,5 +33,7 @@ CREATE TABLE training_feedback (
     raw_value TEXT,
     ml_prediction TEXT,
     human_correction TEXT NOT NULL,
+    -- 'color': a normalized color; 'tags': a product's complete optimizer tag set
+    feedback_type TEXT NOT NULL DEFAULT 'color' CHECK (feedback_type IN ('color', 'tags')),
     created_at TIMESTAMPTZ DEFAULT NOW()
 );